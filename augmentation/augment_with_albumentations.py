@@ -9,8 +9,38 @@ labels from a base dataset to improve training diversity.
 - Reads original images and YOLO-format labels (class + bbox).
 - Applies a pipeline of augmentations (flip, crop, rotation, noise, weather).
 - Saves augmented images and YOLO labels into a new `/augmented` folder.
-- Augmentation targets (per class) are defined in `augment_plan.txt`.
-- Each class is expanded up to 500 images for balanced training.
+- Augmentation targets are defined in `augment_plan.txt`: how many copies
+  to make of each base image (`class_id,base,quota`, see
+  prepare_augmentation_list.py). The quotas are walked round-robin, so no
+  random picking of bases; a base that turns out unusable hands its slots to
+  the next base of the class. Every box of the base image is kept.
+- Older plans without quotas (`class_id,base`) expand each class up to
+  `--target-count` images, split evenly over its bases.
+- Optional worker pool (`--workers N`): the plan is split into per-class,
+  fixed-size chunks, each with its own seeded RNG and `transform` instance.
+  Output is identical for a given `--seed` whatever the number of workers.
+- Every sample goes through a pre-flight check and, if the main pipeline
+  raises or drops the box, one pass of a cheaper box-safe fallback pipeline
+  (see transforms.Augmenter); per-transform failure rates are reported.
+- Base images are decoded once per worker and kept in an LRU cache
+  (`--cache-mb`); cache hit/miss counts are reported at the end.
+- Samples are handed to a background writer (sample_writer.py): JPEG
+  encoding and atomic temp-file + rename writes run on `--writer-threads`
+  threads behind a bounded queue, labels are written in batches, and a
+  killed run never leaves a truncated JPEG behind.
+- Every generated file is recorded per class in `augmented/outputs.json`.
+  `--classes 9,12` regenerates only those classes: their previous outputs
+  are deleted first, all other classes are left untouched (pipeline.py uses
+  this to rerun only classes whose inputs changed).
+- Resumable: every `--checkpoint-every` samples each chunk flushes its
+  writer and appends its progress (samples written, RNG state) to
+  `augmented/progress.jsonl` (progress_log.py). Rerunning the same command
+  after a crash skips finished chunks and continues partial ones exactly
+  where they stopped, producing the same files as an uninterrupted run.
+  `--restart` ignores the log.
+- `--profile trace.json|.csv` (opt-in) times every stage: decode, the full
+  transform and each transform of the `A.Compose`, JPEG encode and writes,
+  plus samples/s and peak RSS (see profiler.py).
 
 ⚙️ Requirements:
 - Python 3.8+
@@ -19,143 +49,377 @@ labels from a base dataset to improve training diversity.
 - A `crop_data` folder with structure:
     ├── images/       (original .jpg images)
     ├── labels/       (YOLO .txt labels)
-    └── augment_plan.txt   (plan: class_id,base_filename)
+    └── augment_plan.txt   (plan: class_id,base_filename,quota)
 
 💡 Output:
 - Augmented images → `crop_data/augmented/images`
 - Augmented labels → `crop_data/augmented/labels`
+- File names are `{base}_aug_{NNN}` where NNN is the sample index within its
+  class, so chunks running on different workers never collide.
 
 Usage:
     python augment_with_albumentations.py
+    python augment_with_albumentations.py --workers 16 --seed 42
+    python augment_with_albumentations.py --classes 9,12
+    python augment_with_albumentations.py --restart     # ignore an interrupted run
+    python augment_with_albumentations.py --profile profile.json
 """
 
+import argparse
+import hashlib
+import json
 import os
 import cv2
 import random
-import albumentations as A
+import time
+from multiprocessing import Pool
 from pathlib import Path
 
+from balance_planner import interleave
+from bbox_utils import clip_voc, format_yolo, voc_to_yolo, yolo_to_voc
+from image_cache import DEFAULT_MAX_BYTES, ImageCache, format_stats
+from profiler import Profiler, format_profile, instrument_compose, peak_rss_mb, write_trace
+from progress_log import CHECKPOINT_EVERY, ProgressLog
+from sample_writer import SampleWriter, format_writer_stats, merge_writer_stats, remove_temp_files
+from transforms import Augmenter, format_failure_stats, merge_failure_stats
+
 # --- CONFIG ---
 ROOT = Path.home() / "Desktop" / "crop_data"
-IMAGES_DIR = ROOT / "images"
-LABELS_DIR = ROOT / "labels"
-AUG_IMAGES_DIR = ROOT / "augmented" / "images"
-AUG_LABELS_DIR = ROOT / "augmented" / "labels"
-PLAN_FILE = ROOT / "augment_plan.txt"
-
-# Ensure output directories exist
-AUG_IMAGES_DIR.mkdir(parents=True, exist_ok=True)
-AUG_LABELS_DIR.mkdir(parents=True, exist_ok=True)
+TARGET_COUNT = 500     # Images per class after augmentation
+CHUNK_SIZE = 50        # Samples per worker job (part of the seed → keep fixed)
+SEED = 42
+WRITER_THREADS = 2     # Encode/write threads per worker process
+OUTPUTS_FILE = "outputs.json"   # {class_id: [output base, ...]} under augmented/
+PROGRESS_FILE = "progress.jsonl"  # Checkpoints of an unfinished run under augmented/
 
 
 # --- UTILITY FUNCTIONS ---
-def yolo_to_bbox(cls_id, x, y, w, h, img_w, img_h):
-    """
-    Convert YOLO-format bbox → Pascal VOC (x_min, y_min, x_max, y_max).
-    """
-    x, y, w, h = float(x)*img_w, float(y)*img_h, float(w)*img_w, float(h)*img_h
-    x_min = x - w/2
-    y_min = y - h/2
-    x_max = x + w/2
-    y_max = y + h/2
-    return [x_min, y_min, x_max, y_max]
-
-
-def bbox_to_yolo(bbox, img_w, img_h):
-    """
-    Convert Pascal VOC bbox → YOLO format (x, y, w, h).
-    Normalized to [0,1].
-    """
-    x_min, y_min, x_max, y_max = bbox
-    x = ((x_min + x_max) / 2) / img_w
-    y = ((y_min + y_max) / 2) / img_h
-    w = (x_max - x_min) / img_w
-    h = (y_max - y_min) / img_h
-    return [x, y, w, h]
-
-
-# --- AUGMENTATION PIPELINE ---
-transform = A.Compose([
-    # Basic transformations
-    A.HorizontalFlip(p=0.5),
-    A.RandomBrightnessContrast(p=0.3),
-    A.Rotate(limit=10, p=0.3),
-    A.RandomCrop(height=256, width=256, p=0.2),
-    A.GaussNoise(p=0.2),
-    A.HueSaturationValue(p=0.3),
-    A.MotionBlur(p=0.15),
-    A.Affine(scale=(0.95, 1.05), translate_percent=0.05, rotate=(-10, 10), p=0.3),
-
-    # Field realism (simulate lighting & weather)
-    A.RandomShadow(p=0.2),
-    A.RandomFog(p=0.15),
-    A.RandomSunFlare(src_radius=30, flare_roi=(0.1, 0.1, 0.9, 0.3), p=0.1),
-
-    # Background degradation
-    A.ISONoise(p=0.2),
-    A.Downscale(p=0.2),
-    A.CLAHE(p=0.2),
-], bbox_params=A.BboxParams(format='pascal_voc', label_fields=['class_labels']))
-
-
-# --- LOAD AUGMENTATION PLAN ---
-augment_targets = {}
-with open(PLAN_FILE, "r") as f:
-    for line in f:
-        if line.startswith("#") or not line.strip():
-            continue
-        class_id, base = line.strip().split(",")
-        class_id = int(class_id)
-        augment_targets.setdefault(class_id, []).append(base)
-
-
-# --- AUGMENTATION LOOP ---
-for class_id, base_list in augment_targets.items():
-    current_count = len(base_list)
-    to_generate = 500 - current_count
-    print(f"\n[CLASS {class_id}] Augmenting {to_generate} images")
-
-    generated = 0
-    attempts = 0
-    while generated < to_generate:
-        # Pick a random base image
-        base = random.choice(base_list)
-        img_path = IMAGES_DIR / f"{base}.jpg"
-        label_path = LABELS_DIR / f"{base}.txt"
-
-        if not img_path.exists() or not label_path.exists():
-            continue
+def load_plan(plan_file):
+    """
+    Read `augment_plan.txt` into {class_id: {base: quota}}. Lines without a
+    quota (older plans) map to None.
+    """
+    augment_targets = {}
+    with open(plan_file, "r") as f:
+        for line in f:
+            if line.startswith("#") or not line.strip():
+                continue
+            class_id, base, *quota = line.strip().split(",")
+            augment_targets.setdefault(int(class_id), {})[base] = int(quota[0]) if quota else None
+    return augment_targets
+
+
+def resolve_quotas(bases, target_count=TARGET_COUNT):
+    """
+    [(base, quota), ...] of one class; plans without quotas split
+    `target_count - len(bases)` evenly over the bases.
+    """
+    if all(quota is not None for quota in bases.values()):
+        return list(bases.items())
+    share, extra = divmod(max(0, target_count - len(bases)), len(bases))
+    return [(base, share + (i < extra)) for i, base in enumerate(bases)]
+
+
+def build_jobs(augment_targets, root, seed, chunk_size=CHUNK_SIZE, target_count=TARGET_COUNT):
+    """
+    Split every class into fixed-size chunks of output indices [start, end).
+    Each chunk carries the bases of its samples and a seed derived from
+    (seed, class_id, start), so results do not depend on which worker picks
+    the chunk up.
+    """
+    jobs = []
+    for class_id, bases in augment_targets.items():
+        slots = interleave(resolve_quotas(bases, target_count))
+        for start in range(0, len(slots), chunk_size):
+            end = min(start + chunk_size, len(slots))
+            job_seed = random.Random(f"{seed}:{class_id}:{start}").getrandbits(32)
+            jobs.append((class_id, list(bases), slots[start:end], start, end, job_seed, str(root)))
+    return jobs
 
-        image = cv2.imread(str(img_path))
-        if image is None:
+
+def load_outputs(aug_dir):
+    """
+    {class_id: [output base, ...]} from previous runs (empty if none).
+    """
+    path = aug_dir / OUTPUTS_FILE
+    if not path.exists():
+        return {}
+    with open(path, "r") as f:
+        return {int(class_id): bases for class_id, bases in json.load(f).items()}
+
+
+def save_outputs(aug_dir, outputs):
+    """
+    Write the outputs manifest atomically (temp file + rename).
+    """
+    tmp = aug_dir / (OUTPUTS_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump({str(class_id): sorted(bases) for class_id, bases in sorted(outputs.items())}, f)
+    os.replace(tmp, aug_dir / OUTPUTS_FILE)
+
+
+def remove_outputs(aug_dir, bases):
+    """
+    Delete previously generated images/labels of one class.
+    """
+    for base in bases:
+        for path in (aug_dir / "images" / f"{base}.jpg", aug_dir / "labels" / f"{base}.txt"):
+            if path.exists():
+                path.unlink()
+
+
+# --- WORKER ---
+_augmenter = None
+_cache = None
+_cache_bytes = DEFAULT_MAX_BYTES
+_writer = None
+_writer_threads = WRITER_THREADS
+_profiler = Profiler(enabled=False)
+
+
+def init_worker(cache_bytes=DEFAULT_MAX_BYTES, writer_threads=WRITER_THREADS, profile=False):
+    """
+    Give each worker process its own pipeline instance and keep OpenCV from
+    spawning a thread pool per process.
+    """
+    global _augmenter, _cache_bytes, _writer_threads, _profiler
+    cv2.setNumThreads(1)
+    _profiler = Profiler(enabled=profile)
+    _augmenter = Augmenter()
+    instrument_compose(_augmenter.transform, _profiler, "transform.")
+    instrument_compose(_augmenter.fallback, _profiler, "fallback.")
+    _cache_bytes = cache_bytes
+    _writer_threads = writer_threads
+
+
+def augment_chunk(job, resume=None, progress_path=None, checkpoint_every=CHECKPOINT_EVERY):
+    """
+    Generate samples `start..end-1` of one class, continuing from `resume`
+    (its last checkpoint) if given, and checkpointing to `progress_path`.
+    Returns (class_id, generated, skipped, cache stats, augmenter stats,
+    written output bases, writer stats, profile) for this chunk.
+    """
+    global _augmenter, _cache, _writer
+    if _augmenter is None:
+        _augmenter = Augmenter()
+
+    class_id, base_list, slots, start, end, job_seed, root = job
+    unit = f"{class_id}:{start}"
+    if resume is not None and resume.get("done"):
+        return (class_id, resume["generated"] - start, resume["gave_up"], {}, {}, resume["written"], {}, {})
+    root = Path(root)
+    if _cache is None or _cache.images_dir != root / "images":
+        _cache = ImageCache(root / "images", root / "labels", _cache_bytes)
+    stats_before = _cache.stats()
+    aug_images_dir = root / "augmented" / "images"
+    aug_labels_dir = root / "augmented" / "labels"
+    if _writer is None or _writer.images_dir != aug_images_dir:
+        _writer = SampleWriter(aug_images_dir, aug_labels_dir, threads=_writer_threads, profiler=_profiler)
+
+    _augmenter.seed(job_seed)
+    log = ProgressLog(progress_path) if progress_path else None
+
+    position = {base: i for i, base in enumerate(base_list)}
+    removed = []
+    written = []
+    generated = start
+    if resume is not None:
+        # Continue exactly where the last checkpoint left off
+        removed = list(resume["removed"])
+        written = list(resume["written"])
+        generated = resume["generated"]
+        _augmenter.set_state(resume["rng"])
+    unusable = set(removed)
+    checkpointed = len(written)
+
+    while generated < end:
+        # Planned base of this slot, or the next usable base of the class
+        first = position[slots[generated - start]]
+        base = next((b for b in (base_list[(first + k) % len(base_list)] for k in range(len(base_list)))
+                     if b not in unusable), None)
+        if base is None:
+            break
+
+        # Decoded once, then served from the cache
+        with _profiler.stage("imread"):
+            image, labels = _cache.get(base)
+        if image is None or not len(labels[0]):
+            unusable.add(base)
+            removed.append(base)
             continue
         h, w = image.shape[:2]
 
-        # Load YOLO bbox
-        with open(label_path, "r") as f:
-            cls_id, x, y, bw, bh = f.readline().strip().split()
-        bbox = yolo_to_bbox(cls_id, x, y, bw, bh, w, h)
+        # Every box of the label file (a copy counts for all of its classes)
+        class_ids, boxes = labels
+        bboxes = clip_voc(yolo_to_voc(boxes, w, h), w, h)
+
+        # Apply augmentations (falls back to a box-safe pipeline on failure)
+        with _profiler.stage("transform"):
+            aug = _augmenter(image, bboxes, class_ids)
+        if aug is None:
+            # This base can never produce a valid sample; hand its slots on
+            unusable.add(base)
+            removed.append(base)
+            continue
+        aug_img = aug["image"]
+        aug_bbox = voc_to_yolo(aug["bboxes"], aug_img.shape[1], aug_img.shape[0])
+
+        # Hand image + label to the background writer (blocks if it falls behind)
+        out_base = f"{base}_aug_{generated:03d}"
+        with _profiler.stage("submit"):
+            _writer.submit(out_base, aug_img, format_yolo(class_ids, aug_bbox))
+
+        written.append(out_base)
+        generated += 1
+
+        # Checkpoint: flushed samples + the RNG state that produces the next one
+        if log is not None and (generated - start) % checkpoint_every == 0 and generated < end:
+            _writer.flush()
+            log.checkpoint(unit, generated, removed, written[checkpointed:], _augmenter.get_state())
+            checkpointed = len(written)
+
+    # Everything reported as written must be on disk
+    _writer.flush()
+    if log is not None:
+        log.done(unit, generated, written[checkpointed:], gave_up=generated < end)
+    cache_stats = {k: v - stats_before[k] for k, v in _cache.stats().items()}
+    profile = {"stages": _profiler.pop_stats(), "peak_rss_mb": peak_rss_mb()} if _profiler.enabled else {}
+    return (class_id, generated - start, generated < end, cache_stats, _augmenter.pop_stats(),
+            written, _writer.pop_stats(), profile)
+
+
+def run_chunk(args):
+    """Pool entry point: (job, resume state, progress log path, checkpoint interval)."""
+    return augment_chunk(*args)
+
+
+def run_config(augment_targets, selected, args):
+    """
+    Settings that must match for an interrupted run to be resumed.
+    """
+    plan = json.dumps(sorted((c, list(bases.items())) for c, bases in augment_targets.items()))
+    return {"seed": args.seed, "target_count": args.target_count, "chunk_size": args.chunk_size,
+            "classes": sorted(selected), "plan": hashlib.blake2b(plan.encode(), digest_size=16).hexdigest()}
+
+
+# --- MAIN ---
+def main():
+    parser = argparse.ArgumentParser(description="Augment underrepresented classes from augment_plan.txt")
+    parser.add_argument("--root", type=Path, default=ROOT, help="crop_data folder")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes (default: 1, in-process)")
+    parser.add_argument("--seed", type=int, default=SEED, help="Base seed for all per-chunk RNGs")
+    parser.add_argument("--target-count", type=int, default=TARGET_COUNT, help="Images per class after augmentation")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Samples per worker job")
+    parser.add_argument("--cache-mb", type=int, default=DEFAULT_MAX_BYTES >> 20,
+                        help="Decoded-image cache budget per worker (MiB)")
+    parser.add_argument("--writer-threads", type=int, default=WRITER_THREADS,
+                        help="JPEG encode/write threads per worker")
+    parser.add_argument("--classes", type=lambda s: {int(c) for c in s.split(",") if c},
+                        help="Comma-separated class IDs to regenerate (default: every class)")
+    parser.add_argument("--checkpoint-every", type=int, default=CHECKPOINT_EVERY,
+                        help="Samples between progress checkpoints")
+    parser.add_argument("--restart", action="store_true",
+                        help="Ignore the progress log of an interrupted run and start over")
+    parser.add_argument("--profile", type=Path, default=None,
+                        help="Write a per-stage timing trace (.json or .csv) and print a summary")
+    args = parser.parse_args()
+    cache_bytes = args.cache_mb << 20
+
+    # Ensure output directories exist
+    aug_dir = args.root / "augmented"
+    (aug_dir / "images").mkdir(parents=True, exist_ok=True)
+    (aug_dir / "labels").mkdir(parents=True, exist_ok=True)
+    leftovers = remove_temp_files(aug_dir / "images", aug_dir / "labels")
+    if leftovers:
+        print(f"🧹 Removed {leftovers} partial files left by an interrupted run")
+
+    # --- LOAD AUGMENTATION PLAN ---
+    augment_targets = load_plan(args.root / "augment_plan.txt")
+
+    # --- DROP PREVIOUS OUTPUTS OF THE CLASSES BEING (RE)GENERATED ---
+    outputs = load_outputs(aug_dir)
+    selected = args.classes if args.classes is not None else set(augment_targets) | set(outputs)
+    augment_targets = {c: bases for c, bases in augment_targets.items() if c in selected}
+
+    # --- RESUME AN INTERRUPTED RUN WITH THE SAME SETTINGS ---
+    progress = ProgressLog(aug_dir / PROGRESS_FILE)
+    resumed = progress.start(run_config(augment_targets, selected, args), resume=not args.restart)
+    if not resumed:
+        # Files of an abandoned run are in no manifest; drop them with the old outputs
+        remove_outputs(aug_dir, progress.stale)
+    for class_id in selected & set(outputs):
+        remove_outputs(aug_dir, outputs.pop(class_id))
+    save_outputs(aug_dir, outputs)   # never list files that are about to be regenerated
+    for class_id, bases in augment_targets.items():
+        planned = sum(quota for _, quota in resolve_quotas(bases, args.target_count))
+        print(f"[CLASS {class_id}] Augmenting {planned} images from {len(bases)} base images")
+
+    jobs = build_jobs(augment_targets, args.root, args.seed, args.chunk_size, args.target_count)
+    jobs = [(job, progress.resume_state(f"{job[0]}:{job[3]}"), str(progress.path), args.checkpoint_every)
+            for job in jobs]
+    if resumed:
+        done = sum(1 for _, state, _, _ in jobs if state and state.get("done"))
+        partial = sum(1 for _, state, _, _ in jobs if state and not state.get("done"))
+        print(f"⏯️ Resuming interrupted run: {done} chunks done, {partial} partially done")
+    workers = max(1, min(args.workers, len(jobs)))
+    print(f"\n🧩 {len(jobs)} jobs on {workers} worker(s)")
+
+    # --- AUGMENTATION LOOP ---
+    totals = {class_id: 0 for class_id in augment_targets}
+    skipped = set()
+    cache_stats = {"hits": 0, "misses": 0, "evictions": 0, "decode_seconds": 0.0}
+    aug_stats = {}
+    writer_stats = {}
+    profiler = Profiler(enabled=args.profile is not None)
+    worker_rss = 0.0
+    started = time.perf_counter()
+    if workers == 1:
+        init_worker(cache_bytes, args.writer_threads, profiler.enabled)
+        results = map(run_chunk, jobs)
+    else:
+        pool = Pool(workers, initializer=init_worker, initargs=(cache_bytes, args.writer_threads, profiler.enabled))
+        results = pool.imap_unordered(run_chunk, jobs)
+
+    for class_id, generated, gave_up, stats, chunk_aug_stats, written, chunk_writer_stats, profile in results:
+        merge_writer_stats(writer_stats, chunk_writer_stats)
+        if profile:
+            profiler.merge(profile["stages"])
+            worker_rss = max(worker_rss, profile["peak_rss_mb"])
+        totals[class_id] += generated
+        outputs.setdefault(class_id, []).extend(written)
+        for key, value in stats.items():
+            cache_stats[key] += value
+        merge_failure_stats(aug_stats, chunk_aug_stats)
+        if gave_up and class_id not in skipped:
+            skipped.add(class_id)
+            print(f"⚠️ Skipping rest of class {class_id}: no usable base images left "
+                  f"(missing, unreadable or with degenerate boxes).")
 
-        try:
-            # Apply augmentations
-            aug = transform(image=image, bboxes=[bbox], class_labels=[cls_id])
-            aug_img = aug["image"]
-            aug_bbox = bbox_to_yolo(aug["bboxes"][0], aug_img.shape[1], aug_img.shape[0])
+    if workers > 1:
+        pool.close()
+        pool.join()
+    elapsed = time.perf_counter() - started
 
-            # Save augmented image + label
-            out_base = f"{base}_aug_{generated:03d}"
-            cv2.imwrite(str(AUG_IMAGES_DIR / f"{out_base}.jpg"), aug_img)
+    save_outputs(aug_dir, outputs)
+    progress.finish()
 
-            with open(AUG_LABELS_DIR / f"{out_base}.txt", "w") as f:
-                f.write(f"{cls_id} {' '.join(f'{x:.6f}' for x in aug_bbox)}\n")
+    for class_id, generated in totals.items():
+        print(f"[CLASS {class_id}] Generated {generated}")
+    print(format_stats(cache_stats))
+    print(format_failure_stats(aug_stats))
+    print(format_writer_stats(writer_stats))
+    if profiler.enabled:
+        samples = sum(totals.values())
+        peak_rss = max(peak_rss_mb(), worker_rss, peak_rss_mb(children=True))
+        run = {"script": "augment_with_albumentations", "workers": workers, "samples": samples,
+               "wall_seconds": round(elapsed, 3),
+               "samples_per_second": round(samples / elapsed, 2) if elapsed else None,
+               "peak_rss_mb": round(peak_rss, 1)}
+        print(format_profile(profiler.stats(), samples, elapsed, peak_rss))
+        print(f"📝 Profile trace → {write_trace(args.profile, profiler.stats(), run)}")
 
-            generated += 1
-            attempts = 0
+    print("\n✅ DONE: Augmented images and labels saved to /augmented")
 
-        except Exception as e:
-            attempts += 1
-            if attempts > 100:
-                print(f"⚠️ Skipping class {class_id}: too many failed attempts.")
-                break
 
-print("\n✅ DONE: Augmented images and labels saved to /augmented")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+balance_planner.py
+---------------------------------
+Vectorized class-balance planner behind prepare_augmentation_list.py.
+
+Given every (label file, class) pair of the dataset, it decides how many
+augmented copies to make of each base image so that every class reaches
+`target` images:
+
+1. Per-class image counts come from one `np.bincount` over the unique
+   (file, class) pairs; the deficit is `target - count`.
+2. Classes are served rarest first. A class's deficit is spread as evenly as
+   possible over the images that contain it (water-filling), so every base
+   image is used about the same number of times.
+3. Multi-class images are allowed, weighted by the headroom of their other
+   classes: a copy also adds one image to each of them, so an image is used
+   at most as often as its other classes can absorb without passing the
+   target. Single-class images have no such cap. Counts of every class are
+   updated after each allocation (one bincount), so boosting one class does
+   not overshoot another. Only when the capped images cannot cover a deficit
+   is the rest spread over all candidates (reported as overshoot).
+
+The result is a per-base-image quota; the augmenter walks the quotas instead
+of picking random bases. Everything is NumPy over flat arrays — 1M labels and
+100+ classes plan in well under a second once loaded.
+
+Usage:
+    from balance_planner import plan_quotas
+    plan = plan_quotas(file_ids, class_ids, num_files, num_classes, target=500, eligible=mask)
+    plan.quota[i], plan.driver[i]   # copies of file i, and the class it was planned for
+"""
+
+import numpy as np
+
+UNCAPPED = np.iinfo(np.int64).max // 4
+
+
+class BalancePlan:
+    """
+    Output of `plan_quotas`; arrays are indexed by file or class ID.
+    """
+
+    def __init__(self, quota, driver, before, after, target):
+        self.quota = quota      # (num_files,) augmented copies per file
+        self.driver = driver    # (num_files,) class a file was first planned for, -1 if unused
+        self.before = before    # (num_classes,) images per class before augmentation
+        self.after = after      # (num_classes,) images per class after the plan
+        self.target = target
+
+    @property
+    def overshoot(self):
+        """Images per class planned beyond the target by a multi-class copy."""
+        return np.maximum(self.after - np.maximum(self.before, self.target), 0)
+
+
+def unique_pairs(file_ids, class_ids, num_classes):
+    """
+    Deduplicated (file, class) pairs, sorted by file then class.
+    """
+    keys = np.sort(np.asarray(file_ids, dtype=np.int64) * num_classes + np.asarray(class_ids, dtype=np.int64))
+    if len(keys):
+        keys = keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+    return np.divmod(keys, num_classes)
+
+
+def water_fill(total, caps):
+    """
+    Split `total` over len(caps) integer shares as evenly as possible without
+    exceeding any cap. Returns (shares, amount that did not fit).
+    """
+    shares = np.zeros(len(caps), dtype=np.int64)
+    remaining = int(total)
+    while remaining > 0:
+        active = np.flatnonzero(shares < caps)
+        if not len(active):
+            break
+        share = remaining // len(active)
+        if share == 0:
+            # Fewer units than open slots: one each to the first `remaining`
+            shares[active[:remaining]] += 1
+            remaining = 0
+            break
+        add = np.minimum(share, caps[active] - shares[active])
+        shares[active] += add
+        remaining -= int(add.sum())
+    return shares, remaining
+
+
+def plan_quotas(file_ids, class_ids, num_files, num_classes, target, eligible=None):
+    """
+    Per-file augmentation quotas that lift every class to `target` images.
+
+    `file_ids`/`class_ids` hold one entry per box (duplicates are fine);
+    `eligible` is a boolean mask over files that may be used as a base.
+    """
+    files, classes = unique_pairs(file_ids, class_ids, num_classes)
+    before = np.bincount(classes, minlength=num_classes)
+    current = before.astype(np.int64).copy()
+    eligible = np.ones(num_files, dtype=bool) if eligible is None else np.asarray(eligible, dtype=bool)
+
+    # Files of each class and classes of each file (CSR over the sorted pairs)
+    by_class = np.argsort(classes, kind="stable")
+    class_files = files[by_class]
+    class_start = np.searchsorted(classes[by_class], np.arange(num_classes + 1))
+    file_start = np.searchsorted(files, np.arange(num_files + 1))
+
+    quota = np.zeros(num_files, dtype=np.int64)
+    driver = np.full(num_files, -1, dtype=np.int64)
+    for c in np.argsort(before, kind="stable"):   # rarest class first
+        need = target - current[c]
+        if need <= 0:
+            continue
+        candidates = class_files[class_start[c]:class_start[c + 1]]
+        candidates = candidates[eligible[candidates]]
+        if not len(candidates):
+            continue
+
+        # Pairs of the candidate files only (gathered from the file CSR)
+        lengths = file_start[candidates + 1] - file_start[candidates]
+        owner = np.repeat(np.arange(len(candidates)), lengths)
+        pairs = file_start[candidates][owner] + np.arange(len(owner)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        pair_classes = classes[pairs]
+
+        # Cap = headroom of the most constrained other class in the image
+        others = pair_classes != c
+        caps = np.full(len(candidates), UNCAPPED, dtype=np.int64)
+        np.minimum.at(caps, owner[others], np.maximum(target - current[pair_classes[others]], 0))
+        shares, left = water_fill(need, caps)
+        if left:
+            # Not enough capacity: overshooting is unavoidable, spread it evenly
+            extra, _ = water_fill(left, np.full(len(candidates), UNCAPPED, dtype=np.int64))
+            shares += extra
+
+        used = candidates[shares > 0]
+        driver[used[driver[used] < 0]] = c
+        quota[candidates] += shares
+        current += np.bincount(pair_classes, weights=shares[owner], minlength=num_classes).astype(np.int64)
+
+    return BalancePlan(quota=quota, driver=driver, before=before, after=current, target=target)
+
+
+def interleave(quotas):
+    """
+    Output order for one class: [(base, quota), ...] → bases round-robin
+    (a, b, c, a, b, a, ...), so every chunk of samples mixes many bases.
+    """
+    bases = [base for base, _ in quotas]
+    counts = np.array([q for _, q in quotas], dtype=np.int64)
+    if not counts.sum():
+        return []
+    owner = np.repeat(np.arange(len(bases)), counts)
+    rank = np.arange(len(owner)) - np.repeat(np.cumsum(counts) - counts, counts)
+    order = np.lexsort((owner, rank))
+    return [bases[i] for i in owner[order]]
@@ -0,0 +1,294 @@
+"""
+benchmark_pipeline.py
+---------------------------------
+Reproducible end-to-end benchmark of the augmentation pipeline.
+
+For every scale (`--scales 1000,10000,100000` images) a synthetic crop_data
+tree is generated once (synthetic_crop_data.py; reused while its settings do
+not change), then the pipeline stages run on it cold, in DAG order, exactly
+as pipeline.py would call them:
+
+    count → dedup → prepare → augment → merge → split
+
+With `--stages` only the listed stages are timed; the stages they depend on
+still run first, untimed.
+
+Each stage is a separate process; per stage the benchmark records wall time,
+CPU time (user + system, including worker processes), peak RSS and
+throughput (images or samples per second). Outputs of the previous run
+(label index, plan, augmented/, final_dataset/, splits/, ...) are removed
+before every repetition, so each run starts from the same state.
+
+Results are saved as JSON in `metrics/benchmarks/<date>_<time>_<commit>.json` with
+the commit, machine and library versions. `--compare old.json` prints the
+change per stage and flags regressions, so a slowdown between two commits
+is visible in numbers rather than in a longer Colab session.
+
+Everything runs offline on CPU only; nothing is downloaded.
+
+⚙️ Requirements:
+- Python 3.9+, plus whatever the stage scripts need (OpenCV, NumPy, Albumentations)
+
+💡 The augment workload grows with the target count: by default every class is
+balanced to `--target-ratio` × (images / classes) images. Pass `--target-count`
+to fix it instead.
+
+Usage:
+    python benchmark_pipeline.py --scales 1000,10000
+    python benchmark_pipeline.py --scales 100000 --size 320x240 --workers 8
+    python benchmark_pipeline.py --stages count,prepare --repeat 3
+    python benchmark_pipeline.py --compare ../metrics/benchmarks/2026-10-01_120000_ab12cd34ef.json
+    python benchmark_pipeline.py --profile      # also keep the per-stage traces of augment and split
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from importlib import metadata
+from pathlib import Path
+from types import SimpleNamespace
+
+from pipeline import STAGES
+from synthetic_crop_data import IMAGE_SIZE, NUM_CLASSES, clean_outputs, generate, parse_size
+
+# --- CONFIG ---
+SCRIPT_DIR = Path(__file__).resolve().parent
+BENCH_ROOT = Path(tempfile.gettempdir()) / "crop_bench"
+RESULTS_DIR = SCRIPT_DIR.parent / "metrics" / "benchmarks"
+SCALES = [1000, 10000, 100000]
+STAGE_NAMES = ["count", "dedup", "prepare", "augment", "merge", "split"]
+PROFILED_STAGES = ("augment", "split")   # Stages that accept --profile
+TARGET_RATIO = 1.0
+REGRESSION_THRESHOLD = 0.10   # Flag stages more than 10% slower ...
+NOISE_FLOOR_SECONDS = 0.05    # ... and slower by more than this
+LIBRARIES = ("numpy", "opencv-python", "opencv-python-headless", "albumentations")
+
+
+# --- ENVIRONMENT ---
+def git_info():
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=SCRIPT_DIR, capture_output=True, text=True, check=True).stdout
+
+    try:
+        return {"commit": git("rev-parse", "HEAD").strip(),
+                "dirty": bool(git("status", "--porcelain", "--untracked-files=no").strip())}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def machine_info():
+    versions = {}
+    for name in LIBRARIES:
+        try:
+            versions[name] = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            pass
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "libraries": versions,
+    }
+
+
+# --- RUNNING ---
+def count_files(folder, suffix):
+    if not folder.exists():
+        return 0
+    with os.scandir(folder) as entries:
+        return sum(1 for entry in entries if entry.name.endswith(suffix))
+
+
+def stage_items(name, root, images):
+    """Units of work a stage processed, for the throughput column."""
+    if name == "augment":
+        return count_files(root / "augmented" / "images", ".jpg")
+    if name in ("merge", "split"):
+        return count_files(root / "final_dataset" / "images", ".jpg")
+    return images
+
+
+def run_stage(stage, cfg, extra_args, log_path):
+    """
+    Run one stage script as pipeline.py does; returns (wall, cpu, peak RSS MiB).
+    Resource usage comes from wait4 on the child, so it includes its workers.
+    """
+    cmd = [sys.executable, str(SCRIPT_DIR / stage.script), *stage.args(cfg), *extra_args]
+    with open(log_path, "w") as log:
+        log.write(" ".join(cmd) + "\n")
+        log.flush()
+        start = time.perf_counter()
+        proc = subprocess.Popen(cmd, cwd=SCRIPT_DIR, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(proc.pid, 0)
+        wall = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    peak_rss = usage.ru_maxrss / (1 << 20 if sys.platform == "darwin" else 1 << 10)
+    return wall, usage.ru_utime + usage.ru_stime, peak_rss
+
+
+def benchmark_scale(images, args):
+    """
+    Generate (or reuse) the tree for one scale and time the stages on it.
+    Returns (result rows, {stage: profile trace}).
+    """
+    root = BENCH_ROOT / str(images) if args.work_dir is None else args.work_dir / str(images)
+    generate(root, images, args.classes, args.size, args.seed, workers=args.workers)
+    target = args.target_count or max(1, round(args.target_ratio * images / args.classes))
+    cfg = SimpleNamespace(root=root, seed=args.seed, workers=args.workers, target_count=target,
+                          link_mode="hardlink", file_lists=False)
+    logs = root.parent / "logs" / str(images)
+    logs.mkdir(parents=True, exist_ok=True)
+    stages = {stage.name: stage for stage in STAGES}
+
+    # Stages before the last timed one run untimed when left out, since later stages need their outputs
+    needed = STAGE_NAMES[:max(STAGE_NAMES.index(name) for name in args.stages) + 1]
+    runs = {name: [] for name in args.stages}
+    profiles = {}
+    for repeat in range(args.repeat):
+        clean_outputs(root)
+        for name in needed:
+            if name not in runs:
+                run_stage(stages[name], cfg, [], logs / f"{name}.log")
+                continue
+            extra = []
+            trace = logs / f"{name}_profile.json"
+            if args.profile and name in PROFILED_STAGES:
+                extra = ["--profile", str(trace)]
+            wall, cpu, peak_rss = run_stage(stages[name], cfg, extra, logs / f"{name}.log")
+            items = stage_items(name, root, images)
+            runs[name].append((wall, cpu, peak_rss, items))
+            print(f"   {images:>7} images  {name:<8} {wall:>8.2f}s wall {cpu:>8.2f}s cpu "
+                  f"{peak_rss:>7.0f} MiB  {items / wall if wall else 0:>9.1f} items/s")
+            if extra and trace.exists():
+                profiles[name] = json.loads(trace.read_text())
+
+    rows = []
+    for name, samples in runs.items():
+        # The fastest repetition is the least disturbed by other load on the machine
+        wall, cpu, peak_rss, items = min(samples)
+        rows.append({
+            "images": images,
+            "stage": name,
+            "target_count": target,
+            "items": items,
+            "wall_seconds": round(wall, 4),
+            "cpu_seconds": round(cpu, 4),
+            "peak_rss_mb": round(peak_rss, 1),
+            "items_per_second": round(items / wall, 2) if wall else None,
+            "all_wall_seconds": [round(s[0], 4) for s in samples],
+        })
+    return rows, profiles
+
+
+# --- COMPARISON ---
+def compare(previous, results, threshold=REGRESSION_THRESHOLD):
+    """
+    Print old → new wall time per (images, stage); returns the regressed rows.
+    """
+    old = {(row["images"], row["stage"]): row for row in previous["results"]}
+    print(f"\n📊 Compared with {(previous.get('commit') or 'unknown')[:10]} ({previous.get('created', '?')}):")
+    regressions = []
+    for row in results:
+        before = old.get((row["images"], row["stage"]))
+        if before is None:
+            continue
+        delta = row["wall_seconds"] - before["wall_seconds"]
+        ratio = delta / before["wall_seconds"] if before["wall_seconds"] else 0.0
+        # A different workload (e.g. another target count) is not a regression
+        same_work = row["items"] == before["items"]
+        regressed = same_work and ratio > threshold and delta > NOISE_FLOOR_SECONDS
+        if regressed:
+            regressions.append(row)
+        note = "  ⚠️ regression" if regressed else ("" if same_work else
+                                                   f"  (workload differs: {before['items']} → {row['items']} items)")
+        print(f"   {row['images']:>7} images  {row['stage']:<8} {before['wall_seconds']:>8.2f}s → "
+              f"{row['wall_seconds']:>8.2f}s  {ratio:>+7.1%}{note}")
+    return regressions
+
+
+# --- MAIN ---
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the augmentation pipeline on synthetic data")
+    parser.add_argument("--scales", type=lambda s: [int(x) for x in s.split(",") if x], default=SCALES,
+                        help="Comma-separated dataset sizes in images")
+    parser.add_argument("--stages", type=lambda s: [x for x in s.split(",") if x], default=STAGE_NAMES,
+                        help="Comma-separated stages to time (in pipeline order)")
+    parser.add_argument("--size", type=parse_size, default=IMAGE_SIZE, help="Image size WIDTHxHEIGHT")
+    parser.add_argument("--classes", type=int, default=NUM_CLASSES, help="Number of classes")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for the data, augmentation and split")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes for generation and augmentation")
+    parser.add_argument("--target-count", type=int, default=None, help="Fixed images per class after augmentation")
+    parser.add_argument("--target-ratio", type=float, default=TARGET_RATIO,
+                        help="Target per class as a share of images/classes (when --target-count is not set)")
+    parser.add_argument("--repeat", type=int, default=1, help="Repetitions per scale (fastest is kept)")
+    parser.add_argument("--work-dir", type=Path, default=None, help=f"Where the synthetic trees live ({BENCH_ROOT})")
+    parser.add_argument("--output", type=Path, default=None, help="Result JSON (default: metrics/benchmarks/)")
+    parser.add_argument("--compare", type=Path, default=None, help="Earlier result JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="Slowdown ratio reported as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on a regression")
+    parser.add_argument("--profile", action="store_true", help="Store the --profile traces of augment and split")
+    args = parser.parse_args()
+
+    unknown = set(args.stages) - set(STAGE_NAMES)
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(sorted(unknown))}")
+    # Later stages read what earlier ones wrote: keep pipeline order
+    args.stages = [name for name in STAGE_NAMES if name in args.stages]
+
+    git = git_info()
+    created = datetime.now(timezone.utc)
+    print(f"⏱️ Benchmarking {', '.join(args.stages)} at {', '.join(map(str, args.scales))} images "
+          f"({args.size[0]}x{args.size[1]}, {args.workers} workers)")
+
+    results, profiles = [], {}
+    start = time.perf_counter()
+    try:
+        for images in args.scales:
+            rows, traces = benchmark_scale(images, args)
+            results.extend(rows)
+            profiles.update({f"{images}/{name}": trace for name, trace in traces.items()})
+    except subprocess.CalledProcessError as e:
+        print(f"\n❌ {Path(e.cmd[1]).name} failed (exit {e.returncode}); see the stage logs under "
+              f"{(args.work_dir or BENCH_ROOT) / 'logs'}")
+        sys.exit(e.returncode)
+
+    report = {
+        **git,
+        "created": created.isoformat(timespec="seconds"),
+        "machine": machine_info(),
+        "settings": {"scales": args.scales, "stages": args.stages, "size": list(args.size),
+                     "classes": args.classes, "seed": args.seed, "workers": args.workers,
+                     "target_count": args.target_count, "target_ratio": args.target_ratio,
+                     "repeat": args.repeat},
+        "total_seconds": round(time.perf_counter() - start, 2),
+        "results": results,
+    }
+    if profiles:
+        report["profiles"] = profiles
+
+    output = args.output or RESULTS_DIR / f"{created:%Y-%m-%d_%H%M%S}_{(git['commit'] or 'nogit')[:10]}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"\n✅ Results saved to {output}")
+
+    if args.compare:
+        regressions = compare(json.loads(args.compare.read_text()), results, args.threshold)
+        if regressions and args.fail_on_regression:
+            print(f"\n❌ {len(regressions)} stage(s) regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,49 +1,328 @@
 """
-Class Distribution Counter for YOLO Labels
-------------------------------------------
+Class Statistics for YOLO Labels
+--------------------------------
 
-This script counts the number of labeled instances per class in a YOLO-format dataset.  
-It goes through all label files in `crop_data/labels/`, extracts the class IDs, and tallies 
-the occurrences. Then, it maps each class ID to its corresponding class name from 
-`crop_data/classes.txt` and prints the results in a readable format.
+This script reads the shared label index (`label_index.py`, which only
+re-parses label files that changed since the last run) of a YOLO-format
+dataset and computes, per class:
+
+- instances:     number of boxes
+- images:        number of label files containing the class
+- co-occurrence: number of images containing both classes (class × class)
+- box size:      histogram of the box side relative to the letterboxed frame,
+                 sqrt(w·h) / longer image side (× imgsz = pixels at training)
+- aspect ratio:  histogram of log2(width / height) in pixels
+- small boxes:   share of boxes under `SMALL_PX` pixels at each candidate imgsz
+
+Image sizes come from the JPEG headers (`check_jpeg`, no decoding). From the
+small-box shares it suggests the smallest training `imgsz` at which no class
+keeps more than `SMALL_SHARE` of its boxes below `SMALL_PX` (training.py reads
+it), and the share of elongated boxes (aspect beyond `ELONGATED`:1).
+
+📌 Details:
+- Instances, images per class and co-occurrence are SQL over the index.
+  Only the image sizes are not in it: the boxes are streamed from the index
+  in chunks of `CHUNK_FILES` files, each worker reads the JPEG headers of its
+  chunk and fills fixed-size count arrays (classes × bins) that are summed,
+  and at most `--workers × 2` chunks are in flight. Nothing grows with the
+  dataset.
+- Lines that are not `<class_id> <x> <y> <w> <h>` are skipped (by the
+  index); class IDs outside classes.txt are counted as `out_of_range`. Label
+  files without a readable image are counted but left out of the geometry.
+
+⚙️ Requirements:
+- Python 3.8+
+- NumPy
 
 Usage:
-    - Place this script at the project root (where `crop_data/` folder is located).
-    - Ensure `crop_data/labels/` contains YOLO-format `.txt` label files.
-    - Ensure `crop_data/classes.txt` lists all class names, 0-indexed (one per line).
-    - Run the script: `python class_counts.py`
+    python count_classes.py --root ~/Desktop/crop_data
+    python count_classes.py --root ~/Desktop/crop_data/final_dataset --workers 8
+    python count_classes.py --no-image-sizes      # labels only (boxes taken as square-frame)
 
 Output:
-    A list of classes and how many images/annotations exist for each, e.g.:
+    crop_data/class_stats.json, and a summary such as
 
-    0: Maize_Leaf_Blight → 432 images
-    1: Tomato_Late_Blight → 275 images
+    0: Maize_Leaf_Blight → 432 boxes in 301 images (median box ≈ 58px @640, 2% small)
+    1: Tomato_Late_Blight → 275 boxes in 198 images (median box ≈ 41px @640, 6% small)
     ...
+    📐 Suggested imgsz: 640
 """
 
+import argparse
+import json
 import os
-from collections import defaultdict
-
-# Path to YOLO labels folder
-label_dir = 'crop_data/labels'
-
-# Dictionary to store counts of each class
-class_counts = defaultdict(int)
-
-# Iterate over all label files
-for label_file in os.listdir(label_dir):
-    if label_file.endswith('.txt'):  # Only process label files
-        with open(os.path.join(label_dir, label_file)) as f:
-            lines = f.readlines()
-            for line in lines:
-                # Extract class ID (first value in each YOLO annotation line)
-                class_id = int(line.split()[0])
-                class_counts[class_id] += 1
-
-# Load class names (one per line, indexed 0..N-1)
-with open('crop_data/classes.txt') as f:
-    class_names = [line.strip() for line in f.readlines()]
-
-# Print results sorted by class ID
-for class_id, count in sorted(class_counts.items()):
-    print(f"{class_id}: {class_names[class_id]} → {count} images")
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from label_index import open_index
+from verify_dataset_integrity import bounded_map, check_jpeg
+
+# --- CONFIG ---
+ROOT = Path("crop_data")
+STATS_NAME = "class_stats.json"
+CHUNK_FILES = 512                               # Label files per worker job
+SIZE_EDGES = 2.0 ** np.arange(-8, 0.25, 0.5)    # Relative box side: 1/256 … 1 in half octaves
+ASPECT_EDGES = np.arange(-3, 3.25, 0.5)         # log2(w / h): 1:8 … 8:1
+IMGSZ_CANDIDATES = (320, 416, 512, 640, 768, 960, 1280)
+SMALL_PX = 16          # Boxes below this side (px at imgsz) are hard to detect
+SMALL_SHARE = 0.05     # Max share of small boxes per class for the suggested imgsz
+ELONGATED = 4          # Aspect ratio (either way) counted as elongated
+STATS_VERSION = 1
+
+
+class ClassStats:
+    """
+    Fixed-size per-class counters; partial results of chunks are `merge`d.
+    """
+
+    def __init__(self, num_classes):
+        n = num_classes
+        self.num_classes = n
+        self.files = 0
+        self.empty_files = 0
+        self.unsized_files = 0      # No readable image → no geometry
+        self.out_of_range = 0
+        self.instances = np.zeros(n, dtype=np.int64)
+        self.cooccurrence = np.zeros((n, n), dtype=np.int64)   # diagonal = images per class
+        self.size_hist = np.zeros((n, len(SIZE_EDGES) + 1), dtype=np.int64)
+        self.aspect_hist = np.zeros((n, len(ASPECT_EDGES) + 1), dtype=np.int64)
+        self.small = np.zeros((n, len(IMGSZ_CANDIDATES)), dtype=np.int64)
+        self.sized = np.zeros(n, dtype=np.int64)   # Boxes that entered the geometry
+
+    def add_counts(self, index):
+        """
+        File, instance and co-occurrence counts straight from the label index.
+        """
+        n = self.num_classes
+        self.files = index.file_count()
+        self.empty_files = index.empty_file_count()
+        for class_id, count in index.class_counts().items():
+            if 0 <= class_id < n:
+                self.instances[class_id] = count
+            else:
+                self.out_of_range += count
+        for (a, b), count in index.cooccurrence().items():
+            if 0 <= a < n and 0 <= b < n:
+                self.cooccurrence[a, b] = count
+
+    def add_geometry(self, class_ids, boxes, img_w=None, img_h=None):
+        """
+        Box geometry of one label file: (N,) class ids and (N, 4) YOLO boxes,
+        with the image size in pixels (None: not available).
+        """
+        keep = (class_ids >= 0) & (class_ids < self.num_classes)
+        class_ids, boxes = class_ids[keep], boxes[keep]
+        if not len(class_ids):
+            return
+        if img_w is None:
+            self.unsized_files += 1
+            return
+        w = np.abs(boxes[:, 2]) * img_w
+        h = np.abs(boxes[:, 3]) * img_h
+        valid = (w > 0) & (h > 0)
+        class_ids, w, h = class_ids[valid], w[valid], h[valid]
+        rel = np.sqrt(w * h) / max(img_w, img_h)
+        np.add.at(self.size_hist, (class_ids, np.searchsorted(SIZE_EDGES, rel, side="right")), 1)
+        np.add.at(self.aspect_hist, (class_ids, np.searchsorted(ASPECT_EDGES, np.log2(w / h), side="right")), 1)
+        self.small += np.stack([np.bincount(class_ids[rel * imgsz < SMALL_PX], minlength=self.num_classes)
+                                for imgsz in IMGSZ_CANDIDATES], axis=1)
+        self.sized += np.bincount(class_ids, minlength=self.num_classes)
+
+    def merge(self, other):
+        for name in ("files", "empty_files", "unsized_files", "out_of_range"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        for name in ("instances", "cooccurrence", "size_hist", "aspect_hist", "small", "sized"):
+            getattr(self, name)[...] += getattr(other, name)
+        return self
+
+
+def measure_chunk(job):
+    """
+    Geometry of one chunk of (base, boxes) from the index; the image sizes
+    are read from the JPEG headers here, on the worker.
+    """
+    images_dir, files, num_classes = job
+    stats = ClassStats(num_classes)
+    for base, rows in files:
+        rows = np.array(rows, dtype=np.float64)
+        img_w = img_h = None
+        if images_dir is None:
+            img_w = img_h = 1
+        else:
+            image_path = os.path.join(images_dir, base + ".jpg")
+            if os.path.exists(image_path):
+                img_w, img_h, _ = check_jpeg(image_path)
+        stats.add_geometry(rows[:, 0].astype(np.int64), rows[:, 1:], img_w, img_h)
+    return stats
+
+
+def box_chunks(index, size=CHUNK_FILES):
+    """
+    Yield lists of up to `size` (base, boxes) pairs, streamed from the index.
+    """
+    chunk = []
+    for base, rows in index.iter_boxes():
+        chunk.append((base, rows))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def collect_stats(root, num_classes, workers=None, image_sizes=True):
+    """
+    Counts from the label index of root/labels, plus the box geometry of
+    every indexed file measured by `measure_chunk` on `workers` processes
+    (in-process for 1). Returns the merged ClassStats.
+    """
+    workers = workers or os.cpu_count() or 1
+    images_dir = str(root / "images") if image_sizes else None
+    total = ClassStats(num_classes)
+    with open_index(root / "labels") as index:
+        total.add_counts(index)
+        jobs = ((images_dir, files, num_classes) for files in box_chunks(index))
+        if workers == 1:
+            for job in jobs:
+                total.merge(measure_chunk(job))
+            return total
+        with ProcessPoolExecutor(workers) as executor:
+            for stats in bounded_map(executor, measure_chunk, jobs, workers * 2):
+                total.merge(stats)
+    return total
+
+
+# --- SUMMARY ---
+def size_quantile(hist, q):
+    """
+    Approximate quantile of a SIZE_EDGES histogram (geometric bin centre); None if empty.
+    """
+    total = hist.sum()
+    if not total:
+        return None
+    i = int(np.searchsorted(np.cumsum(hist), q * total))
+    return float(np.sqrt(SIZE_EDGES[max(i - 1, 0)] * SIZE_EDGES[min(i, len(SIZE_EDGES) - 1)]))
+
+
+def elongated_bins():
+    """Mask of the ASPECT_EDGES bins beyond ELONGATED:1 either way."""
+    limit = np.log2(ELONGATED)
+    lower = np.concatenate([[-np.inf], ASPECT_EDGES])
+    upper = np.concatenate([ASPECT_EDGES, [np.inf]])
+    return (lower >= limit) | (upper <= -limit)
+
+
+def suggest_imgsz(stats):
+    """
+    Smallest IMGSZ_CANDIDATES entry where no class has more than SMALL_SHARE
+    of its boxes under SMALL_PX (the largest if none qualifies).
+    """
+    sized = stats.sized[:, None]
+    share = np.divide(stats.small, sized, out=np.zeros(stats.small.shape), where=sized > 0)
+    for k, imgsz in enumerate(IMGSZ_CANDIDATES):
+        if (share[:, k] <= SMALL_SHARE).all():
+            return imgsz, share
+    return IMGSZ_CANDIDATES[-1], share
+
+
+def build_report(stats, class_names, root, elapsed):
+    """
+    JSON-ready dict of the stats (class ids as string keys, like the other
+    reports of the pipeline).
+    """
+    imgsz, small_share = suggest_imgsz(stats)
+    elongated = stats.aspect_hist[:, elongated_bins()].sum(axis=1)
+    classes = {}
+    for class_id, name in enumerate(class_names):
+        sized = int(stats.sized[class_id])
+        classes[str(class_id)] = {
+            "name": name,
+            "instances": int(stats.instances[class_id]),
+            "images": int(stats.cooccurrence[class_id, class_id]),
+            "median_rel_size": size_quantile(stats.size_hist[class_id], 0.5),
+            "small_share": {str(s): round(float(small_share[class_id, k]), 4)
+                            for k, s in enumerate(IMGSZ_CANDIDATES)},
+            "elongated_share": round(int(elongated[class_id]) / sized, 4) if sized else 0.0,
+            "size_hist": stats.size_hist[class_id].tolist(),
+            "aspect_hist": stats.aspect_hist[class_id].tolist(),
+        }
+    return {
+        "version": STATS_VERSION,
+        "root": str(root),
+        "files": stats.files,
+        "empty_files": stats.empty_files,
+        "unsized_files": stats.unsized_files,
+        "boxes": int(stats.instances.sum()),
+        "out_of_range": stats.out_of_range,
+        "size_edges": SIZE_EDGES.tolist(),
+        "aspect_edges": ASPECT_EDGES.tolist(),
+        "small_px": SMALL_PX,
+        "recommendation": {"imgsz": imgsz, "small_share": SMALL_SHARE,
+                           "elongated_share": (round(int(elongated.sum()) / int(stats.sized.sum()), 4)
+                                               if stats.sized.sum() else 0.0)},
+        "classes": classes,
+        "cooccurrence": stats.cooccurrence.tolist(),
+        "elapsed_seconds": round(elapsed, 2),
+    }
+
+
+def format_report(report):
+    """Per-class lines at the suggested imgsz, plus totals and the recommendation."""
+    imgsz = report["recommendation"]["imgsz"]
+    lines = []
+    for class_id, entry in report["classes"].items():
+        line = f"{class_id}: {entry['name']} → {entry['instances']} boxes in {entry['images']} images"
+        if entry["median_rel_size"] is not None:
+            line += (f" (median box ≈ {entry['median_rel_size'] * imgsz:.0f}px @{imgsz}, "
+                     f"{entry['small_share'][str(imgsz)]:.0%} small)")
+        lines.append(line)
+    lines.append(f"\n📊 {report['boxes']} boxes in {report['files']} label files "
+                 f"({report['empty_files']} empty, {report['out_of_range']} out-of-range boxes skipped)")
+    if report["unsized_files"]:
+        lines.append(f"⚠️ {report['unsized_files']} label files without a readable image (no geometry)")
+
+    # Class pairs that share the most images
+    matrix = np.array(report["cooccurrence"])
+    if matrix.size:
+        pairs = np.triu(matrix, 1)
+        top = [(int(i), int(j), int(pairs[i, j])) for i, j in
+               zip(*np.unravel_index(np.argsort(pairs, axis=None)[::-1][:3], pairs.shape)) if pairs[i, j]]
+        if top:
+            lines.append("🔗 Most co-occurring: " + ", ".join(f"{i}+{j} ({n} images)" for i, j, n in top))
+    rec = report["recommendation"]
+    lines.append(f"📐 Suggested imgsz: {rec['imgsz']} (≤{rec['small_share']:.0%} of each class under "
+                 f"{report['small_px']}px); elongated boxes (>{ELONGATED}:1): {rec['elongated_share']:.1%}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-class instance, image, co-occurrence and bbox statistics")
+    parser.add_argument("--root", type=Path, default=ROOT, help="crop_data folder (images/, labels/, classes.txt)")
+    parser.add_argument("--workers", type=int, default=None, help="JPEG header reader processes (default: all cores)")
+    parser.add_argument("--output", type=Path, default=None, help=f"Stats JSON (default: <root>/{STATS_NAME})")
+    parser.add_argument("--no-image-sizes", action="store_true",
+                        help="Do not read JPEG headers; box geometry assumes a square frame")
+    args = parser.parse_args()
+
+    # Load class names (one per line, indexed 0..N-1)
+    with open(args.root / "classes.txt") as f:
+        class_names = [line.strip() for line in f.readlines()]
+
+    start = time.perf_counter()
+    stats = collect_stats(args.root, len(class_names), args.workers, not args.no_image_sizes)
+    report = build_report(stats, class_names, args.root, time.perf_counter() - start)
+
+    output = args.output or args.root / STATS_NAME
+    tmp = output.with_suffix(".tmp")
+    tmp.write_text(json.dumps(report, indent=2))
+    os.replace(tmp, output)
+
+    print(format_report(report))
+    print(f"✅ {report['files']} files in {report['elapsed_seconds']}s → {output}")
+
+
+if __name__ == "__main__":
+    main()
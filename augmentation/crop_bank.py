@@ -0,0 +1,233 @@
+"""
+crop_bank.py
+---------------------------------
+Pre-extracted bank of object crops for copy-paste synthesis (synthesize.py).
+
+Classes with a handful of source images cannot be rescued by running the
+same few photos through Albumentations again and again — the results are
+near-duplicates. Their *objects*, however, can be pasted into many other
+field photos. This script cuts every box of the chosen classes out of
+crop_data once (with some context around it) and stores the crops in a
+single memory-mapped file, indexed by class and size.
+
+📌 Layout (`crop_data/crop_bank/` by default):
+    crop_bank/
+    ├── pixels.u8     all crops back to back, raw BGR uint8 (HWC), memory-mapped
+    ├── index.npy     one row per crop: class, size bucket, offset, height,
+    │                 width, box inside the crop, relative size, source id;
+    │                 sorted by (class, size bucket)
+    ├── sources.txt   source image base names (row `source` of the index)
+    └── meta.json     margin, size buckets, class names, counts
+
+- Size buckets are by the longer box side in pixels (`SIZE_BUCKETS` edges),
+  so the synthesizer can ask for small, medium or large objects.
+- `rel_size` is the longer box side relative to the longer image side: the
+  synthesizer uses it to paste a crop at a realistic scale.
+- Near-duplicates (duplicates.json) and augmented images are left out.
+- Decoding runs on a thread pool (OpenCV releases the GIL) with a bounded
+  number of images in flight, so memory stays flat even for every class;
+  the bank is written to a temp folder and swapped in when complete.
+
+⚙️ Requirements:
+- Python 3.8+
+- OpenCV (cv2), NumPy
+
+Usage:
+    python crop_bank.py --root ~/Desktop/crop_data --classes 6,27
+    python crop_bank.py --root ~/Desktop/crop_data              # every class
+    python crop_bank.py --root ~/Desktop/crop_data --info       # counts per class and size
+
+    from crop_bank import CropBank
+    bank = CropBank(root / "crop_bank")
+    rows = bank.rows(27)                 # crop ids of class 27 (optionally per bucket)
+    pixels, box = bank.crop(rows[0])     # read-only view into the memory map + box in the crop
+"""
+
+import argparse
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from bbox_utils import clip_voc, yolo_to_voc
+from dedup_images import load_dropped
+from label_index import open_index
+from verify_dataset_integrity import bounded_map
+
+# --- CONFIG ---
+ROOT = Path.home() / "Desktop" / "crop_data"
+BANK_NAME = "crop_bank"
+MARGIN = 0.15                    # Context kept around a box, as a share of its size per side
+MIN_BOX = 8                      # Boxes with a shorter side (px) are not worth pasting
+SIZE_BUCKETS = (32, 64, 128, 256)   # Longer box side edges (px) → buckets 0..4
+BANK_VERSION = 1
+
+INDEX_DTYPE = np.dtype([
+    ("class_id", "<u2"),
+    ("bucket", "u1"),
+    ("offset", "<u8"),
+    ("height", "<u2"), ("width", "<u2"),
+    ("box", "<u2", (4,)),        # VOC box of the object inside the crop
+    ("rel_size", "<f4"),         # longer box side / longer image side
+    ("source", "<u4"),
+])
+
+
+# --- BUILD ---
+def size_bucket(long_side):
+    return int(np.searchsorted(SIZE_BUCKETS, long_side, side="right"))
+
+
+def cut_crops(job):
+    """
+    Decode one image and cut its boxes of the wanted classes.
+    Returns [(class_id, crop, box in crop, rel_size), ...].
+    """
+    image_path, label_rows, wanted, margin = job
+    image = cv2.imread(image_path)
+    if image is None:
+        return []
+    h, w = image.shape[:2]
+    class_ids = np.array([row[0] for row in label_rows], dtype=np.int64)
+    boxes = clip_voc(yolo_to_voc([row[1:] for row in label_rows], w, h), w, h)
+    crops = []
+    for class_id, (x1, y1, x2, y2) in zip(class_ids.tolist(), boxes):
+        if (wanted is not None and class_id not in wanted) or min(x2 - x1, y2 - y1) < MIN_BOX:
+            continue
+        pad_x, pad_y = (x2 - x1) * margin, (y2 - y1) * margin
+        left, top = int(max(x1 - pad_x, 0)), int(max(y1 - pad_y, 0))
+        right, bottom = int(min(np.ceil(x2 + pad_x), w)), int(min(np.ceil(y2 + pad_y), h))
+        crop = np.ascontiguousarray(image[top:bottom, left:right])
+        box = (int(round(x1)) - left, int(round(y1)) - top, int(round(x2)) - left, int(round(y2)) - top)
+        crops.append((class_id, crop, box, max(x2 - x1, y2 - y1) / max(w, h)))
+    return crops
+
+
+def build_bank(root, classes=None, margin=MARGIN, workers=None, bank_dir=None):
+    """
+    Cut every box of `classes` (all if None) out of root/images into a bank.
+    Returns the bank folder.
+    """
+    root = Path(root)
+    bank_dir = Path(bank_dir) if bank_dir else root / BANK_NAME
+    with open(root / "classes.txt") as f:
+        class_names = [line.strip() for line in f.readlines()]
+
+    duplicates = load_dropped(root)
+    with open_index(root / "labels") as index:
+        bases = [base for base, _ in index.files_with_classes(classes)
+                 if "_aug_" not in base and base not in duplicates and (root / "images" / f"{base}.jpg").exists()]
+        jobs = [(str(root / "images" / f"{base}.jpg"), [row[:5] for row in index.boxes(base)],
+                 None if classes is None else set(classes), margin) for base in bases]
+
+    tmp_dir = bank_dir.with_name(bank_dir.name + ".tmp")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    rows = []
+    offset = 0
+    workers = workers or min(32, (os.cpu_count() or 1) * 2)
+    with open(tmp_dir / "pixels.u8", "wb") as pixels, ThreadPoolExecutor(max_workers=workers) as pool:
+        # In source order (byte-identical bank between runs), with at most
+        # workers × 4 images decoded ahead of the writer
+        for source, crops in enumerate(bounded_map(pool, cut_crops, jobs, workers * 4)):
+            for class_id, crop, box, rel_size in crops:
+                height, width = crop.shape[:2]
+                rows.append((class_id, size_bucket(max(box[2] - box[0], box[3] - box[1])), offset,
+                             height, width, box, rel_size, source))
+                pixels.write(crop.tobytes())
+                offset += crop.nbytes
+
+    index = np.array(rows, dtype=INDEX_DTYPE)
+    index = index[np.lexsort((index["bucket"], index["class_id"]))]
+    np.save(tmp_dir / "index.npy", index)
+    (tmp_dir / "sources.txt").write_text("".join(f"{base}\n" for base in bases))
+    meta = {"version": BANK_VERSION, "margin": margin, "size_buckets": list(SIZE_BUCKETS),
+            "names": class_names, "crops": len(index), "sources": len(bases), "bytes": offset,
+            "classes": {str(c): int(n) for c, n in zip(*np.unique(index["class_id"], return_counts=True))}}
+    (tmp_dir / "meta.json").write_text(json.dumps(meta, indent=2))
+
+    if bank_dir.exists():
+        shutil.rmtree(bank_dir)
+    os.replace(tmp_dir, bank_dir)
+    return bank_dir
+
+
+# --- READ ---
+class CropBank:
+    """
+    Read-only access to a bank built by `build_bank`; pixels stay memory-mapped.
+    """
+
+    def __init__(self, bank_dir):
+        self.bank_dir = Path(bank_dir)
+        with open(self.bank_dir / "meta.json") as f:
+            self.meta = json.load(f)
+        self.index = np.load(self.bank_dir / "index.npy")
+        self.pixels = (np.memmap(self.bank_dir / "pixels.u8", dtype=np.uint8, mode="r")
+                       if self.meta["bytes"] else np.zeros(0, dtype=np.uint8))
+        # (class, bucket) → contiguous row range of the sorted index
+        self._keys = self.index["class_id"].astype(np.int64) * 256 + self.index["bucket"]
+
+    def __len__(self):
+        return len(self.index)
+
+    def classes(self):
+        return np.unique(self.index["class_id"]).tolist()
+
+    def rows(self, class_id, bucket=None):
+        """Crop ids of one class (and size bucket)."""
+        lo, hi = (class_id * 256, class_id * 256 + 256) if bucket is None else \
+            (class_id * 256 + bucket, class_id * 256 + bucket + 1)
+        return np.arange(np.searchsorted(self._keys, lo), np.searchsorted(self._keys, hi))
+
+    def buckets(self, class_id):
+        """{bucket: crop ids} of one class."""
+        rows = self.rows(class_id)
+        return {int(b): rows[self.index["bucket"][rows] == b] for b in np.unique(self.index["bucket"][rows])}
+
+    def crop(self, i):
+        """(read-only (h, w, 3) view into the bank, VOC box of the object in it)."""
+        entry = self.index[i]
+        start, height, width = int(entry["offset"]), int(entry["height"]), int(entry["width"])
+        pixels = self.pixels[start:start + height * width * 3].reshape(height, width, 3)
+        return pixels, entry["box"].astype(np.float64)
+
+
+def format_bank(bank):
+    names = bank.meta.get("names", [])
+    lines = [f"🧩 Crop bank: {len(bank)} crops from {bank.meta['sources']} images, "
+             f"{bank.meta['bytes'] / (1 << 20):.1f} MiB → {bank.bank_dir}"]
+    edges = ["<" + str(e) for e in bank.meta["size_buckets"]] + [f"≥{bank.meta['size_buckets'][-1]}"]
+    for class_id in bank.classes():
+        sizes = ", ".join(f"{edges[b]}px: {len(rows)}" for b, rows in bank.buckets(class_id).items())
+        name = names[class_id] if class_id < len(names) else "?"
+        lines.append(f"   Class {class_id:02d} ({name}): {len(bank.rows(class_id))} crops ({sizes})")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the memory-mapped crop bank for synthesize.py")
+    parser.add_argument("--root", type=Path, default=ROOT, help="crop_data folder")
+    parser.add_argument("--classes", type=lambda s: sorted({int(c) for c in s.split(",") if c}), default=None,
+                        help="Comma-separated class IDs to bank (default: all)")
+    parser.add_argument("--margin", type=float, default=MARGIN, help="Context around each box (share of box size)")
+    parser.add_argument("--workers", type=int, default=None, help="Decode threads")
+    parser.add_argument("--info", action="store_true", help="Only print what the existing bank holds")
+    args = parser.parse_args()
+
+    if not args.info:
+        start = time.perf_counter()
+        build_bank(args.root, args.classes, args.margin, args.workers)
+        print(f"✅ Built in {time.perf_counter() - start:.1f}s")
+    print(format_bank(CropBank(args.root / BANK_NAME)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+dedup_images.py
+---------------------------------
+Finds near-duplicate raw images in `crop_data/images/` before augmentation is
+planned.
+
+The same field photo often arrives several times through different collection
+rounds (re-exports, resized or recompressed copies). prepare_augmentation_list.py
+would plan augmentation on every copy, and all of them would end up in
+training. This stage hashes every image, groups near-duplicates and keeps one
+image per group.
+
+📌 Features:
+- dHash + pHash (image_hash.py) from a single 1/8-scale decode, on a thread
+  pool (`--workers`; OpenCV releases the GIL while decoding).
+- Hashes are cached by image content (BLAKE2b, itself cached by size/mtime)
+  in `crop_data/pipeline_state.sqlite`, shared with pipeline.py; a rerun
+  only decodes new images.
+- Candidates come from a multi-index hash table over the dHash bits
+  (sub-linear lookup, no all-pairs comparison); a pair is a duplicate only if
+  the pHash also agrees (`--dhash-distance`, `--phash-distance`).
+- Per group the image with the most label boxes is kept (then the largest
+  file, then the first name); the others are listed as `drop`.
+- Default is report-only: `crop_data/duplicates.json` is written and
+  prepare_augmentation_list.py leaves the dropped images out of the plan.
+  `--remove` moves them (with their labels) to `crop_data/duplicates/`, so
+  nothing is deleted and a mistake can be undone by moving them back.
+
+⚙️ Requirements:
+- Python 3.8+
+- OpenCV (cv2), NumPy
+
+💡 Output:
+- `crop_data/duplicates.json`: {"groups": [{"keep": base, "drop": [base, ...]}], ...}
+
+Usage:
+    python dedup_images.py
+    python dedup_images.py --root ~/Desktop/crop_data --workers 16
+    python dedup_images.py --remove            # move duplicates out of images/ and labels/
+"""
+
+import argparse
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+
+from image_hash import MultiIndexHash, group_duplicates, hamming, image_hashes
+from pipeline import STATE_NAME, PipelineState
+
+# --- CONFIG ---
+ROOT = Path.home() / "Desktop" / "crop_data"
+DHASH_DISTANCE = 3     # Max dHash Hamming distance of a candidate pair
+PHASH_DISTANCE = 8     # Max pHash Hamming distance to confirm it
+REPORT_NAME = "duplicates.json"
+
+HASH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS perceptual_hashes (
+    digest TEXT PRIMARY KEY,
+    dhash  TEXT,
+    phash  TEXT
+);
+"""
+
+
+# --- HASHING ---
+def cached_hashes(state, paths, workers):
+    """
+    {path: (dhash, phash)} for every image; only images whose content is not
+    in the cache are decoded. Unreadable images map to (None, None).
+    """
+    state.conn.executescript(HASH_SCHEMA)
+    digests = state.file_digests(paths)
+    known = {digest: (int(d, 16) if d else None, int(p, 16) if p else None)
+             for digest, d, p in state.conn.execute("SELECT digest, dhash, phash FROM perceptual_hashes")}
+
+    todo = sorted({digests[str(p)] for p in paths} - set(known) - {"missing"})
+    if todo:
+        by_digest = {}
+        for path in paths:
+            by_digest.setdefault(digests[str(path)], path)
+        print(f"🧮 Hashing {len(todo)} new images on {workers} threads")
+        with ThreadPoolExecutor(workers) as pool:
+            results = list(pool.map(image_hashes, [by_digest[d] for d in todo]))
+        with state.conn:
+            state.conn.executemany(
+                "INSERT OR REPLACE INTO perceptual_hashes (digest, dhash, phash) VALUES (?, ?, ?)",
+                [(d, f"{dh:016x}" if dh is not None else None, f"{ph:016x}" if ph is not None else None)
+                 for d, (dh, ph) in zip(todo, results)])
+        known.update(zip(todo, results))
+    return {path: known.get(digests[str(path)], (None, None)) for path in paths}
+
+
+# --- GROUPING ---
+def find_duplicate_pairs(hashes, dhash_distance=DHASH_DISTANCE, phash_distance=PHASH_DISTANCE):
+    """
+    [(a, b, dhash distance, phash distance)] for every near-duplicate pair of
+    {base: (dhash, phash)}.
+    """
+    index = MultiIndexHash(dhash_distance)
+    pairs = []
+    for base in sorted(hashes):
+        dh, ph = hashes[base]
+        if dh is None:
+            continue
+        for other, distance in index.query(dh):
+            other_ph = hashes[other][1]
+            p_distance = hamming(ph, other_ph)
+            if p_distance <= phash_distance:
+                pairs.append((other, base, distance, p_distance))
+        index.add(base, dh)
+    return pairs
+
+
+def box_count(label_path):
+    try:
+        with open(label_path, "r") as f:
+            return sum(1 for line in f if line.strip())
+    except FileNotFoundError:
+        return 0
+
+
+def choose_keeper(group, images_dir, labels_dir):
+    """The most useful copy: most label boxes, then largest file, then first name."""
+    return min(group, key=lambda base: (-box_count(labels_dir / f"{base}.txt"),
+                                        -(images_dir / f"{base}.jpg").stat().st_size, base))
+
+
+def load_dropped(root):
+    """
+    Bases listed as `drop` in `duplicates.json` (empty set if there is none).
+    """
+    path = Path(root) / REPORT_NAME
+    if not path.exists():
+        return set()
+    with open(path, "r") as f:
+        report = json.load(f)
+    return {base for group in report["groups"] for base in group["drop"]}
+
+
+def move_duplicates(bases, root):
+    """Move dropped images and labels to `root/duplicates/`. Returns how many moved."""
+    moved = 0
+    for base in bases:
+        for sub, suffix in (("images", ".jpg"), ("labels", ".txt")):
+            src = root / sub / f"{base}{suffix}"
+            if src.exists():
+                dest = root / "duplicates" / sub / src.name
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                shutil.move(str(src), str(dest))
+                moved += sub == "images"
+    return moved
+
+
+# --- MAIN ---
+def main():
+    parser = argparse.ArgumentParser(description="Find near-duplicate raw images before augmentation planning")
+    parser.add_argument("--root", type=Path, default=ROOT, help="crop_data folder")
+    parser.add_argument("--workers", type=int, default=min(32, (os.cpu_count() or 1) * 2))
+    parser.add_argument("--dhash-distance", type=int, default=DHASH_DISTANCE)
+    parser.add_argument("--phash-distance", type=int, default=PHASH_DISTANCE)
+    parser.add_argument("--remove", action="store_true",
+                        help="Move duplicates (image + label) to <root>/duplicates/ instead of only reporting")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    cv2.setNumThreads(1)
+    images_dir = args.root / "images"
+    labels_dir = args.root / "labels"
+    with os.scandir(images_dir) as entries:
+        paths = sorted(Path(e.path) for e in entries if e.name.endswith(".jpg") and "_aug_" not in e.name)
+
+    state = PipelineState(args.root / STATE_NAME, hash_workers=args.workers)
+    try:
+        hashes = {path.stem: h for path, h in cached_hashes(state, paths, args.workers).items()}
+    finally:
+        state.close()
+    unreadable = sorted(base for base, (dh, _) in hashes.items() if dh is None)
+
+    # --- NEAR-DUPLICATE GROUPS ---
+    pairs = find_duplicate_pairs(hashes, args.dhash_distance, args.phash_distance)
+    distances = {}
+    for a, b, d, p in pairs:
+        distances[a] = max(distances.get(a, 0), p)
+        distances[b] = max(distances.get(b, 0), p)
+    groups = []
+    for group in group_duplicates((a, b) for a, b, _, _ in pairs):
+        keep = choose_keeper(group, images_dir, labels_dir)
+        groups.append({"keep": keep, "drop": [base for base in group if base != keep],
+                       "max_phash_distance": max(distances[base] for base in group)})
+    dropped = [base for group in groups for base in group["drop"]]
+
+    report = {
+        "root": str(args.root),
+        "images": len(paths),
+        "duplicates": len(dropped),
+        "removed": args.remove,
+        "dhash_distance": args.dhash_distance,
+        "phash_distance": args.phash_distance,
+        "unreadable": unreadable,
+        "groups": groups,
+    }
+    tmp = args.root / (REPORT_NAME + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp, args.root / REPORT_NAME)
+
+    # --- PRINT SUMMARY ---
+    for group in groups[:10]:
+        print(f"🔁 {group['keep']} ← {', '.join(group['drop'])}")
+    if len(groups) > 10:
+        print(f"   ... {len(groups) - 10} more groups")
+    if unreadable:
+        print(f"⚠️ {len(unreadable)} unreadable images (e.g. {', '.join(unreadable[:3])})")
+    if args.remove and dropped:
+        moved = move_duplicates(dropped, args.root)
+        print(f"📦 Moved {moved} duplicates to {args.root / 'duplicates'}")
+    elif dropped:
+        print("ℹ️ Report only: prepare_augmentation_list.py skips the dropped images (--remove to move them)")
+
+    print(f"\n✅ Done in {time.perf_counter() - start:.1f}s: {len(dropped)} duplicates of "
+          f"{len(groups)} images among {len(paths)}. Report: {args.root / REPORT_NAME}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,63 +1,150 @@
 """
-Script: filter_class.py
+Script: extract_nth_class.py
 
 Description:
 ------------
-This script filters out all images and label files belonging to a specific YOLO class
-from a dataset and copies them into a new folder for analysis, augmentation, or training.
+This script extracts all images and label files belonging to one or more YOLO
+classes from a dataset and places them into per-class folders for analysis,
+augmentation, or training.
 
 How it works:
 -------------
-1. Iterates through YOLO-format label files (.txt).
-2. Checks if the file contains the target class ID.
-3. If found, copies both the label file and its corresponding image (.jpg) 
-   into a separate output folder.
-4. Prints the total number of matched samples.
+1. Streams (label file, classes) pairs for every requested class in ONE pass:
+   from the shared label index (`label_index.py`, only changed label files
+   are re-parsed), or with `--scan` straight from labels/ through the
+   streaming parser `scan_label_files` (no index).
+2. Fans each match out to the folder of every requested class it contains:
+       <output>/class_12_<name>/images/<base>.jpg
+       <output>/class_12_<name>/labels/<base>.txt
+3. Places the files on a thread pool with `--link-mode` (see materialize.py):
+   hardlinks by default, falling back to reflink/copy where the filesystem
+   refuses. Labels are linked unchanged (all boxes kept).
+4. Prints the number of matched samples per class.
 
 Use cases:
 ----------
-- Extracting a single class for debugging or inspection.
+- Extracting a few classes for debugging or inspection.
 - Creating a balanced subset of data for augmentation or testing.
 - Cleaning or isolating data during dataset preparation.
 
+Usage:
+------
+    python extract_nth_class.py --classes 12
+    python extract_nth_class.py --classes 3,7,12 --output ~/Desktop/filtered_classes
+    python extract_nth_class.py --classes all --link-mode copy --workers 16
+    python extract_nth_class.py --classes 12 --scan      # no label index
+
 Author: Nicholas Muthoki (Agrosight AI)
 """
 
+import argparse
 import os
-import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from label_index import open_index, scan_label_files
+from materialize import LINK_MODES, Materializer
+
+# --- CONFIG ---
+ROOT = Path.home() / "Desktop" / "crop_data"
+MAX_PENDING = 1024   # Placements in flight; keeps memory flat on huge datasets
+
+
+def parse_classes(text):
+    return None if text == "all" else sorted({int(c) for c in text.split(",") if c})
+
+
+def class_folder(output, class_id, class_names):
+    name = class_names[class_id] if class_id < len(class_names) else "unknown"
+    return output / f"class_{class_id}_{name.replace(' ', '_')}"
+
+
+def stream_matches(root, class_ids, scan=False):
+    """
+    Yield (base, [class_id, ...]) for label files with any of `class_ids`
+    (all classes if None), restricted to the requested classes.
+    """
+    if scan:
+        for base, rows in scan_label_files(root / "labels", class_ids):
+            found = sorted({row[1] for row in rows})
+            yield base, found if class_ids is None else [c for c in found if c in class_ids]
+        return
+    with open_index(root / "labels") as index:
+        yield from index.files_with_classes(class_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract the images + labels of one or more classes")
+    parser.add_argument("--root", type=Path, default=ROOT, help="crop_data folder")
+    parser.add_argument("--classes", type=parse_classes, required=True,
+                        help="Comma-separated class IDs, or 'all'")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="Output folder (default: filtered_classes/ next to crop_data)")
+    parser.add_argument("--link-mode", choices=LINK_MODES, default="hardlink",
+                        help="How files are placed (falls back to cheaper-to-support modes)")
+    parser.add_argument("--workers", type=int, default=min(32, (os.cpu_count() or 1) * 4),
+                        help="Threads placing files")
+    parser.add_argument("--scan", action="store_true", help="Parse labels/ directly instead of using the label index")
+    args = parser.parse_args()
 
-# Paths: adjust these to your dataset structure
-label_dir = r"C:/Users/hp/Desktop/crop_data/labels"      # Folder with YOLO label files
-image_dir = r"C:/Users/hp/Desktop/crop_data/images"      # Folder with corresponding images
-output_dir = r"C:/Users/hp/Desktop/filtered_class_12"    # Output folder for filtered data
+    root = args.root
+    output = args.output or root.parent / "filtered_classes"
+    with open(root / "classes.txt") as f:
+        class_names = [line.strip() for line in f.readlines()]
 
-# Create output folders if they don't exist
-os.makedirs(os.path.join(output_dir, "images"), exist_ok=True)
-os.makedirs(os.path.join(output_dir, "labels"), exist_ok=True)
+    start = time.perf_counter()
+    placer = Materializer(args.link_mode)
+    counts = {}
+    folders = {}
+    missing = set()
 
-# Set the class to filter (string, since YOLO class IDs are written as strings in label files)
-target_class = "12"
-count = 0  # Track number of files copied
+    def target(class_id):
+        folder = folders.get(class_id)
+        if folder is None:
+            folder = folders[class_id] = class_folder(output, class_id, class_names)
+            (folder / "images").mkdir(parents=True, exist_ok=True)
+            (folder / "labels").mkdir(parents=True, exist_ok=True)
+        return folder
 
-# Iterate over label files
-for label_file in os.listdir(label_dir):
-    if label_file.endswith(".txt"):
-        label_path = os.path.join(label_dir, label_file)
+    def place(base, class_id):
+        """Link one sample into a class folder; returns (class_id, base, placed)."""
+        image = root / "images" / f"{base}.jpg"
+        if not image.exists():
+            return class_id, base, False
+        folder = folders[class_id]
+        placer.place(image, folder / "images" / f"{base}.jpg")
+        placer.place(root / "labels" / f"{base}.txt", folder / "labels" / f"{base}.txt")
+        return class_id, base, True
 
-        # Read label file
-        with open(label_path, "r") as f:
-            lines = f.readlines()
+    def collect(done):
+        for future in done:
+            class_id, base, placed = future.result()
+            if placed:
+                counts[class_id] = counts.get(class_id, 0) + 1
+            else:
+                missing.add(base)
 
-            # Check if any line in this file starts with the target class ID
-            if any(line.startswith(target_class + " ") for line in lines):
-                # Copy label file
-                shutil.copy(label_path, os.path.join(output_dir, "labels", label_file))
+    pending = set()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for base, classes in stream_matches(root, args.classes, args.scan):
+            for class_id in classes:
+                target(class_id)
+                pending.add(pool.submit(place, base, class_id))
+            if len(pending) >= MAX_PENDING:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        collect(pending)
 
-                # Copy corresponding image file (assumes .jpg format)
-                image_file = label_file.replace(".txt", ".jpg")
-                shutil.copy(os.path.join(image_dir, image_file),
-                            os.path.join(output_dir, "images", image_file))
+    for class_id in sorted(folders):
+        print(f"Class {class_id} ({class_names[class_id] if class_id < len(class_names) else '?'}): "
+              f"{counts.get(class_id, 0)} images → {folders[class_id]}")
+    if missing:
+        print(f"⚠️ {len(missing)} label files without an image were skipped (e.g. {min(missing)})")
+    print(placer.summary())
+    print(f"✅ Extracted {sum(counts.values())} images for {len(folders)} classes "
+          f"in {time.perf_counter() - start:.1f}s")
 
-                count += 1
 
-print(f"Copied {count} images and labels for class {target_class}")
+if __name__ == "__main__":
+    main()
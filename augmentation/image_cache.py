@@ -0,0 +1,143 @@
+"""
+image_cache.py
+---------------------------------
+Decode-once cache for the augmentation scripts.
+
+Augmentation picks base images at random and used to call `cv2.imread` on
+every pick, so a class with 20 base images that needs 480 new samples decoded
+each JPEG ~24 times. `ImageCache` keeps decoded images in memory under a byte
+budget (least-recently-used images are evicted first) and parses each YOLO
+label file once into NumPy arrays.
+
+📌 Features:
+- Byte budget with LRU eviction (decoded images only; labels are tiny).
+- Pre-parsed labels: (class_ids, boxes) NumPy arrays from `bbox_utils.parse_yolo`.
+- Missing/unreadable images are remembered so they are not probed again.
+- Hit/miss/eviction counters and time spent decoding, to estimate savings.
+
+Usage:
+    from image_cache import ImageCache
+    cache = ImageCache(IMAGES_DIR, LABELS_DIR, max_bytes=1 << 30)
+    image, (class_ids, boxes) = cache.get("maize_blight_001")
+    print(cache.summary())
+"""
+
+import time
+from collections import OrderedDict
+
+import cv2
+
+from bbox_utils import parse_yolo
+
+DEFAULT_MAX_BYTES = 1 << 30   # 1 GiB of decoded pixels
+
+
+def parse_label_file(label_path):
+    """
+    Parse a YOLO label file into (class_ids (N,), boxes (N, 4)) arrays.
+    Returns None if the file does not exist.
+    """
+    try:
+        with open(label_path, "r") as f:
+            return parse_yolo(f.read())
+    except FileNotFoundError:
+        return None
+
+
+class ImageCache:
+    """
+    In-process LRU cache of decoded images and parsed labels keyed by base name.
+    """
+
+    def __init__(self, images_dir, labels_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.images_dir = images_dir
+        self.labels_dir = labels_dir
+        self.max_bytes = max_bytes
+
+        self._images = OrderedDict()   # base -> ndarray, most recent last
+        self._labels = {}              # base -> (class_ids, yolo boxes)
+        self._missing = set()
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.decode_seconds = 0.0
+
+    def get(self, base):
+        """
+        Return (image, (class_ids, boxes)) for `base`, or (None, None) if the
+        image or its label file is missing or unreadable. The image is a
+        private copy, so callers may modify it freely; the label arrays are
+        shared and must not be modified.
+        """
+        if base in self._missing:
+            return None, None
+
+        image = self._images.get(base)
+        if image is not None:
+            self.hits += 1
+            self._images.move_to_end(base)
+            return image.copy(), self._labels[base]
+
+        self.misses += 1
+        labels = self._labels.get(base)
+        if labels is None:
+            labels = parse_label_file(self.labels_dir / f"{base}.txt")
+            if labels is None:
+                self._missing.add(base)
+                return None, None
+            self._labels[base] = labels
+
+        start = time.perf_counter()
+        image = cv2.imread(str(self.images_dir / f"{base}.jpg"))
+        self.decode_seconds += time.perf_counter() - start
+        if image is None:
+            self._missing.add(base)
+            return None, None
+
+        self._store(base, image)
+        return image.copy(), labels
+
+    def _store(self, base, image):
+        """
+        Insert a decoded image and evict least-recently-used ones over budget.
+        Images larger than the whole budget are simply not cached.
+        """
+        if image.nbytes > self.max_bytes:
+            return
+        self._images[base] = image
+        self.bytes += image.nbytes
+        while self.bytes > self.max_bytes:
+            _, evicted = self._images.popitem(last=False)
+            self.bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def stats(self):
+        """
+        Counters as a plain dict (picklable, so workers can report them).
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "decode_seconds": self.decode_seconds,
+        }
+
+    def summary(self):
+        return format_stats(self.stats())
+
+
+def format_stats(stats):
+    """
+    One-line report: hit rate and the decode time the hits avoided, estimated
+    from the mean decode time of the misses.
+    """
+    hits, misses = stats["hits"], stats["misses"]
+    lookups = hits + misses
+    hit_rate = hits / lookups if lookups else 0.0
+    per_decode = stats["decode_seconds"] / misses if misses else 0.0
+    return (f"🗃️ Image cache: {hits} hits / {misses} misses "
+            f"({hit_rate:.1%} hit rate), {stats['evictions']} evictions, "
+            f"{stats['decode_seconds']:.1f}s decoding, "
+            f"~{hits * per_decode:.1f}s decode time saved")
@@ -0,0 +1,147 @@
+"""
+image_hash.py
+---------------------------------
+Perceptual hashes and a near-duplicate lookup table for crop images.
+
+📌 Features:
+- `dhash(path)`: 64-bit difference hash. The JPEG is decoded at 1/8 scale
+  (`cv2.IMREAD_REDUCED_GRAYSCALE_8`), which skips most of the IDCT work.
+- `phash(path)`: 64-bit DCT hash (low frequencies of a 32×32 thumbnail vs.
+  their median); more robust to recompression and small crops than dHash.
+  `image_hashes(path)` returns both from a single decode.
+- `MultiIndexHash`: finds every stored hash within a Hamming distance `d`
+  without comparing against all of them. Each hash is split into d+1 bands;
+  two hashes that differ in at most d bits must agree exactly on at least one
+  band (pigeonhole), so only hashes sharing a band are compared.
+- `group_duplicates`: union-find over (key, key) matches → duplicate groups.
+
+Usage:
+    from image_hash import dhash, MultiIndexHash
+    index = MultiIndexHash(max_distance=3)
+    for base, h in hashes:
+        matches = index.query(h)
+        index.add(base, h)
+"""
+
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+HASH_BITS = 64
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def load_thumbnail_source(path):
+    """Grayscale decode at 1/8 scale (enough for any 64-bit hash), or None."""
+    return cv2.imread(str(path), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+
+
+def bits_to_int(bits):
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def dhash_array(gray, size=8):
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+    return bits_to_int(small[:, 1:] > small[:, :-1])
+
+
+def phash_array(gray, size=8, highfreq_factor=4):
+    small = cv2.resize(gray, (size * highfreq_factor,) * 2, interpolation=cv2.INTER_AREA)
+    low = cv2.dct(np.float32(small))[:size, :size]
+    return bits_to_int(low > np.median(low))
+
+
+def dhash(path, size=8):
+    """
+    Difference hash of an image file (size*size bits), or None if unreadable.
+    """
+    image = load_thumbnail_source(path)
+    if image is None:
+        return None
+    return dhash_array(image, size)
+
+
+def phash(path, size=8):
+    """
+    DCT perceptual hash of an image file (size*size bits), or None if unreadable.
+    """
+    image = load_thumbnail_source(path)
+    if image is None:
+        return None
+    return phash_array(image, size)
+
+
+def image_hashes(path):
+    """
+    (dhash, phash) of an image file from one decode, or (None, None).
+    """
+    image = load_thumbnail_source(path)
+    if image is None:
+        return None, None
+    return dhash_array(image), phash_array(image)
+
+
+class MultiIndexHash:
+    """
+    Hash table over d+1 bit bands for sub-linear Hamming-radius search.
+    """
+
+    def __init__(self, max_distance=3, bits=HASH_BITS):
+        self.max_distance = max_distance
+        n_bands = max_distance + 1
+        width, extra = divmod(bits, n_bands)
+        self.bands = []   # (shift, mask) per band
+        shift = 0
+        for i in range(n_bands):
+            w = width + (1 if i < extra else 0)
+            self.bands.append((shift, (1 << w) - 1))
+            shift += w
+        self.tables = [defaultdict(list) for _ in self.bands]
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self.tables[0].values())
+
+    def add(self, key, h):
+        for (shift, mask), table in zip(self.bands, self.tables):
+            table[(h >> shift) & mask].append((key, h))
+
+    def query(self, h):
+        """
+        [(key, distance), ...] of stored hashes within `max_distance` of `h`.
+        """
+        found = {}
+        for (shift, mask), table in zip(self.bands, self.tables):
+            for key, other in table.get((h >> shift) & mask, ()):
+                if key not in found:
+                    distance = hamming(h, other)
+                    if distance <= self.max_distance:
+                        found[key] = distance
+        return sorted(found.items(), key=lambda item: item[1])
+
+
+def group_duplicates(pairs):
+    """
+    Merge (a, b) near-duplicate pairs into sorted groups of connected keys.
+    """
+    parent = {}
+
+    def find(x):
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in pairs:
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[max(ra, rb)] = min(ra, rb)
+
+    groups = defaultdict(list)
+    for key in parent:
+        groups[find(key)].append(key)
+    return sorted(sorted(group) for group in groups.values())
@@ -0,0 +1,290 @@
+"""
+label_index.py
+---------------------------------
+Persistent SQLite index of every YOLO label file under `labels/`.
+
+count_classes.py, prepare_augmentation_list.py, extract_nth_class.py and
+rescue_class.py used to walk and parse every .txt under labels/ on each run.
+They now share this index instead: it is built in one pass the first time and
+afterwards only files whose mtime or size changed are re-parsed (one
+`os.scandir` of labels/, no reads of unchanged files).
+
+📌 Schema (`crop_data/label_index.sqlite` by default):
+- files(id, base, mtime_ns, size)
+- boxes(file_id, line_no, class_id, x, y, w, h)   (indexed on class_id)
+
+Lines that are not `<class_id> <x> <y> <w> <h>` are skipped.
+
+Usage:
+    from label_index import open_index, scan_label_files
+    with open_index(LABELS_DIR) as index:
+        counts = index.class_counts()
+        bases = index.files_with_class(9)
+        for base, classes in index.files_with_classes([3, 9]):   # streamed
+            ...
+
+    for base, rows in scan_label_files(LABELS_DIR, [3, 9]):   # streamed, no index
+        ...
+
+    python label_index.py ~/Desktop/crop_data/labels   # build/refresh only
+"""
+
+import os
+import sqlite3
+import sys
+from pathlib import Path
+
+INDEX_NAME = "label_index.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id       INTEGER PRIMARY KEY,
+    base     TEXT UNIQUE NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size     INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS boxes (
+    file_id  INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    line_no  INTEGER NOT NULL,
+    class_id INTEGER NOT NULL,
+    x REAL NOT NULL, y REAL NOT NULL, w REAL NOT NULL, h REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS boxes_class ON boxes(class_id);
+CREATE INDEX IF NOT EXISTS boxes_file ON boxes(file_id);
+"""
+
+
+def parse_label_lines(text):
+    """
+    Yield (line_no, class_id, x, y, w, h) for every well-formed YOLO line.
+    """
+    for line_no, line in enumerate(text.splitlines()):
+        parts = line.split()
+        if len(parts) != 5:
+            continue
+        try:
+            yield (line_no, int(parts[0]), float(parts[1]), float(parts[2]),
+                   float(parts[3]), float(parts[4]))
+        except ValueError:
+            continue
+
+
+def scan_label_files(labels_dir, class_ids=None):
+    """
+    Stream (base, rows) over the .txt files of `labels_dir` straight from disk,
+    one file in memory at a time (rows as from `parse_label_lines`). With
+    `class_ids`, only files with a box of one of those classes are yielded.
+    For scripts that want a single pass without the index.
+    """
+    wanted = None if class_ids is None else {int(c) for c in class_ids}
+    with os.scandir(labels_dir) as entries:
+        for entry in entries:
+            if not entry.name.endswith(".txt"):
+                continue
+            with open(entry.path, "r") as f:
+                rows = list(parse_label_lines(f.read()))
+            if wanted is None or any(row[1] in wanted for row in rows):
+                yield entry.name[:-4], rows
+
+
+class LabelIndex:
+    """
+    SQLite-backed index over a YOLO labels/ directory.
+    """
+
+    def __init__(self, labels_dir, db_path=None):
+        self.labels_dir = Path(labels_dir)
+        self.db_path = Path(db_path) if db_path else self.labels_dir.parent / INDEX_NAME
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    # --- BUILD / UPDATE ---
+    def refresh(self):
+        """
+        Bring the index in line with labels/: parse new or modified files and
+        drop deleted ones. Returns (parsed, removed).
+        """
+        known = {base: (file_id, mtime_ns, size) for file_id, base, mtime_ns, size
+                 in self.conn.execute("SELECT id, base, mtime_ns, size FROM files")}
+
+        changed = []
+        seen = set()
+        with os.scandir(self.labels_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".txt"):
+                    continue
+                base = entry.name[:-4]
+                seen.add(base)
+                st = entry.stat()
+                old = known.get(base)
+                if old is None or old[1] != st.st_mtime_ns or old[2] != st.st_size:
+                    changed.append((base, entry.path, st.st_mtime_ns, st.st_size))
+
+        removed = [known[base][0] for base in known.keys() - seen]
+
+        with self.conn:
+            self.conn.executemany("DELETE FROM files WHERE id = ?", ((i,) for i in removed))
+            for base, path, mtime_ns, size in changed:
+                with open(path, "r") as f:
+                    rows = list(parse_label_lines(f.read()))
+                self.conn.execute(
+                    "INSERT INTO files (base, mtime_ns, size) VALUES (?, ?, ?) "
+                    "ON CONFLICT(base) DO UPDATE SET mtime_ns = excluded.mtime_ns, size = excluded.size",
+                    (base, mtime_ns, size))
+                file_id = self.conn.execute("SELECT id FROM files WHERE base = ?", (base,)).fetchone()[0]
+                self.conn.execute("DELETE FROM boxes WHERE file_id = ?", (file_id,))
+                self.conn.executemany(
+                    "INSERT INTO boxes (file_id, line_no, class_id, x, y, w, h) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    ((file_id,) + row for row in rows))
+
+        return len(changed), len(removed)
+
+    # --- QUERIES ---
+    def bases(self):
+        """All indexed label base names, sorted."""
+        return [row[0] for row in self.conn.execute("SELECT base FROM files ORDER BY base")]
+
+    def file_count(self):
+        """Number of indexed label files."""
+        return self.conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def empty_file_count(self):
+        """Number of label files without a single box."""
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM files WHERE id NOT IN (SELECT file_id FROM boxes)").fetchone()[0]
+
+    def class_counts(self):
+        """{class_id: number of box instances}."""
+        return dict(self.conn.execute(
+            "SELECT class_id, COUNT(*) FROM boxes GROUP BY class_id ORDER BY class_id"))
+
+    def image_counts(self):
+        """{class_id: number of label files containing the class}."""
+        return dict(self.conn.execute(
+            "SELECT class_id, COUNT(DISTINCT file_id) FROM boxes GROUP BY class_id ORDER BY class_id"))
+
+    def cooccurrence(self):
+        """{(class_a, class_b): number of label files containing both} (a == b: images per class)."""
+        return {(a, b): n for a, b, n in self.conn.execute(
+            "WITH present AS (SELECT DISTINCT file_id, class_id FROM boxes) "
+            "SELECT p.class_id, q.class_id, COUNT(*) FROM present p "
+            "JOIN present q ON q.file_id = p.file_id GROUP BY p.class_id, q.class_id")}
+
+    def files_with_class(self, class_id):
+        """Base names of label files with at least one box of `class_id`."""
+        return [row[0] for row in self.conn.execute(
+            "SELECT DISTINCT f.base FROM boxes b JOIN files f ON f.id = b.file_id "
+            "WHERE b.class_id = ? ORDER BY f.base", (int(class_id),))]
+
+    def files_with_classes(self, class_ids=None):
+        """
+        Yield (base, [class_id, ...]) for label files with a box of any of
+        `class_ids` (all classes if None), in base order — one streamed query.
+        """
+        where, params = "", ()
+        if class_ids is not None:
+            params = tuple(int(c) for c in class_ids)
+            if not params:
+                return
+            where = f"WHERE b.class_id IN ({', '.join('?' * len(params))}) "
+        rows = self.conn.execute(
+            "SELECT f.base, b.class_id FROM boxes b JOIN files f ON f.id = b.file_id "
+            f"{where}GROUP BY b.file_id, b.class_id ORDER BY f.base, b.class_id", params)
+        current, classes = None, []
+        for base, class_id in rows:
+            if base != current:
+                if current is not None:
+                    yield current, classes
+                current, classes = base, []
+            classes.append(class_id)
+        if current is not None:
+            yield current, classes
+
+    def single_class_files(self):
+        """{class_id: [base, ...]} for label files whose boxes all share one class."""
+        result = {}
+        for class_id, base in self.conn.execute(
+                "SELECT MIN(b.class_id), f.base FROM boxes b JOIN files f ON f.id = b.file_id "
+                "GROUP BY b.file_id HAVING COUNT(DISTINCT b.class_id) = 1 ORDER BY f.base"):
+            result.setdefault(class_id, []).append(base)
+        return result
+
+    def file_class_counts(self):
+        """
+        Yield (base, {class_id: instances}) for every indexed label file,
+        including empty ones, in base order.
+        """
+        rows = self.conn.execute(
+            "SELECT f.base, b.class_id, COUNT(b.class_id) FROM files f "
+            "LEFT JOIN boxes b ON b.file_id = f.id GROUP BY f.id, b.class_id ORDER BY f.base")
+        current, counts = None, {}
+        for base, class_id, n in rows:
+            if base != current:
+                if current is not None:
+                    yield current, counts
+                current, counts = base, {}
+            if class_id is not None:
+                counts[class_id] = n
+        if current is not None:
+            yield current, counts
+
+    def file_ids(self):
+        """{file_id: base} of every indexed label file."""
+        return dict(self.conn.execute("SELECT id, base FROM files"))
+
+    def box_classes(self):
+        """[(file_id, class_id), ...] of every box — one flat query for vectorized code."""
+        return self.conn.execute("SELECT file_id, class_id FROM boxes").fetchall()
+
+    def iter_boxes(self):
+        """
+        Yield (base, [(class_id, x, y, w, h), ...]) for every label file with
+        boxes, in base order — one streamed query.
+        """
+        rows = self.conn.execute(
+            "SELECT f.base, b.class_id, b.x, b.y, b.w, b.h FROM boxes b JOIN files f ON f.id = b.file_id "
+            "ORDER BY f.base, b.line_no")
+        current, boxes = None, []
+        for base, *box in rows:
+            if base != current:
+                if current is not None:
+                    yield current, boxes
+                current, boxes = base, []
+            boxes.append(tuple(box))
+        if current is not None:
+            yield current, boxes
+
+    def boxes(self, base):
+        """[(class_id, x, y, w, h), ...] of one label file, in file order."""
+        return list(self.conn.execute(
+            "SELECT b.class_id, b.x, b.y, b.w, b.h FROM boxes b JOIN files f ON f.id = b.file_id "
+            "WHERE f.base = ? ORDER BY b.line_no", (base,)))
+
+
+def open_index(labels_dir, db_path=None):
+    """
+    Open the index for `labels_dir` and refresh it before returning.
+    """
+    index = LabelIndex(labels_dir, db_path)
+    parsed, removed = index.refresh()
+    if parsed or removed:
+        print(f"🗂️ Label index: parsed {parsed} new/changed, dropped {removed} deleted → {index.db_path}")
+    return index
+
+
+if __name__ == "__main__":
+    labels_dir = Path(sys.argv[1]) if len(sys.argv) > 1 else Path.home() / "Desktop" / "crop_data" / "labels"
+    with open_index(labels_dir) as index:
+        print(f"✅ {len(index.bases())} label files indexed in {index.db_path}")
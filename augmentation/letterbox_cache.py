@@ -0,0 +1,243 @@
+"""
+letterbox_cache.py
+---------------------------------
+Writes letterboxed copies of every split image at the training resolution
+(640 by default, like training.py) and rescales the YOLO labels to match.
+
+The raw and augmented JPEGs have arbitrary sizes, so every epoch decodes a
+large image and resizes it again; on Colab with `workers=2` training becomes
+CPU-bound. With images already at 640×640 (aspect ratio kept, gray 114
+padding exactly like YOLOv8/inference), Ultralytics decodes small JPEGs and
+its own resize is a no-op.
+
+📌 Cache:
+- Each letterboxed image is stored once under `cache/` keyed on
+  (content hash of the source image, imgsz, JPEG quality).
+- Source hashes are cached by (path, size, mtime), so a repeated run reads
+  no image and encodes nothing; it only re-links files and rewrites labels
+  that changed.
+- Split folders hardlink into the cache (see materialize.py), so an image
+  that appears in several runs or splits is stored once.
+- Encoding runs on all cores (`--workers`).
+
+💡 Output (`crop_data/letterbox_640/` by default):
+    letterbox_640/
+    ├── cache/ab/<hash>_640_q95.jpg
+    ├── train/images, train/labels
+    ├── val/images, val/labels
+    ├── test/images, test/labels
+    └── data.yaml       (point training at this one)
+
+Usage:
+    python letterbox_cache.py --root ~/Desktop/crop_data
+    python letterbox_cache.py --root /data/crop_data --imgsz 640 --quality 95 --workers 8
+"""
+
+import argparse
+import os
+import time
+from multiprocessing import Pool
+from pathlib import Path
+
+import cv2
+import numpy as np
+import yaml
+
+from bbox_utils import format_yolo, parse_yolo, voc_to_yolo, yolo_to_voc
+from materialize import LINK_MODES, Materializer
+from pack_shards import label_path_for, split_image_paths
+from pipeline import PipelineState
+
+# --- CONFIG ---
+ROOT = Path.home() / "Desktop" / "crop_data"
+IMGSZ = 640          # training.py: imgsz=640
+PAD_VALUE = 114      # YOLOv8 letterbox fill
+JPEG_QUALITY = 95
+
+GEOMETRY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS geometry (
+    key    TEXT PRIMARY KEY,
+    width  INTEGER NOT NULL,
+    height INTEGER NOT NULL
+);
+"""
+
+
+# --- LETTERBOX ---
+def letterbox_geometry(width, height, size):
+    """
+    (scale, new_w, new_h, left, top) — same rounding as inference/yolo_onnx.py.
+    """
+    scale = min(size / height, size / width)
+    new_w, new_h = int(round(width * scale)), int(round(height * scale))
+    left = int(round((size - new_w) / 2 - 0.1))
+    top = int(round((size - new_h) / 2 - 0.1))
+    return scale, new_w, new_h, left, top
+
+
+def letterbox_file(job):
+    """
+    Worker: decode, letterbox and encode one source image into the cache.
+    Returns (key, width, height) of the source, or (key, None, None).
+    """
+    key, src, dest, size, quality = job
+    image = cv2.imread(src)
+    if image is None:
+        return key, None, None
+    h, w = image.shape[:2]
+    _, new_w, new_h, left, top = letterbox_geometry(w, h, size)
+    if (new_w, new_h) != (w, h):
+        interpolation = cv2.INTER_AREA if new_w < w else cv2.INTER_LINEAR
+        image = cv2.resize(image, (new_w, new_h), interpolation=interpolation)
+    canvas = np.full((size, size, 3), PAD_VALUE, dtype=np.uint8)
+    canvas[top:top + new_h, left:left + new_w] = image
+
+    ok, encoded = cv2.imencode(".jpg", canvas, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        return key, None, None
+    Path(dest).parent.mkdir(parents=True, exist_ok=True)
+    tmp = f"{dest}.tmp{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(encoded.tobytes())
+    os.replace(tmp, dest)
+    return key, w, h
+
+
+def init_worker():
+    cv2.setNumThreads(1)
+
+
+def letterbox_labels(text, width, height, size):
+    """
+    Rescale YOLO label text of a (width × height) image to its letterboxed copy.
+    """
+    class_ids, boxes = parse_yolo(text)
+    if not len(class_ids):
+        return ""
+    scale, _, _, left, top = letterbox_geometry(width, height, size)
+    voc = yolo_to_voc(boxes, width, height) * scale + np.array([left, top, left, top])
+    return format_yolo(class_ids, voc_to_yolo(voc, size, size))
+
+
+def write_if_changed(path, text):
+    """Write `text` unless the file already holds it. Returns True if written."""
+    try:
+        if path.read_text() == text:
+            return False
+    except FileNotFoundError:
+        pass
+    path.write_text(text)
+    return True
+
+
+# --- MAIN ---
+def main():
+    parser = argparse.ArgumentParser(description="Letterboxed image cache at training resolution")
+    parser.add_argument("--root", type=Path, default=ROOT, help="crop_data folder")
+    parser.add_argument("--data", type=Path, default=None, help="data.yaml (default: <root>/splits/data.yaml)")
+    parser.add_argument("--imgsz", type=int, default=IMGSZ)
+    parser.add_argument("--quality", type=int, default=JPEG_QUALITY, help="JPEG quality of the cached copies")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--out", type=Path, default=None, help="Output folder (default: <root>/letterbox_<imgsz>)")
+    parser.add_argument("--link-mode", choices=LINK_MODES, default="hardlink")
+    args = parser.parse_args()
+
+    data_yaml = args.data or args.root / "splits" / "data.yaml"
+    out_root = args.out or args.root / f"letterbox_{args.imgsz}"
+    cache_dir = out_root / "cache"
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    with open(data_yaml, "r") as f:
+        data = yaml.safe_load(f)
+
+    splits = {}
+    for split in ("train", "val", "test"):
+        try:
+            splits[split] = split_image_paths(data_yaml, split)
+        except (KeyError, FileNotFoundError):
+            continue
+
+    start = time.perf_counter()
+    state = PipelineState(out_root / "cache.sqlite")
+    state.conn.executescript(GEOMETRY_SCHEMA)
+
+    # --- HASH SOURCES (only new/changed files are read) ---
+    all_images = [p for paths in splits.values() for p in paths]
+    digests = state.file_digests(all_images)
+    geometry = dict((key, (w, h)) for key, w, h in state.conn.execute("SELECT key, width, height FROM geometry"))
+
+    def cache_path(key):
+        return cache_dir / key[:2] / f"{key}.jpg"
+
+    keys = {}
+    jobs = {}
+    for path in all_images:
+        digest = digests[str(path)]
+        if digest == "missing":
+            continue
+        key = f"{digest}_{args.imgsz}_q{args.quality}"
+        keys[path] = key
+        if key not in jobs and (key not in geometry or not cache_path(key).exists()):
+            jobs[key] = (key, str(path), str(cache_path(key)), args.imgsz, args.quality)
+
+    # --- ENCODE MISSING ENTRIES ON ALL CORES ---
+    failed = set()
+    if jobs:
+        print(f"🖼️ Letterboxing {len(jobs)} new images to {args.imgsz}px on {args.workers} worker(s)")
+        with Pool(args.workers, initializer=init_worker) as pool:
+            results = list(pool.imap_unordered(letterbox_file, jobs.values(), chunksize=16))
+        with state.conn:
+            for key, w, h in results:
+                if w is None:
+                    failed.add(key)
+                    continue
+                geometry[key] = (w, h)
+                state.conn.execute("INSERT OR REPLACE INTO geometry (key, width, height) VALUES (?, ?, ?)",
+                                   (key, w, h))
+    reused = len(set(keys.values())) - len(jobs)
+
+    # --- LINK IMAGES + WRITE RESCALED LABELS PER SPLIT ---
+    placer = Materializer(args.link_mode)
+    labels_written = 0
+    for split, paths in splits.items():
+        images_dir = out_root / split / "images"
+        labels_dir = out_root / split / "labels"
+        images_dir.mkdir(parents=True, exist_ok=True)
+        labels_dir.mkdir(parents=True, exist_ok=True)
+        wanted = set()
+        for path in paths:
+            key = keys.get(path)
+            if key is None or key in failed:
+                print(f"⚠️ Unreadable image skipped: {path}")
+                continue
+            label_path = label_path_for(path)
+            text = label_path.read_text() if label_path.exists() else ""
+            width, height = geometry[key]
+            placer.place(cache_path(key), images_dir / f"{path.stem}.jpg")
+            labels_written += write_if_changed(labels_dir / f"{path.stem}.txt",
+                                               letterbox_labels(text, width, height, args.imgsz))
+            wanted.add(path.stem)
+        # Drop samples that left this split since the last run
+        for folder, suffix in ((images_dir, ".jpg"), (labels_dir, ".txt")):
+            for file in folder.glob(f"*{suffix}"):
+                if file.stem not in wanted:
+                    file.unlink()
+        print(f"📦 {split}: {len(wanted)} samples")
+    state.close()
+
+    # --- data.yaml FOR TRAINING ---
+    yaml_data = {
+        "path": str(out_root.resolve()),
+        **{split: f"{split}/images" for split in splits},
+        "names": data.get("names", {}),
+    }
+    with open(out_root / "data.yaml", "w") as f:
+        yaml.dump(yaml_data, f, default_flow_style=False)
+
+    print(f"♻️ {reused} cached images reused, {len(jobs) - len(failed)} encoded, "
+          f"{labels_written} label files updated")
+    print(placer.summary())
+    print(f"\n✅ Done in {time.perf_counter() - start:.1f}s. Train with {out_root / 'data.yaml'}")
+
+
+if __name__ == "__main__":
+    main()
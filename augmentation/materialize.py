@@ -0,0 +1,123 @@
+"""
+materialize.py
+---------------------------------
+Place dataset files into a new folder without duplicating their bytes.
+
+merge_augmented_with_original.py and split_dataset.py used to `shutil.copy`
+every JPEG, tripling the disk footprint of crop_data. `Materializer` puts a
+file at its destination with the requested link mode and falls back to the
+next option when the filesystem refuses it:
+
+    hardlink → reflink → copy     (default; same inode, zero extra bytes)
+    reflink  → copy               (copy-on-write clone: btrfs, XFS, APFS)
+    symlink  → copy               (points back at the source path)
+    copy                          (plain byte copy, the old behaviour)
+
+A mode that fails with a filesystem-level error (e.g. hardlinks across
+devices) is not retried for the rest of the run.
+
+One Materializer may be shared by a thread pool (extract_nth_class.py).
+
+⚠️ Hardlinked files share their contents with the source: edit them by
+writing a new file and renaming it over the old one, never in place.
+
+Usage:
+    from materialize import Materializer, LINK_MODES
+    placer = Materializer("hardlink")
+    placer.place(src, dest)
+    print(placer.summary())
+"""
+
+import errno
+import os
+import shutil
+import sys
+import threading
+from collections import Counter
+
+LINK_MODES = ("copy", "hardlink", "symlink", "reflink")
+
+FALLBACKS = {
+    "hardlink": ("hardlink", "reflink", "copy"),
+    "reflink": ("reflink", "copy"),
+    "symlink": ("symlink", "copy"),
+    "copy": ("copy",),
+}
+
+# Errors that mean "this filesystem can't do that", as opposed to a problem
+# with one particular file.
+UNSUPPORTED = {errno.EXDEV, errno.EPERM, errno.EACCES, errno.EOPNOTSUPP,
+               errno.ENOTTY, errno.EINVAL, errno.ENOSYS, errno.EMLINK}
+
+FICLONE = 0x40049409   # Linux ioctl: share extents of src_fd into dest_fd
+
+
+def reflink(src, dest):
+    """
+    Copy-on-write clone of `src` at `dest` (Linux FICLONE only).
+    """
+    if not sys.platform.startswith("linux"):
+        raise OSError(errno.EOPNOTSUPP, "reflink is only implemented on Linux", str(dest))
+    import fcntl
+
+    with open(src, "rb") as s, open(dest, "wb") as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            os.unlink(dest)
+            raise
+    shutil.copystat(src, dest)
+
+
+PLACERS = {
+    "hardlink": os.link,
+    "reflink": reflink,
+    "symlink": lambda src, dest: os.symlink(os.path.abspath(src), dest),
+    "copy": shutil.copy,
+}
+
+
+class Materializer:
+    """
+    Places files with a preferred link mode, falling back as needed.
+    """
+
+    def __init__(self, mode="hardlink"):
+        if mode not in FALLBACKS:
+            raise ValueError(f"Unknown link mode {mode!r}; choose from {', '.join(LINK_MODES)}")
+        self.mode = mode
+        self.disabled = set()
+        self.used = Counter()
+        self.lock = threading.Lock()
+
+    def place(self, src, dest):
+        """
+        Put `src` at `dest`, replacing any existing file. Returns the mode used.
+        """
+        if os.path.lexists(dest):
+            if self.mode == "hardlink" and not os.path.islink(dest) and os.path.samefile(src, dest):
+                with self.lock:
+                    self.used["hardlink"] += 1
+                return "hardlink"
+            os.unlink(dest)
+
+        for mode in FALLBACKS[self.mode]:
+            if mode in self.disabled:
+                continue
+            try:
+                PLACERS[mode](src, dest)
+            except OSError as e:
+                if mode == "copy" or e.errno not in UNSUPPORTED:
+                    raise
+                with self.lock:
+                    if mode not in self.disabled:
+                        self.disabled.add(mode)
+                        print(f"⚠️ {mode} not supported here ({e.strerror}); falling back")
+                continue
+            with self.lock:
+                self.used[mode] += 1
+            return mode
+
+    def summary(self):
+        return "🔗 Placed files: " + ", ".join(f"{n} by {mode}" for mode, n in self.used.most_common())
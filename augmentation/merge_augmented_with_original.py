@@ -14,11 +14,18 @@ WHAT IT DOES:
 
 2. Creates the final dataset folders if they do not exist.
 
-3. Copies all original images and labels into the final dataset.
+3. Places all original images and labels into the final dataset.
 
-4. Copies all augmented images and labels into the final dataset.
+4. Places all augmented images and labels into the final dataset.
 
-5. Prints a success message when done.
+5. With `--prune`, removes files from the final dataset that no longer exist
+   in either source (e.g. augmented samples of a class that was regenerated).
+
+6. Prints a success message when done.
+
+Files are placed with `--link-mode` (see materialize.py). The default,
+`hardlink`, adds no extra bytes on disk and falls back to reflink, then to a
+plain copy, when the filesystem does not support it.
 
 ---
 HOW TO RUN:
@@ -33,6 +40,8 @@ HOW TO RUN:
 
 2. Run the script from your terminal:
        python merge_datasets.py
+       python merge_datasets.py --link-mode copy      # independent copies
+       python merge_datasets.py --prune               # also drop stale files
 
 3. The merged dataset will appear in:
        Desktop/crop_data/final_dataset/
@@ -43,11 +52,23 @@ HOW TO RUN:
 
 """
 
-import shutil
+import argparse
 from pathlib import Path
 
+from materialize import LINK_MODES, Materializer
+
 # === PATHS ===
 ROOT = Path.home() / "Desktop" / "crop_data"
+
+parser = argparse.ArgumentParser(description="Merge original + augmented data into final_dataset/")
+parser.add_argument("--root", type=Path, default=ROOT, help="crop_data folder")
+parser.add_argument("--link-mode", choices=LINK_MODES, default="hardlink",
+                    help="How files are placed (falls back to cheaper-to-support modes)")
+parser.add_argument("--prune", action="store_true",
+                    help="Remove files in final_dataset/ that are in neither source")
+args = parser.parse_args()
+
+ROOT = args.root
 ORIG_IMG = ROOT / "images"
 ORIG_LBL = ROOT / "labels"
 AUG_IMG = ROOT / "augmented" / "images"
@@ -59,18 +80,33 @@ FINAL_LBL = ROOT / "final_dataset" / "labels"
 FINAL_IMG.mkdir(parents=True, exist_ok=True)
 FINAL_LBL.mkdir(parents=True, exist_ok=True)
 
-# === COPY ORIGINAL ===
+placer = Materializer(args.link_mode)
+
+# === PLACE ORIGINAL ===
 for file in ORIG_IMG.glob("*.jpg"):
-    shutil.copy(file, FINAL_IMG / file.name)
+    placer.place(file, FINAL_IMG / file.name)
 
 for file in ORIG_LBL.glob("*.txt"):
-    shutil.copy(file, FINAL_LBL / file.name)
+    placer.place(file, FINAL_LBL / file.name)
 
-# === COPY AUGMENTED ===
+# === PLACE AUGMENTED ===
 for file in AUG_IMG.glob("*.jpg"):
-    shutil.copy(file, FINAL_IMG / file.name)
+    placer.place(file, FINAL_IMG / file.name)
 
 for file in AUG_LBL.glob("*.txt"):
-    shutil.copy(file, FINAL_LBL / file.name)
+    placer.place(file, FINAL_LBL / file.name)
+
+# === PRUNE STALE FILES ===
+if args.prune:
+    removed = 0
+    for final_dir, sources, pattern in [(FINAL_IMG, (ORIG_IMG, AUG_IMG), "*.jpg"),
+                                        (FINAL_LBL, (ORIG_LBL, AUG_LBL), "*.txt")]:
+        for file in final_dir.glob(pattern):
+            if not any((src / file.name).exists() for src in sources):
+                file.unlink()
+                removed += 1
+    print(f"🧹 Pruned {removed} stale files")
+
+print(placer.summary())
 
 print("\n✅ DONE: All original + augmented data merged to /final_dataset/")
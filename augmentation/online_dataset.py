@@ -0,0 +1,407 @@
+"""
+online_dataset.py
+---------------------------------
+On-the-fly augmentation at training time, instead of materializing augmented
+JPEGs with augment_with_albumentations.py.
+
+The materialized route writes every synthetic sample as a JPEG, merges,
+splits and copies it to Drive: disk, I/O and a JPEG generation loss per
+sample. Here the same `A.Compose` pipeline (transforms.Augmenter, with its
+box-safe fallback) runs lazily in the data-loader workers and nothing is
+written to disk.
+
+📌 How it matches the materialized dataset:
+- The per-image quotas come from the same planner as prepare_augmentation_list.py
+  (balance_planner.py over the label index, near-duplicates left out), so
+  the class balance is taken from the label counts exactly as before.
+- `ClassBalancedSampler` draws image i with weight 1 + quota[i] (with
+  replacement), `len = sum of weights` — the size of the materialized
+  dataset. A drawn image is augmented with probability quota / (1 + quota)
+  and returned as-is otherwise, so in expectation an epoch sees every
+  original once plus `quota` augmented copies, like final_dataset/.
+- Every draw carries its own seed from the sampler (seeded per epoch), so an
+  epoch is reproducible regardless of which worker handles which sample.
+
+📌 Loading:
+- `make_loader` wraps both in a `torch.utils.data.DataLoader` with worker
+  processes, `prefetch_factor` batches prefetched per worker and persistent
+  workers (decoded images stay in each worker's ImageCache across epochs).
+- Samples are letterboxed to `imgsz` (same geometry as letterbox_cache.py and
+  inference) and collated YOLO-style: images (B, 3, H, W) uint8 RGB and
+  targets (N, 6) = [batch index, class, x, y, w, h].
+- Without PyTorch, `prefetch_batches` gives the same batches from a
+  multiprocessing pool (used by the benchmark on CPU-only boxes).
+
+⚙️ Requirements:
+- Python 3.8+, OpenCV (cv2), NumPy, Albumentations
+- PyTorch for `make_loader` (optional for the benchmark)
+
+💡 Ultralytics `model.train()` builds its own dataset from folders, so
+training.py keeps using the materialized splits; this loader is for custom
+PyTorch training loops.
+
+Usage:
+    from online_dataset import OnlineAugmentDataset, ClassBalancedSampler, make_loader
+    dataset = OnlineAugmentDataset("crop_data", target_count=500)
+    sampler = ClassBalancedSampler(dataset.weights, seed=42)
+    loader = make_loader(dataset, sampler, batch_size=16, workers=4)
+    for epoch in range(epochs):
+        sampler.set_epoch(epoch)
+        for images, targets in loader:
+            ...
+
+    python online_dataset.py --root ~/Desktop/crop_data --batches 50 --workers 4   # benchmark
+"""
+
+import argparse
+import os
+import random
+import time
+from collections import deque
+from multiprocessing import Pool
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from balance_planner import plan_quotas
+from bbox_utils import clip_voc, voc_to_yolo, yolo_to_voc
+from dedup_images import load_dropped
+from image_cache import ImageCache
+from label_index import open_index
+from letterbox_cache import IMGSZ, PAD_VALUE, letterbox_geometry
+from transforms import Augmenter
+
+# --- CONFIG ---
+ROOT = Path.home() / "Desktop" / "crop_data"
+TARGET_COUNT = 500      # Images per class, as in prepare_augmentation_list.py
+SEED = 42
+BATCH_SIZE = 16         # training.py: batch=16
+PREFETCH_FACTOR = 4     # Batches prefetched per worker
+CACHE_BYTES = 512 << 20   # Decoded-image budget per worker
+
+
+# --- SAMPLES ---
+def letterbox(image, class_ids, voc_boxes, size):
+    """
+    Letterbox an image to size × size and return (image, YOLO targets (N, 5)).
+    """
+    h, w = image.shape[:2]
+    scale, new_w, new_h, left, top = letterbox_geometry(w, h, size)
+    if (new_w, new_h) != (w, h):
+        interpolation = cv2.INTER_AREA if new_w < w else cv2.INTER_LINEAR
+        image = cv2.resize(image, (new_w, new_h), interpolation=interpolation)
+    canvas = np.full((size, size, 3), PAD_VALUE, dtype=np.uint8)
+    canvas[top:top + new_h, left:left + new_w] = image
+    boxes = np.asarray(voc_boxes, dtype=np.float64).reshape(-1, 4) * scale + np.array([left, top, left, top])
+    targets = np.zeros((len(boxes), 5), dtype=np.float32)
+    targets[:, 0] = class_ids
+    targets[:, 1:] = voc_to_yolo(boxes, size, size)
+    return canvas, targets
+
+
+def to_chw_rgb(image):
+    """BGR HWC (OpenCV) → contiguous RGB CHW, the layout YOLO models take."""
+    return np.ascontiguousarray(image[:, :, ::-1].transpose(2, 0, 1))
+
+
+class OnlineAugmentDataset:
+    """
+    Map-style dataset over the raw crop_data images (PyTorch-compatible:
+    `__len__` + `__getitem__`). Items are indexed by `(index, sample seed)`
+    pairs from `ClassBalancedSampler`; a plain int index returns the
+    unaugmented image.
+    """
+
+    def __init__(self, root=ROOT, target_count=TARGET_COUNT, imgsz=IMGSZ,
+                 always_augment=False, cache_bytes=CACHE_BYTES):
+        root = Path(root)
+        self.images_dir = root / "images"
+        self.labels_dir = root / "labels"
+        self.imgsz = imgsz
+        self.always_augment = always_augment
+        self.cache_bytes = cache_bytes
+
+        with open_index(self.labels_dir) as index:
+            file_bases = index.file_ids()
+            pairs = np.array(index.box_classes(), dtype=np.int64).reshape(-1, 2)
+        num_files = max(file_bases, default=-1) + 1
+        num_classes = int(pairs[:, 1].max()) + 1 if len(pairs) else 0
+
+        # Same eligibility as prepare_augmentation_list.py
+        duplicates = load_dropped(root)
+        available = {path.stem for path in self.images_dir.glob("*.jpg")}
+        eligible = np.zeros(num_files, dtype=bool)
+        for file_id, base in file_bases.items():
+            eligible[file_id] = base in available and base not in duplicates
+
+        plan = plan_quotas(pairs[:, 0], pairs[:, 1], num_files, num_classes, target_count, eligible)
+        file_ids = sorted(np.flatnonzero(eligible), key=lambda i: file_bases[i])
+        self.bases = [file_bases[i] for i in file_ids]
+        self.quota = plan.quota[file_ids]
+        self.plan = plan
+
+        self._cache = None
+        self._augmenter = None
+
+    @property
+    def weights(self):
+        """Sampling weight per image: the original plus its planned copies."""
+        return 1 + self.quota
+
+    def __len__(self):
+        return len(self.bases)
+
+    def __getstate__(self):
+        # Each worker builds its own cache and pipeline
+        state = dict(self.__dict__)
+        state["_cache"] = None
+        state["_augmenter"] = None
+        return state
+
+    def load(self, base):
+        """(image, class_ids, VOC boxes) of one base image, or None if unreadable."""
+        if self._cache is None:
+            self._cache = ImageCache(self.images_dir, self.labels_dir, self.cache_bytes)
+        image, labels = self._cache.get(base)
+        if image is None:
+            return None
+        class_ids, boxes = labels
+        h, w = image.shape[:2]
+        return image, class_ids, clip_voc(yolo_to_voc(boxes, w, h), w, h)
+
+    def __getitem__(self, item):
+        """
+        (image (3, imgsz, imgsz) uint8 RGB, targets (N, 5) [class, x, y, w, h], base).
+        """
+        index, seed = item if isinstance(item, tuple) else (item, None)
+        base = self.bases[index]
+        sample = self.load(base)
+        if sample is None:
+            raise FileNotFoundError(f"Image or label missing for {base}")
+        image, class_ids, voc = sample
+
+        quota = int(self.quota[index])
+        if seed is not None and len(class_ids) and (
+                self.always_augment or random.Random(seed).random() * (1 + quota) >= 1):
+            if self._augmenter is None:
+                self._augmenter = Augmenter()
+            self._augmenter.seed(seed)
+            aug = self._augmenter(image, voc, class_ids)
+            if aug is not None:
+                # Infeasible samples are served unaugmented rather than dropped
+                image, voc = aug["image"], aug["bboxes"]
+
+        image, targets = letterbox(image, class_ids, voc, self.imgsz)
+        return to_chw_rgb(image), targets, base
+
+
+class FolderDataset:
+    """
+    The materialized counterpart (final_dataset/ or a split): decode and
+    letterbox, no augmentation. Used as the benchmark baseline.
+    """
+
+    def __init__(self, folder, imgsz=IMGSZ):
+        folder = Path(folder)
+        self.images_dir = folder / "images"
+        self.labels_dir = folder / "labels"
+        self.imgsz = imgsz
+        self.bases = sorted(path.stem for path in self.images_dir.glob("*.jpg"))
+        self._cache = ImageCache(self.images_dir, self.labels_dir, max_bytes=0)
+
+    def __len__(self):
+        return len(self.bases)
+
+    def __getitem__(self, item):
+        index = item[0] if isinstance(item, tuple) else item
+        base = self.bases[index]
+        image, labels = self._cache.get(base)
+        if image is None:
+            raise FileNotFoundError(f"Image or label missing for {base}")
+        class_ids, boxes = labels
+        h, w = image.shape[:2]
+        image, targets = letterbox(image, class_ids, yolo_to_voc(boxes, w, h), self.imgsz)
+        return to_chw_rgb(image), targets, base
+
+
+# --- SAMPLING ---
+class ClassBalancedSampler:
+    """
+    Draws `num_samples` (index, sample seed) pairs with replacement,
+    proportional to `weights`; reseeded per epoch with `set_epoch`.
+    Works as a `torch.utils.data.Sampler` (iterable with a length).
+    """
+
+    def __init__(self, weights, num_samples=None, seed=SEED):
+        weights = np.asarray(weights, dtype=np.float64)
+        self.p = weights / weights.sum()
+        self.num_samples = int(weights.sum()) if num_samples is None else int(num_samples)
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        return self.num_samples
+
+    def __iter__(self):
+        rng = np.random.default_rng([self.seed, self.epoch])
+        indices = rng.choice(len(self.p), size=self.num_samples, p=self.p)
+        seeds = rng.integers(0, 1 << 32, size=self.num_samples, dtype=np.uint64)
+        return iter(zip(indices.tolist(), seeds.tolist()))
+
+
+class UniformSampler(ClassBalancedSampler):
+    """Every item once per epoch in shuffled order (the materialized baseline)."""
+
+    def __init__(self, size, seed=SEED):
+        super().__init__(np.ones(size), seed=seed)
+
+    def __iter__(self):
+        order = np.random.default_rng([self.seed, self.epoch]).permutation(self.num_samples)
+        return iter((i, None) for i in order.tolist())
+
+
+# --- LOADING ---
+def collate(batch):
+    """
+    Stack samples into (images (B, 3, H, W), targets (N, 6)) NumPy arrays;
+    targets rows are [batch index, class, x, y, w, h].
+    """
+    images = np.stack([image for image, _, _ in batch])
+    targets = [np.concatenate([np.full((len(t), 1), i, dtype=np.float32), t], axis=1)
+               for i, (_, t, _) in enumerate(batch)]
+    return images, np.concatenate(targets) if targets else np.zeros((0, 6), dtype=np.float32)
+
+
+def collate_torch(batch):
+    import torch
+
+    images, targets = collate(batch)
+    return torch.from_numpy(images), torch.from_numpy(targets)
+
+
+def init_worker(*_):
+    # One OpenCV thread per worker; the workers are the parallelism
+    cv2.setNumThreads(1)
+
+
+def make_loader(dataset, sampler, batch_size=BATCH_SIZE, workers=None, prefetch_factor=PREFETCH_FACTOR):
+    """
+    `torch.utils.data.DataLoader` with prefetching worker processes.
+    """
+    from torch.utils.data import DataLoader
+
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    return DataLoader(dataset, batch_size=batch_size, sampler=sampler, num_workers=workers,
+                      collate_fn=collate_torch, worker_init_fn=init_worker,
+                      prefetch_factor=prefetch_factor if workers else None,
+                      persistent_workers=workers > 0, pin_memory=False)
+
+
+_pool_dataset = None
+
+
+def _init_pool(dataset):
+    global _pool_dataset
+    init_worker()
+    _pool_dataset = dataset
+
+
+def _load_batch(items):
+    return collate([_pool_dataset[item] for item in items])
+
+
+def prefetch_batches(dataset, sampler, batch_size=BATCH_SIZE, workers=None, prefetch_factor=PREFETCH_FACTOR):
+    """
+    Batches like `make_loader`, as NumPy arrays, from a multiprocessing pool
+    keeping `workers × prefetch_factor` batches in flight (no PyTorch needed).
+    """
+    items = list(sampler)
+    batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    if workers <= 0:
+        for batch in batches:
+            yield collate([dataset[item] for item in batch])
+        return
+    with Pool(workers, initializer=_init_pool, initargs=(dataset,)) as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.apply_async(_load_batch, (batch,)))
+            if len(pending) >= workers * prefetch_factor:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+# --- BENCHMARK ---
+def bench(dataset, sampler, label, batches, batch_size, workers, prefetch_factor, use_torch):
+    """Samples per second over the first `batches` batches (after one warm-up batch)."""
+    if use_torch:
+        loader = make_loader(dataset, sampler, batch_size, workers, prefetch_factor)
+    else:
+        loader = prefetch_batches(dataset, sampler, batch_size, workers, prefetch_factor)
+    samples, start = 0, None
+    for i, (images, _) in enumerate(loader):
+        if start is None:
+            start = time.perf_counter()   # workers are up and the pipeline is warm
+            continue
+        samples += len(images)
+        if i >= batches:
+            break
+    seconds = time.perf_counter() - start if start else 0.0
+    rate = samples / seconds if seconds else 0.0
+    print(f"   {label:<14} {samples} samples in {seconds:.1f}s → {rate:.1f} samples/s")
+    return rate
+
+
+def folder_bytes(folder):
+    return sum(entry.stat().st_size for entry in os.scandir(folder)) if folder.exists() else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark online augmentation against the materialized dataset")
+    parser.add_argument("--root", type=Path, default=ROOT, help="crop_data folder")
+    parser.add_argument("--target-count", type=int, default=TARGET_COUNT, help="Images per class")
+    parser.add_argument("--imgsz", type=int, default=IMGSZ, help="Letterbox size")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--batches", type=int, default=50, help="Batches to time per loader")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Loader worker processes")
+    parser.add_argument("--prefetch", type=int, default=PREFETCH_FACTOR, help="Batches prefetched per worker")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--no-torch", action="store_true", help="Use the multiprocessing loader even if PyTorch is installed")
+    args = parser.parse_args()
+
+    try:
+        import torch  # noqa: F401
+        use_torch = not args.no_torch
+    except ImportError:
+        use_torch = False
+
+    dataset = OnlineAugmentDataset(args.root, args.target_count, args.imgsz)
+    sampler = ClassBalancedSampler(dataset.weights, seed=args.seed)
+    print(f"📦 {len(dataset)} base images, {len(sampler)} samples per epoch "
+          f"({int(dataset.quota.sum())} augmented); loader: {'PyTorch' if use_torch else 'multiprocessing'}, "
+          f"{args.workers} workers")
+    print("⏱️ Throughput (decode + augment/letterbox + collate):")
+    online = bench(dataset, sampler, "online", args.batches, args.batch_size, args.workers, args.prefetch, use_torch)
+
+    final = args.root / "final_dataset"
+    if (final / "images").exists():
+        folder = FolderDataset(final, args.imgsz)
+        materialized = bench(folder, UniformSampler(len(folder), args.seed), "materialized", args.batches,
+                             args.batch_size, args.workers, args.prefetch, use_torch)
+        if materialized:
+            print(f"   online / materialized: {online / materialized:.2f}×")
+    else:
+        print(f"   (no {final}; run the pipeline to compare against the materialized dataset)")
+
+    aug = args.root / "augmented"
+    print(f"💾 Disk: materialized augmented/ holds {folder_bytes(aug / 'images') / (1 << 20):.1f} MiB; "
+          f"online writes nothing")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+pack_shards.py
+---------------------------------
+Packs the train/valid/test splits written by split_dataset.py into a few
+large tar shards per split, for training and evaluation I/O.
+
+Colab training used to `cp -r` thousands of small JPEG/.txt pairs from Drive,
+and Ultralytics then opens each file separately: the run is bound on metadata
+I/O. A shard holds the raw image bytes and the YOLO label of many samples
+(WebDataset layout: `{key}.jpg` + `{key}.txt`, uncompressed, so every member
+can be read straight out of an mmap). Next to the shards each split gets an
+index (`index.npy` + `keys.txt`) with the byte offset of every member.
+
+Read them back with shard_reader.py (random access, streaming, or `unpack`
+into YOLO folders on the training machine). shard_reader.py and bbox_utils.py
+are copied next to the shards, so the training machine only needs the
+shards folder.
+
+Images without a label file are background samples for YOLO: they are packed
+with an empty label.
+
+📌 Output (`crop_data/shards/` by default):
+    shards/
+    ├── train/  train-000000.tar ... index.npy  keys.txt  meta.json
+    ├── val/
+    ├── test/
+    └── shard_reader.py, bbox_utils.py
+
+A shard is closed once it reaches `--max-mb` or `--max-samples`, whichever
+comes first. Tar headers carry fixed metadata (mtime 0, uid 0), so the same
+split always packs to byte-identical shards.
+
+Usage:
+    python pack_shards.py --root ~/Desktop/crop_data
+    python pack_shards.py --root /data/crop_data --max-mb 512 --max-samples 20000
+"""
+
+import argparse
+import io
+import json
+import shutil
+import tarfile
+import time
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+from shard_reader import INDEX_DTYPE
+
+# --- CONFIG ---
+ROOT = Path.home() / "Desktop" / "crop_data"
+SCRIPT_DIR = Path(__file__).resolve().parent
+READER_MODULES = ("shard_reader.py", "bbox_utils.py")   # Copied next to the shards
+MAX_SHARD_MB = 256
+MAX_SHARD_SAMPLES = 10_000
+
+
+# --- UTILITY ---
+def split_image_paths(data_yaml, split):
+    """
+    Image paths of one split of data.yaml (a folder or a .txt file list).
+    """
+    with open(data_yaml, "r") as f:
+        data = yaml.safe_load(f)
+    root = Path(data.get("path") or Path(data_yaml).parent)
+    entry = Path(data[split])
+    entry = entry if entry.is_absolute() else root / entry
+    if entry.suffix == ".txt":
+        with open(entry, "r") as f:
+            return [Path(line.strip()) for line in f if line.strip()]
+    return sorted(entry.glob("*.jpg"))
+
+
+def label_path_for(image_path):
+    """`.../images/x.jpg` → `.../labels/x.txt` (YOLOv8 convention)."""
+    parts = list(image_path.parts)
+    idx = len(parts) - 1 - parts[::-1].index("images")
+    parts[idx] = "labels"
+    return Path(*parts).with_suffix(".txt")
+
+
+def add_member(tar, name, data):
+    """
+    Append one file to the tar and return the offset of its data.
+    """
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = 0
+    info.mode = 0o644
+    data_offset = tar.offset + len(info.tobuf(tar.format, tar.encoding, tar.errors))
+    tar.addfile(info, io.BytesIO(data))
+    return data_offset
+
+
+class ShardWriter:
+    """
+    Writes samples into size/count-bounded tar shards and records the index.
+    """
+
+    def __init__(self, out_dir, prefix, max_bytes, max_samples):
+        self.out_dir = out_dir
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.max_samples = max_samples
+        self.shards, self.keys, self.rows = [], [], []
+        self.tar = None
+        self.shard_bytes = self.shard_samples = 0
+
+    def _open_next(self):
+        self.close_shard()
+        name = f"{self.prefix}-{len(self.shards):06d}.tar"
+        self.shards.append(name)
+        self.tar = tarfile.open(self.out_dir / name, "w", format=tarfile.USTAR_FORMAT)
+        self.shard_bytes = self.shard_samples = 0
+
+    def close_shard(self):
+        if self.tar is not None:
+            self.tar.close()
+            self.tar = None
+
+    def write(self, key, image_bytes, label_bytes):
+        size = len(image_bytes) + len(label_bytes) + 1024   # + two tar headers
+        if (self.tar is None or self.shard_samples >= self.max_samples
+                or (self.shard_samples and self.shard_bytes + size > self.max_bytes)):
+            self._open_next()
+        image_offset = add_member(self.tar, f"{key}.jpg", image_bytes)
+        label_offset = add_member(self.tar, f"{key}.txt", label_bytes)
+        self.rows.append((len(self.shards) - 1, image_offset, len(image_bytes), label_offset, len(label_bytes)))
+        self.keys.append(key)
+        self.shard_bytes += size
+        self.shard_samples += 1
+
+    def finish(self, meta):
+        self.close_shard()
+        np.save(self.out_dir / "index.npy", np.array(self.rows, dtype=INDEX_DTYPE))
+        with open(self.out_dir / "keys.txt", "w") as f:
+            f.write("".join(f"{key}\n" for key in self.keys))
+        with open(self.out_dir / "meta.json", "w") as f:
+            json.dump({**meta, "shards": self.shards, "samples": len(self.keys)}, f, indent=2)
+
+
+def pack_split(image_paths, out_dir, prefix, names, max_bytes, max_samples):
+    """
+    Pack one split; returns (samples, shards, bytes) written.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for old in out_dir.glob(f"{prefix}-*.tar"):
+        old.unlink()
+    writer = ShardWriter(out_dir, prefix, max_bytes, max_samples)
+    skipped = backgrounds = 0
+    for image_path in image_paths:
+        if not image_path.exists():
+            skipped += 1
+            continue
+        label_path = label_path_for(image_path)
+        if label_path.exists():
+            label = label_path.read_bytes()
+        else:
+            label = b""   # Background image: no objects
+            backgrounds += 1
+        writer.write(image_path.stem, image_path.read_bytes(), label)
+    writer.finish({"split": prefix, "names": names})
+    if skipped:
+        print(f"⚠️ {prefix}: skipped {skipped} missing images")
+    if backgrounds:
+        print(f"🖼️ {prefix}: {backgrounds} images without a label file packed as background")
+    total = sum((out_dir / name).stat().st_size for name in writer.shards)
+    return len(writer.keys), len(writer.shards), total
+
+
+# --- MAIN ---
+def main():
+    parser = argparse.ArgumentParser(description="Pack train/valid/test splits into tar shards + index")
+    parser.add_argument("--root", type=Path, default=ROOT, help="crop_data folder")
+    parser.add_argument("--data", type=Path, default=None, help="data.yaml (default: <root>/splits/data.yaml)")
+    parser.add_argument("--out", type=Path, default=None, help="Output folder (default: <root>/shards)")
+    parser.add_argument("--max-mb", type=int, default=MAX_SHARD_MB, help="Shard size limit (MB)")
+    parser.add_argument("--max-samples", type=int, default=MAX_SHARD_SAMPLES, help="Samples per shard limit")
+    args = parser.parse_args()
+
+    data_yaml = args.data or args.root / "splits" / "data.yaml"
+    out_root = args.out or args.root / "shards"
+    with open(data_yaml, "r") as f:
+        names = yaml.safe_load(f).get("names", {})
+
+    start = time.perf_counter()
+    for split in ("train", "val", "test"):
+        try:
+            image_paths = split_image_paths(data_yaml, split)
+        except (KeyError, FileNotFoundError):
+            continue
+        samples, shards, total = pack_split(image_paths, out_root / split, split, names,
+                                            args.max_mb * 1_000_000, args.max_samples)
+        print(f"📦 {split}: {samples} samples → {shards} shard(s), {total / 1e6:.1f} MB")
+    out_root.mkdir(parents=True, exist_ok=True)
+    for module in READER_MODULES:
+        shutil.copy(SCRIPT_DIR / module, out_root / module)
+
+    print(f"\n✅ Shards written to {out_root} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
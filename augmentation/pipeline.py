@@ -0,0 +1,460 @@
+"""
+pipeline.py
+---------------------------------
+Single entry point for the augmentation pipeline, rerunning only what changed.
+
+The stages of docs/augmentation.md form a small DAG:
+
+    count ─┐
+    dedup ─┴→ prepare → augment → merge → split ─┬→ pack       (with --shards)
+                                                 └→ letterbox  (with --letterbox)
+
+Before a stage runs, its fingerprint is computed from everything it reads:
+the content hash of its input files, the code of the script (and of the
+modules it imports) and its settings (seed, target count, link mode, ...).
+A stage whose fingerprint matches the last successful run is skipped.
+
+`augment` is fingerprinted per class (the plan entries of the class and the
+content of their images/labels). Only classes whose fingerprint changed are
+regenerated, through `augment_with_albumentations.py --classes ...`; adding
+50 raw images of one class regenerates that class, not all 8,000 samples.
+`merge --prune` then drops the stale augmented files from final_dataset/.
+
+File hashes (BLAKE2b of the contents) are cached by (path, size, mtime), so
+unchanged files are never read twice. State lives next to the data in
+`crop_data/pipeline_state.sqlite`.
+
+⚙️ Requirements:
+- Python 3.9+ (graphlib), plus whatever the stage scripts need
+
+Usage:
+    python pipeline.py --root ~/Desktop/crop_data
+    python pipeline.py --root /data/crop_data --workers 16 --seed 42
+    python pipeline.py --dry-run                  # show what would run and why
+    python pipeline.py --force augment            # ignore the fingerprint of a stage
+    python pipeline.py --stages count,prepare     # run a subset (in DAG order)
+    python pipeline.py --shards                   # also pack the splits (pack_shards.py)
+    python pipeline.py --letterbox --imgsz 960    # also write letterboxed copies (letterbox_cache.py)
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from graphlib import TopologicalSorter
+from pathlib import Path
+
+from materialize import LINK_MODES
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+STATE_NAME = "pipeline_state.sqlite"
+HASH_CHUNK = 1 << 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_hashes (
+    path     TEXT PRIMARY KEY,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    digest   TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stages (
+    name        TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    finished_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS parts (
+    stage       TEXT NOT NULL,
+    part        TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    PRIMARY KEY (stage, part)
+);
+"""
+
+
+# --- FINGERPRINTS ---
+def digest_of(*parts):
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else str(part).encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def hash_file(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class PipelineState:
+    """
+    Content-hash cache and per-stage fingerprints (SQLite).
+    """
+
+    def __init__(self, db_path, hash_workers=8):
+        self.conn = sqlite3.connect(str(db_path))
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.executescript(SCHEMA)
+        self.hash_workers = hash_workers
+
+    def close(self):
+        self.conn.close()
+
+    def file_digests(self, paths):
+        """
+        {path: content digest}; only files whose size/mtime changed are read.
+        Missing files map to "missing".
+        """
+        paths = [str(p) for p in paths]
+        known = {}
+        for start in range(0, len(paths), 900):
+            chunk = paths[start:start + 900]
+            known.update((row[0], row[1:]) for row in self.conn.execute(
+                f"SELECT path, size, mtime_ns, digest FROM file_hashes "
+                f"WHERE path IN ({','.join('?' * len(chunk))})", chunk))
+
+        result, stale = {}, []
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                result[path] = "missing"
+                continue
+            old = known.get(path)
+            if old and old[0] == st.st_size and old[1] == st.st_mtime_ns:
+                result[path] = old[2]
+            else:
+                stale.append((path, st.st_size, st.st_mtime_ns))
+
+        if stale:
+            with ThreadPoolExecutor(self.hash_workers) as pool:
+                digests = list(pool.map(hash_file, [path for path, _, _ in stale]))
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, digest) VALUES (?, ?, ?, ?)",
+                    [(path, size, mtime, d) for (path, size, mtime), d in zip(stale, digests)])
+            result.update((path, d) for (path, _, _), d in zip(stale, digests))
+        return result
+
+    def tree_digest(self, paths):
+        """One digest over the names and contents of `paths`."""
+        digests = self.file_digests(paths)
+        return digest_of(*(f"{Path(p).name}={digests[str(p)]}" for p in sorted(map(str, paths))))
+
+    def fingerprint(self, stage):
+        row = self.conn.execute("SELECT fingerprint FROM stages WHERE name = ?", (stage,)).fetchone()
+        return row[0] if row else None
+
+    def record(self, stage, fingerprint):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO stages (name, fingerprint, finished_at) VALUES (?, ?, ?)",
+                              (stage, fingerprint, time.time()))
+
+    def part_fingerprints(self, stage):
+        return dict(self.conn.execute("SELECT part, fingerprint FROM parts WHERE stage = ?", (stage,)))
+
+    def record_parts(self, stage, parts):
+        with self.conn:
+            self.conn.execute("DELETE FROM parts WHERE stage = ?", (stage,))
+            self.conn.executemany("INSERT INTO parts (stage, part, fingerprint) VALUES (?, ?, ?)",
+                                  [(stage, part, fp) for part, fp in parts.items()])
+
+
+def list_files(folder, suffix):
+    if not folder.is_dir():
+        return []
+    with os.scandir(folder) as entries:
+        return [Path(e.path) for e in entries if e.name.endswith(suffix)]
+
+
+def listing_digest(folder, suffix):
+    """Digest of the file names only (for stages that just check existence)."""
+    return digest_of(*sorted(p.name for p in list_files(folder, suffix)))
+
+
+def code_digest(*scripts):
+    return digest_of(*((SCRIPT_DIR / name).read_bytes() for name in scripts))
+
+
+# --- STAGES ---
+class Stage:
+    """
+    One node of the DAG: a script, its arguments, and how to fingerprint it.
+    """
+
+    def __init__(self, name, script, deps=(), code=(), args=lambda cfg: [], inputs=lambda state, cfg: "",
+                 check=lambda cfg: []):
+        self.name = name
+        self.script = script
+        self.deps = tuple(deps)
+        self.code = (script,) + tuple(code)
+        self.args = args
+        self.inputs = inputs
+        self.check = check
+
+    def fingerprint(self, state, cfg):
+        return digest_of(code_digest(*self.code), json.dumps(self.args(cfg)), self.inputs(state, cfg))
+
+    def run(self, cfg, extra_args=()):
+        cmd = [sys.executable, str(SCRIPT_DIR / self.script), *self.args(cfg), *extra_args]
+        print(f"\n▶️ {self.name}: {' '.join(cmd[1:])}")
+        subprocess.run(cmd, cwd=SCRIPT_DIR, check=True)
+
+
+def labels_and_classes(state, cfg):
+    root = cfg.root
+    return digest_of(state.tree_digest(list_files(root / "labels", ".txt")),
+                     state.tree_digest([root / "classes.txt"]))
+
+
+def count_inputs(state, cfg):
+    # Image sizes feed the box geometry
+    return digest_of(labels_and_classes(state, cfg),
+                     state.tree_digest(list_files(cfg.root / "images", ".jpg")))
+
+
+def dedup_inputs(state, cfg):
+    return digest_of(state.tree_digest(list_files(cfg.root / "images", ".jpg")),
+                     state.tree_digest(list_files(cfg.root / "labels", ".txt")))
+
+
+def prepare_inputs(state, cfg):
+    return digest_of(labels_and_classes(state, cfg), listing_digest(cfg.root / "images", ".jpg"),
+                     state.tree_digest([cfg.root / "duplicates.json"]))
+
+
+def merge_inputs(state, cfg):
+    root = cfg.root
+    return digest_of(*(state.tree_digest(list_files(root / sub, suffix))
+                       for sub, suffix in [("images", ".jpg"), ("labels", ".txt"),
+                                           ("augmented/images", ".jpg"), ("augmented/labels", ".txt")]))
+
+
+def split_inputs(state, cfg):
+    final = cfg.root / "final_dataset"
+    return digest_of(state.tree_digest(list_files(final / "labels", ".txt")),
+                     listing_digest(final / "images", ".jpg"),
+                     state.tree_digest([cfg.root / "classes.txt"]),
+                     state.tree_digest(list_files(cfg.root / "augmented", "synth_groups.json")))
+
+
+def pack_inputs(state, cfg):
+    sys.path.insert(0, str(SCRIPT_DIR))
+    from pack_shards import label_path_for, split_image_paths
+
+    data_yaml = cfg.root / "splits" / "data.yaml"
+    if not data_yaml.exists():
+        return "missing"
+    parts = [state.tree_digest([data_yaml])]
+    for split in ("train", "val", "test"):
+        images = split_image_paths(data_yaml, split)
+        parts.append(state.tree_digest(images + [label_path_for(p) for p in images]))
+    return digest_of(*parts)
+
+
+def check_split(cfg):
+    """
+    Problems with the split folders after a (re)run: a sample in more than
+    one split, an image without its label, or a folder that disagrees with
+    split_report.json.
+    """
+    splits = cfg.root / "splits"
+    report_path = splits / "split_report.json"
+    if cfg.file_lists or not report_path.exists():
+        return []
+    with open(report_path) as f:
+        report = json.load(f)["splits"]
+    problems = []
+    seen = {}
+    for split, hist in report.items():
+        images = {p.stem for p in (splits / split / "images").glob("*.jpg")}
+        labels = {p.stem for p in (splits / split / "labels").glob("*.txt")}
+        if len(images) != hist["files"]:
+            problems.append(f"{split}: {len(images)} images on disk, split_report.json says {hist['files']}")
+        if images != labels:
+            problems.append(f"{split}: {len(images ^ labels)} images and labels do not pair up")
+        for stem in images:
+            if stem in seen:
+                problems.append(f"{stem} is in both {seen[stem]} and {split}")
+            seen.setdefault(stem, split)
+    return problems
+
+
+def train_imgsz(cfg):
+    """
+    --imgsz, else the imgsz count_classes.py suggested (class_stats.json,
+    read when the stage is fingerprinted, i.e. after count ran), else 640.
+    """
+    if cfg.imgsz:
+        return cfg.imgsz
+    stats_path = cfg.root / "class_stats.json"
+    if stats_path.exists():
+        with open(stats_path) as f:
+            return json.load(f)["recommendation"]["imgsz"]
+    return 640
+
+
+AUGMENT_CODE = ("transforms.py", "bbox_utils.py", "image_cache.py", "balance_planner.py")
+
+STAGES = [
+    Stage("count", "count_classes.py", code=("label_index.py", "verify_dataset_integrity.py"),
+          args=lambda cfg: ["--root", str(cfg.root), "--workers", str(cfg.workers)], inputs=count_inputs),
+    Stage("dedup", "dedup_images.py", code=("image_hash.py",),
+          args=lambda cfg: ["--root", str(cfg.root)], inputs=dedup_inputs),
+    Stage("prepare", "prepare_augmentation_list.py", deps=("count", "dedup"),
+          code=("label_index.py", "balance_planner.py", "dedup_images.py"),
+          args=lambda cfg: ["--root", str(cfg.root), "--target-count", str(cfg.target_count)],
+          inputs=prepare_inputs),
+    Stage("augment", "augment_with_albumentations.py", deps=("prepare",), code=AUGMENT_CODE,
+          args=lambda cfg: ["--root", str(cfg.root), "--seed", str(cfg.seed), "--workers", str(cfg.workers),
+                            "--target-count", str(cfg.target_count)]),
+    Stage("merge", "merge_augmented_with_original.py", deps=("augment",), code=("materialize.py",),
+          args=lambda cfg: ["--root", str(cfg.root), "--link-mode", cfg.link_mode, "--prune"],
+          inputs=merge_inputs),
+    Stage("split", "split_dataset.py", deps=("merge",),
+          code=("materialize.py", "stratified_split.py", "label_index.py"),
+          args=lambda cfg: ["--root", str(cfg.root), "--input", "final_dataset", "--seed", str(cfg.seed),
+                            "--link-mode", cfg.link_mode] + (["--file-lists"] if cfg.file_lists else []),
+          inputs=split_inputs, check=check_split),
+    Stage("pack", "pack_shards.py", deps=("split",), code=("shard_reader.py", "bbox_utils.py"),
+          args=lambda cfg: ["--root", str(cfg.root)], inputs=pack_inputs),
+    Stage("letterbox", "letterbox_cache.py", deps=("split",),
+          code=("bbox_utils.py", "materialize.py", "pack_shards.py"),
+          args=lambda cfg: ["--root", str(cfg.root), "--workers", str(cfg.workers), "--imgsz", str(train_imgsz(cfg))],
+          inputs=pack_inputs),
+]
+OPTIONAL_STAGES = {"pack": "shards", "letterbox": "letterbox"}
+
+
+def augment_class_fingerprints(state, cfg):
+    """
+    {class_id: fingerprint} over the plan entries (bases and quotas) of each
+    class and the contents of their images and labels.
+    """
+    sys.path.insert(0, str(SCRIPT_DIR))
+    from augment_with_albumentations import load_plan
+
+    plan_file = cfg.root / "augment_plan.txt"
+    plan = load_plan(plan_file) if plan_file.exists() else {}
+    paths = [cfg.root / sub / f"{base}{suffix}" for bases in plan.values() for base in bases
+             for sub, suffix in (("images", ".jpg"), ("labels", ".txt"))]
+    digests = state.file_digests(paths)
+    return {
+        str(class_id): digest_of(*(f"{base}:{quota}:{digests[str(cfg.root / 'images' / f'{base}.jpg')]}:"
+                                   f"{digests[str(cfg.root / 'labels' / f'{base}.txt')]}"
+                                   for base, quota in bases.items()))
+        for class_id, bases in plan.items()
+    }
+
+
+def run_augment(stage, state, cfg, force, dry_run):
+    """
+    Per-class partial rerun of the augment stage. Returns True if it ran.
+    """
+    common = digest_of(code_digest(*stage.code), cfg.seed, cfg.target_count)
+    current = {c: digest_of(common, fp) for c, fp in augment_class_fingerprints(state, cfg).items()}
+    previous = state.part_fingerprints(stage.name)
+    outputs_exist = (cfg.root / "augmented" / "outputs.json").exists()
+
+    if force or not outputs_exist:
+        changed = set(current) | set(previous)
+    else:
+        changed = {c for c in set(current) | set(previous) if current.get(c) != previous.get(c)}
+    if not changed:
+        print(f"⏭️ augment: up to date ({len(current)} classes)")
+        return False
+
+    classes = ",".join(sorted(changed, key=int))
+    print(f"🔁 augment: {len(changed)}/{len(set(current) | set(previous))} classes changed → {classes}")
+    if dry_run:
+        return True
+    stage.run(cfg, ["--classes", classes])
+    state.record_parts(stage.name, current)
+    return True
+
+
+# --- MAIN ---
+def main():
+    parser = argparse.ArgumentParser(description="Incremental augmentation pipeline (count, dedup → prepare → augment → merge → split)")
+    parser.add_argument("--root", type=Path, default=Path.home() / "Desktop" / "crop_data", help="crop_data folder")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for augmentation and split")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Augmentation worker processes")
+    parser.add_argument("--target-count", type=int, default=500, help="Images per class after augmentation")
+    parser.add_argument("--link-mode", choices=LINK_MODES, default="hardlink", help="Link mode for merge and split")
+    parser.add_argument("--file-lists", action="store_true", help="Split into train.txt/val.txt/test.txt")
+    parser.add_argument("--shards", action="store_true", help="Also pack the splits into tar shards")
+    parser.add_argument("--letterbox", action="store_true", help="Also write letterboxed copies at --imgsz")
+    parser.add_argument("--imgsz", type=int, default=None,
+                        help="Training resolution of the letterboxed copies "
+                             "(default: the one suggested in class_stats.json, else 640)")
+    parser.add_argument("--stages", type=lambda s: [x for x in s.split(",") if x],
+                        help="Comma-separated subset of stages to consider")
+    parser.add_argument("--force", action="append", default=[], help="Rerun a stage regardless (or 'all')")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would run")
+    cfg = parser.parse_args()
+    cfg.root = cfg.root.expanduser().resolve()
+
+    stages = {stage.name: stage for stage in STAGES}
+    selected = cfg.stages or [name for name in stages
+                              if name not in OPTIONAL_STAGES or getattr(cfg, OPTIONAL_STAGES[name])]
+    unknown = set(selected) - set(stages) | set(cfg.force) - set(stages) - {"all"}
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(sorted(unknown))}")
+
+    order = list(TopologicalSorter({s.name: s.deps for s in STAGES}).static_order())
+    state = PipelineState(cfg.root / STATE_NAME)
+    ran = set()
+    try:
+        for name in order:
+            if name not in selected:
+                continue
+            stage = stages[name]
+            force = "all" in cfg.force or name in cfg.force
+            upstream = any(dep in ran for dep in stage.deps)
+
+            if name == "augment":
+                if run_augment(stage, state, cfg, force, cfg.dry_run):
+                    ran.add(name)
+                continue
+
+            if cfg.dry_run and upstream:
+                print(f"🔁 {name}: upstream stage would run")
+                ran.add(name)
+                continue
+            fingerprint = stage.fingerprint(state, cfg)
+            if not force and fingerprint == state.fingerprint(name):
+                print(f"⏭️ {name}: up to date")
+                continue
+            reason = "forced" if force else ("first run" if state.fingerprint(name) is None else "inputs changed")
+            print(f"🔁 {name}: {reason}")
+            ran.add(name)
+            if cfg.dry_run:
+                continue
+            stage.run(cfg)
+            problems = stage.check(cfg)
+            if problems:
+                for problem in problems[:10]:
+                    print(f"⚠️ {problem}")
+                print(f"\n❌ {name}: {len(problems)} problem(s) in the output; not recording it as done")
+                sys.exit(1)
+            state.record(name, fingerprint)
+    except subprocess.CalledProcessError as e:
+        print(f"\n❌ Stage failed (exit {e.returncode}); fix it and rerun — finished stages are kept")
+        sys.exit(e.returncode)
+    finally:
+        state.close()
+
+    print(f"\n✅ Pipeline {'plan' if cfg.dry_run else 'done'}: "
+          f"{len(ran)} stage(s) {'to run' if cfg.dry_run else 'ran'}, "
+          f"{len([n for n in order if n in selected]) - len(ran)} up to date")
+
+
+if __name__ == "__main__":
+    main()
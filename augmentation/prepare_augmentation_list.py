@@ -2,34 +2,50 @@
 Augmentation Preparation Script
 -------------------------------
 
-This script prepares an **augmentation plan** for underrepresented classes 
-in a YOLO dataset. It identifies images that contain only a single class 
-(single-class images are safer for augmentation) and selects those belonging 
-to target classes that need more samples. The result is saved in a 
-`augment_plan.txt` file, which can later be used by an augmentation script 
-to generate additional training data.
+This script prepares an **augmentation plan** for underrepresented classes
+in a YOLO dataset. It computes how many images each class is short of
+`--target-count` straight from the label data and decides how many augmented
+copies to make of each base image (see `balance_planner.py`). The result is
+saved in a `augment_plan.txt` file, which the augmentation script walks
+quota by quota to generate additional training data.
 
 Workflow:
 1. Load class names from `classes.txt`.
-2. Parse YOLO label files to identify images containing only one class.
-3. Keep only the classes listed in `needed_counts` (the classes that require augmentation).
-4. Display how many valid images were found vs. how many are needed.
-5. Save an `augment_plan.txt` file mapping class IDs to base filenames.
+2. Load every (label file, class) pair from the shared label index (`label_index.py`,
+   only changed label files are re-parsed) in one query.
+3. Count images per class with NumPy bincount; the deficit is `target - count`.
+4. Spread each deficit over the images containing the class, rarest class first.
+   Multi-class images are used too, but only as often as their other classes
+   can absorb without overshooting the target.
+5. Leave out missing images and near-duplicates dropped by `dedup_images.py` (`duplicates.json`).
+6. Display current vs. planned images per class and save `augment_plan.txt`
+   (`class_id,base,quota` lines grouped by the class each base was planned for).
 
 Usage:
     - Place this script in the dataset root (where `crop_data/` exists).
-    - Update `needed_counts` with the shortfall of images per class.
-    - Run: `python prepare_augmentation.py`
-    - Output: `crop_data/augment_plan.txt` (list of candidate images for augmentation)
+    - Run: `python prepare_augmentation.py` (`--root` to point at another crop_data folder,
+      `--target-count` for the desired images per class)
+    - Output: `crop_data/augment_plan.txt` (base images and how many copies to make of each)
 
 """
 
-import os
+import argparse
+import time
 from pathlib import Path
-from collections import defaultdict
+
+import numpy as np
+
+from balance_planner import plan_quotas
+from dedup_images import load_dropped
+from label_index import open_index
 
 # --- CONFIG ---
-ROOT = Path.home() / "Desktop" / "crop_data"
+parser = argparse.ArgumentParser(description="Write augment_plan.txt for underrepresented classes")
+parser.add_argument("--root", type=Path, default=Path.home() / "Desktop" / "crop_data", help="crop_data folder")
+parser.add_argument("--target-count", type=int, default=500, help="Images per class after augmentation")
+args = parser.parse_args()
+
+ROOT = args.root
 IMAGES_DIR = ROOT / "images"
 LABELS_DIR = ROOT / "labels"
 CLASSES_FILE = ROOT / "classes.txt"
@@ -42,54 +58,59 @@ AUG_IMAGES_DIR.mkdir(parents=True, exist_ok=True)
 AUG_LABELS_DIR.mkdir(parents=True, exist_ok=True)
 
 # Target dataset size (per class)
-TARGET_COUNT = 500  
+TARGET_COUNT = args.target_count
 
-# Current class shortfalls (how many more are needed to reach 500)
-needed_counts = {
-    6: 13, 9: 228, 10: 410, 12: 184, 13: 375,
-    14: 437, 18: 171, 19: 156, 20: 177, 21: 191,
-    22: 198, 23: 191, 24: 201, 25: 113, 26: 152, 27: 21
-}
+start = time.perf_counter()
 
 # --- STEP 1: Load class names ---
 with open(CLASSES_FILE, "r") as f:
     class_names = [line.strip() for line in f.readlines()]
 
-# --- STEP 2: Parse YOLO label files to find single-class images ---
-single_class_images = defaultdict(list)
-
-for label_path in LABELS_DIR.glob("*.txt"):
-    with open(label_path, "r") as f:
-        lines = f.readlines()
-    # Collect all class IDs in this label file
-    classes = [line.strip().split()[0] for line in lines]
-    
-    if len(set(classes)) == 1:  # only one unique class present
-        class_id = int(classes[0])
-        if class_id in needed_counts:  # only track underrepresented classes
-            base = label_path.stem  # file name without extension
-            img_path = IMAGES_DIR / f"{base}.jpg"
-            if img_path.exists():
-                single_class_images[class_id].append(base)
-
-# --- STEP 3: Display statistics ---
-for class_id, base_list in single_class_images.items():
-    current = len(base_list)
-    needed = needed_counts[class_id]
-    print(f"Class {class_id:02d} ({class_names[class_id]}): {current} valid → Need {needed}")
-
-# --- STEP 4: Build augmentation plan ---
-augment_plan = {}
-for class_id, base_list in single_class_images.items():
-    needed = needed_counts[class_id]
-    if needed > 0:
-        augment_plan[class_id] = base_list
-
-# --- STEP 5: Save plan for audit/augmentation ---
-with open(ROOT / "augment_plan.txt", "w") as f:
-    for class_id, base_list in augment_plan.items():
-        f.write(f"# Class {class_id} ({class_names[class_id]})\n")
-        for base in base_list:
-            f.write(f"{class_id},{base}\n")
 
-print("\n✅ Done. Ready for augmentation. Check 'augment_plan.txt'")
+def class_name(class_id):
+    return class_names[class_id] if class_id < len(class_names) else "?"
+
+
+# --- STEP 2: Load (file, class) pairs from the label index ---
+with open_index(LABELS_DIR) as index:
+    file_bases = index.file_ids()
+    pairs = np.array(index.box_classes(), dtype=np.int64).reshape(-1, 2)
+
+num_files = max(file_bases, default=-1) + 1
+num_classes = max(len(class_names), int(pairs[:, 1].max()) + 1 if len(pairs) else 0)
+
+# --- STEP 3: Eligible base images (present on disk, not a near-duplicate) ---
+duplicates = load_dropped(ROOT)
+if duplicates:
+    print(f"🔁 Skipping {len(duplicates)} near-duplicate images (duplicates.json)")
+available = {path.stem for path in IMAGES_DIR.glob("*.jpg")}
+eligible = np.zeros(num_files, dtype=bool)
+for file_id, base in file_bases.items():
+    eligible[file_id] = base in available and base not in duplicates
+
+# --- STEP 4: Plan per-base quotas ---
+plan = plan_quotas(pairs[:, 0], pairs[:, 1], num_files, num_classes, TARGET_COUNT, eligible)
+
+# --- STEP 5: Display statistics ---
+for class_id in range(num_classes):
+    planned = plan.after[class_id] - plan.before[class_id]
+    if planned or plan.before[class_id] < TARGET_COUNT:
+        note = "" if plan.after[class_id] >= TARGET_COUNT else " ⚠️ no usable base images left"
+        print(f"Class {class_id:02d} ({class_name(class_id)}): {plan.before[class_id]} images → "
+              f"{plan.after[class_id]} (+{planned}){note}")
+if plan.overshoot.any():
+    print(f"⚠️ Unavoidable overshoot (multi-class images only): "
+          f"{', '.join(f'class {c} +{n}' for c, n in enumerate(plan.overshoot) if n)}")
+
+# --- STEP 6: Save plan for audit/augmentation ---
+used = np.flatnonzero(plan.quota)
+with open(ROOT / "augment_plan.txt", "w") as f:
+    for class_id in np.unique(plan.driver[used]):
+        files = sorted(used[plan.driver[used] == class_id], key=lambda i: file_bases[i])
+        f.write(f"# Class {class_id} ({class_name(class_id)}): {len(files)} base images, "
+                f"{int(plan.quota[files].sum())} samples\n")
+        for file_id in files:
+            f.write(f"{class_id},{file_bases[file_id]},{plan.quota[file_id]}\n")
+
+print(f"\n✅ Done in {time.perf_counter() - start:.1f}s: {int(plan.quota.sum())} samples from "
+      f"{len(used)} base images. Ready for augmentation. Check 'augment_plan.txt'")
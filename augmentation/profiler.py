@@ -0,0 +1,199 @@
+"""
+profiler.py
+---------------------------------
+Opt-in per-stage timing for the augmentation scripts.
+
+We could not tell whether an augmentation run is limited by decoding, by the
+Albumentations transforms or by writing. With `--profile trace.json` (or
+`.csv`) the scripts record, per stage:
+
+- calls, wall time and CPU time (CPU of the calling thread, so stages on the
+  writer threads are measured where they run)
+- the slowest single call
+- throughput (calls per wall second of the stage)
+
+and for the whole run: samples per second and peak RSS (main process and
+worker processes). A summary table is printed at the end.
+
+Stages used by the scripts:
+    imread            decode (image cache lookups: hits are cheap)
+    transform         one full Augmenter call (main pipeline + fallback)
+    transform.<Name>  each transform inside the main `A.Compose`
+    fallback.<Name>   each transform inside the fallback pipeline
+    submit            handing a sample to the writer (time blocked = backpressure)
+    encode, write     JPEG encoding and the atomic image write (writer threads)
+    write_labels      one batch of label files
+
+Nested stages overlap: `transform` includes its `transform.*` children.
+
+Without `--profile` a disabled `Profiler` is used: `stage()` returns a shared
+no-op context manager and nothing is recorded.
+
+Usage:
+    profiler = Profiler(enabled=args.profile is not None)
+    instrument_compose(augmenter.transform, profiler, "transform.")
+    with profiler.stage("imread"):
+        image, labels = cache.get(base)
+    write_trace(args.profile, profiler.stats(), {"samples": n, "wall_seconds": t})
+    print(format_profile(profiler.stats(), samples=n, wall_seconds=t))
+"""
+
+import contextlib
+import csv
+import json
+import resource
+import sys
+import threading
+import time
+from pathlib import Path
+
+_NULL_STAGE = contextlib.nullcontext()
+
+
+class _Stage:
+    __slots__ = ("profiler", "name", "wall", "cpu")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, time.perf_counter() - self.wall, time.thread_time() - self.cpu)
+        return False
+
+
+class Profiler:
+    """
+    Thread-safe accumulator of (calls, wall, CPU, slowest call) per stage.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.totals = {}
+
+    def stage(self, name):
+        return _Stage(self, name) if self.enabled else _NULL_STAGE
+
+    def add(self, name, wall, cpu, calls=1, max_wall=None):
+        with self.lock:
+            total = self.totals.get(name)
+            if total is None:
+                total = self.totals[name] = {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0,
+                                             "max_seconds": 0.0}
+            total["calls"] += calls
+            total["wall_seconds"] += wall
+            total["cpu_seconds"] += cpu
+            total["max_seconds"] = max(total["max_seconds"], wall if max_wall is None else max_wall)
+
+    def merge(self, stats):
+        """Add `stats()` of another profiler (e.g. from a worker process)."""
+        for name, s in stats.items():
+            self.add(name, s["wall_seconds"], s["cpu_seconds"], s["calls"], s["max_seconds"])
+
+    def stats(self):
+        with self.lock:
+            return {name: dict(total) for name, total in self.totals.items()}
+
+    def pop_stats(self):
+        with self.lock:
+            stats, self.totals = self.totals, {}
+        return stats
+
+
+# --- ALBUMENTATIONS ---
+def instrument_compose(compose, profiler, prefix="transform."):
+    """
+    Time every transform of an `A.Compose` (recursively) under
+    `prefix + class name`. Each transform instance is switched to a subclass
+    whose `__call__` is timed; the class name, isinstance checks and
+    parameters are unchanged, so outputs are identical.
+    """
+    if not profiler.enabled:
+        return compose
+    for transform in getattr(compose, "transforms", []):
+        if hasattr(transform, "transforms"):
+            instrument_compose(transform, profiler, prefix)
+        cls = type(transform)
+        if getattr(cls, "_profiled", False):
+            continue
+        transform.__class__ = type(cls.__name__, (cls,), {
+            "__call__": _timed(cls.__call__, profiler, prefix + cls.__name__),
+            "_profiled": True,
+            "__module__": cls.__module__,
+        })
+    return compose
+
+
+def _timed(call, profiler, name):
+    def timed_call(self, *args, **kwargs):
+        with profiler.stage(name):
+            return call(self, *args, **kwargs)
+    return timed_call
+
+
+# --- MEMORY ---
+def peak_rss_mb(children=False):
+    """
+    Peak resident set size in MiB of this process (or of its largest waited-for child).
+    """
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    return usage.ru_maxrss / (1 << 20 if sys.platform == "darwin" else 1 << 10)
+
+
+# --- OUTPUT ---
+def stage_rows(stats):
+    """Per-stage rows (slowest total first) with derived throughput and means."""
+    rows = []
+    for name, s in sorted(stats.items(), key=lambda item: -item[1]["wall_seconds"]):
+        calls = s["calls"]
+        rows.append({
+            "stage": name,
+            "calls": calls,
+            "wall_seconds": round(s["wall_seconds"], 6),
+            "cpu_seconds": round(s["cpu_seconds"], 6),
+            "mean_ms": round(1000 * s["wall_seconds"] / calls, 3) if calls else 0.0,
+            "max_ms": round(1000 * s["max_seconds"], 3),
+            "per_second": round(calls / s["wall_seconds"], 1) if s["wall_seconds"] else None,
+        })
+    return rows
+
+
+def write_trace(path, stats, run):
+    """
+    Write the stage table as CSV (`.csv`) or as JSON with the `run` summary
+    (samples, wall_seconds, samples_per_second, peak RSS, ...).
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    rows = stage_rows(stats)
+    if path.suffix == ".csv":
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else ["stage"])
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(path, "w") as f:
+            json.dump({"run": run, "stages": rows}, f, indent=2)
+    return path
+
+
+def format_profile(stats, samples=None, wall_seconds=None, peak_rss=None):
+    """
+    Summary table of the slowest stages plus throughput and peak RSS.
+    """
+    lines = ["⏱️ Profile (wall / CPU / mean / max per call):"]
+    for row in stage_rows(stats):
+        lines.append(f"   {row['stage']:<32} {row['calls']:>8} calls  {row['wall_seconds']:>8.2f}s wall "
+                     f"{row['cpu_seconds']:>8.2f}s cpu  {row['mean_ms']:>8.2f}ms  {row['max_ms']:>8.1f}ms")
+    if samples is not None and wall_seconds:
+        lines.append(f"   {samples} samples in {wall_seconds:.1f}s → {samples / wall_seconds:.1f} samples/s")
+    if peak_rss is not None:
+        lines.append(f"   Peak RSS: {peak_rss:.0f} MiB")
+    return "\n".join(lines)
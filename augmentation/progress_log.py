@@ -0,0 +1,128 @@
+"""
+progress_log.py
+---------------------------------
+Append-only progress manifest that makes augmentation runs resumable.
+
+augment_with_albumentations.py and rescue_class.py used to restart from
+`generated = 0` after an interruption and overwrite `{base}_aug_000...`, so a
+long run was lost. Now every N samples they flush their writer and append one
+JSON line per unit of work (a plan chunk, or the rescued class):
+
+    {"run": {...}}                                    header: the run's settings
+    {"unit": "9:0", "generated": 50, "attempts": 0,   checkpoint
+     "removed": [...], "written": [...], "rng": "..."}
+    {"unit": "9:0", "done": true, "generated": 50, "written": [...]}
+
+`rng` is the pickled RNG state of the unit (picker + Albumentations
+pipelines), so a rerun continues with exactly the samples an uninterrupted
+run would have produced. A torn last line (killed mid-write) is ignored.
+The log only resumes a run with identical settings; otherwise it is reset.
+It is deleted once the run completes.
+
+Every record is written with a single O_APPEND write, so worker processes can
+share one log (`ProgressLog(path)` without `start()` only appends).
+
+Usage:
+    log = ProgressLog(AUG_DIR / "progress.jsonl")
+    resumed = log.start({"seed": 42, ...})  # False → new run (log.stale: orphans of the old one)
+    state = log.resume_state("9:0")        # None → fresh unit
+    log.checkpoint("9:0", generated=..., removed=[...], written=[...], rng=rng_state)
+    log.done("9:0", generated=..., written=[...])
+    log.finish()
+"""
+
+import base64
+import json
+import os
+import pickle
+import zlib
+from pathlib import Path
+
+CHECKPOINT_EVERY = 25   # Samples between checkpoints
+
+
+def encode_state(state):
+    return base64.b64encode(zlib.compress(pickle.dumps(state))).decode()
+
+
+def decode_state(text):
+    return pickle.loads(zlib.decompress(base64.b64decode(text)))
+
+
+class ProgressLog:
+    """
+    Resumable per-unit progress, stored as an append-only JSON-lines file.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.units = {}
+        self.stale = []   # outputs recorded by a previous run that cannot be resumed
+
+    def start(self, run_config, resume=True):
+        """
+        Resume the logged run if it used `run_config`, otherwise start a new
+        log. Returns True when resuming.
+        """
+        run_config = json.loads(json.dumps(run_config))   # normalized (tuples → lists)
+        records = self._read() if self.path.exists() else []
+        if resume and records and records[0].get("run") == run_config:
+            for record in records[1:]:
+                unit = self.units.setdefault(record["unit"], {"written": []})
+                unit["written"].extend(record.get("written", []))
+                unit.update({k: v for k, v in record.items() if k != "written"})
+            return True
+
+        self.stale = [name for record in records[1:] for name in record.get("written", [])]
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w") as f:
+            f.write(json.dumps({"run": run_config}) + "\n")
+        return False
+
+    def _read(self):
+        records = []
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break   # torn write of a killed run: everything after it is unusable
+        return records
+
+    def _append(self, record):
+        data = (json.dumps(record) + "\n").encode()
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+        try:
+            os.write(fd, data)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    # --- READ ---
+    def resume_state(self, unit):
+        """
+        Last recorded state of `unit`: dict with generated, attempts, removed,
+        written, done and the decoded `rng` — or None if it never checkpointed.
+        """
+        state = self.units.get(unit)
+        if state is None:
+            return None
+        state = dict(state)
+        state["written"] = list(dict.fromkeys(state["written"]))
+        if "rng" in state:
+            state["rng"] = decode_state(state["rng"])
+        return state
+
+    # --- WRITE ---
+    def checkpoint(self, unit, generated, removed, written, rng, attempts=0):
+        self._append({"unit": unit, "generated": generated, "attempts": attempts,
+                      "removed": list(removed), "written": list(written), "rng": encode_state(rng)})
+
+    def done(self, unit, generated, written, gave_up=False):
+        self._append({"unit": unit, "done": True, "generated": generated,
+                      "gave_up": gave_up, "written": list(written)})
+
+    def finish(self):
+        """The run completed: nothing left to resume."""
+        if self.path.exists():
+            self.path.unlink()
@@ -6,10 +6,33 @@ by generating synthetic samples using data augmentation. It ensures that the
 chosen class has at least `TARGET_COUNT` samples available for training.
 
 📌 Features:
-- Reads original YOLO-format labels and identifies images containing the target class.
+- Queries the shared label index (`label_index.py`) for images containing the target class.
+- `MODE` decides what one decoded image becomes:
+    "all_boxes"   (default) the whole image with EVERY box, whatever its class,
+                  so no object in a sample is left unlabeled
+    "crop"        one focused sample per target box: a window of `CROP_CONTEXT`
+                  × the box (at least `CROP_MIN_SIZE` px, randomly shifted)
+                  with every box inside it; boxes cut by the window keep their
+                  label if `MIN_VISIBILITY` of them is left, otherwise the
+                  visible sliver is filled with the mean colour. Several
+                  samples per decode, and small lesions get more pixels
+    "target_only" the old behaviour: only the target-class boxes are labeled
+                  (other instances stay in the image unlabeled — avoid)
 - Applies a pipeline of augmentations (flips, brightness/contrast, rotation, noise, weather, etc.).
+- Samples the main pipeline cannot handle (crop larger than the image, boxes
+  pushed out of frame) go through a cheaper box-safe fallback pipeline instead
+  of a blind retry; per-transform failure rates are printed at the end.
 - Saves augmented images and corresponding YOLO labels to a new `/augmented` folder.
 - Continues generating augmented samples until the target class reaches `TARGET_COUNT`.
+- Decodes each base image once (LRU cache, `CACHE_BYTES` budget) and reports
+  cache hit/miss counts at the end.
+- JPEG encoding and writes run on a background writer (sample_writer.py):
+  atomic temp-file + rename, batched labels, bounded queue.
+- Resumable: every `CHECKPOINT_EVERY` samples the progress (count, RNG
+  state) is appended to `augmented/progress_class_<id>.jsonl`; rerunning
+  after a crash continues where it stopped instead of starting over.
+- Optional per-stage profile (`PROFILE_PATH`, see profiler.py): decode, each
+  transform, JPEG encode and writes, samples/s and peak RSS.
 
 ⚙️ Requirements:
 - Python 3.8+
@@ -23,15 +46,26 @@ chosen class has at least `TARGET_COUNT` samples available for training.
 💡 Usage:
     - Set `CLASS_ID` to the YOLO class index you want to rescue (string).
     - Set `TARGET_COUNT` to the desired number of samples for this class.
+    - Set `MODE` to "all_boxes" or "crop" (see above).
+    - Optionally set `PROFILE_PATH` (e.g. "rescue_profile.json" or ".csv") to time every stage.
     - Run:
         python rescue_class.py
 """
 
-import os
-import cv2
+import hashlib
 import random
+import time
 from pathlib import Path
-import albumentations as A
+
+import numpy as np
+
+from bbox_utils import clip_to_window, clip_voc, crop_window, format_yolo, voc_to_yolo, yolo_to_voc
+from image_cache import ImageCache
+from label_index import open_index
+from profiler import Profiler, format_profile, instrument_compose, peak_rss_mb, write_trace
+from progress_log import ProgressLog
+from sample_writer import SampleWriter, format_writer_stats, remove_temp_files
+from transforms import Augmenter, format_failure_stats
 
 # --- CONFIGURATION ---
 ROOT = Path.home() / "Desktop" / "rescue_class"   # Root project folder
@@ -43,76 +77,72 @@ AUG_LABELS_DIR = AUG_DIR / "labels"
 
 AUG_IMAGES_DIR.mkdir(parents=True, exist_ok=True)
 AUG_LABELS_DIR.mkdir(parents=True, exist_ok=True)
+remove_temp_files(AUG_IMAGES_DIR, AUG_LABELS_DIR)   # partial files of an interrupted run
 
 CLASS_ID = "9"         # 👈 Change this to the class you want to rescue
 TARGET_COUNT = 500     # 👈 Desired total sample count for this class
+MODE = "all_boxes"     # 👈 "all_boxes", "crop" or "target_only" (see above)
+CROP_CONTEXT = 2.0     # crop: window side = CROP_CONTEXT × the longer box side ...
+CROP_MIN_SIZE = 320    # ... but at least this many pixels (the pipeline's RandomCrop is 256)
+MIN_VISIBILITY = 0.4   # crop: share of a cut box that must remain to keep its label
+CACHE_BYTES = 1 << 30  # Decoded-image cache budget (1 GiB)
+CHECKPOINT_EVERY = 25  # Samples between progress checkpoints
+PROFILE_PATH = None    # e.g. "rescue_profile.json" → timing trace under augmented/ (.json or .csv)
 
 
 # --- AUGMENTATION PIPELINE ---
-transform = A.Compose([
-    # Basic transformations
-    A.HorizontalFlip(p=0.5),
-    A.RandomBrightnessContrast(p=0.3),
-    A.Rotate(limit=10, p=0.3),
-    A.RandomCrop(height=256, width=256, p=0.2),
-    A.GaussNoise(p=0.2),
-    A.HueSaturationValue(p=0.3),
-    A.MotionBlur(p=0.15),
-    A.Affine(scale=(0.95, 1.05), translate_percent=0.05,
-             rotate=(-10, 10), p=0.3),
-
-    # Field realism
-    A.RandomShadow(p=0.2),
-    A.RandomFog(p=0.15),
-    A.RandomSunFlare(src_radius=30,
-                     flare_roi=(0.1, 0.1, 0.9, 0.3),
-                     p=0.1),
-
-    # Background degradation
-    A.ISONoise(p=0.2),
-    A.Downscale(p=0.2),
-    A.CLAHE(p=0.2),
-], bbox_params=A.BboxParams(format='pascal_voc',
-                            label_fields=['class_labels']))
-
-
-# --- UTILITY FUNCTIONS ---
-def yolo_to_bbox(cls_id, x, y, w, h, img_w, img_h):
-    """
-    Convert YOLO bbox (normalized center-x, center-y, w, h)
-    → Pascal VOC format (x_min, y_min, x_max, y_max).
-    """
-    x, y, w, h = float(x)*img_w, float(y)*img_h, float(w)*img_w, float(h)*img_h
-    x_min = x - w/2
-    y_min = y - h/2
-    x_max = x + w/2
-    y_max = y + h/2
-    return [x_min, y_min, x_max, y_max]
+# Shared pipeline with pre-flight checks and a box-safe fallback (transforms.py)
+augmenter = Augmenter()
+profiler = Profiler(enabled=PROFILE_PATH is not None)
+instrument_compose(augmenter.transform, profiler, "transform.")
+instrument_compose(augmenter.fallback, profiler, "fallback.")
 
 
-def bbox_to_yolo(bbox, img_w, img_h):
+def crop_sample(image, class_ids, bboxes, target):
+    """
+    Crop around box `target` → (crop, class_ids, VOC boxes) with every box
+    that stays visible enough; slivers of the others are filled in.
     """
-    Convert Pascal VOC bbox → YOLO format (x, y, w, h),
-    normalized to [0,1].
+    h, w = image.shape[:2]
+    shift = (random.uniform(-1, 1), random.uniform(-1, 1))
+    window = crop_window(bboxes[target], w, h, CROP_CONTEXT, CROP_MIN_SIZE, shift)
+    left, top, right, bottom = window
+    crop = image[top:bottom, left:right].copy()
+    boxes, visible = clip_to_window(bboxes, window)
+    keep = visible >= MIN_VISIBILITY
+    keep[target] = True
+    fill = crop.reshape(-1, crop.shape[2]).mean(axis=0)
+    for x1, y1, x2, y2 in np.rint(boxes[(visible > 0) & ~keep]).astype(int):
+        crop[y1:y2, x1:x2] = fill
+    return crop, class_ids[keep], boxes[keep]
+
+
+def samples_of(image, class_ids, bboxes, target_mask, limit):
     """
-    x_min, y_min, x_max, y_max = bbox
-    x = ((x_min + x_max) / 2) / img_w
-    y = ((y_min + y_max) / 2) / img_h
-    w = (x_max - x_min) / img_w
-    h = (y_max - y_min) / img_h
-    return [x, y, w, h]
+    The (image, class_ids, VOC boxes) samples `MODE` makes of one decoded image.
+    """
+    if MODE == "target_only":
+        yield image, class_ids[target_mask], bboxes[target_mask]
+    elif MODE == "crop":
+        targets = np.flatnonzero(target_mask).tolist()
+        random.shuffle(targets)
+        for target in targets[:limit]:
+            yield crop_sample(image, class_ids, bboxes, target)
+    else:
+        yield image, class_ids, bboxes
+
+
+if MODE not in ("all_boxes", "crop", "target_only"):
+    raise ValueError(f"Unknown MODE {MODE!r}")
 
 
 # --- COLLECT ORIGINAL SAMPLES ---
 all_bases = []
-for label_file in LABELS_DIR.glob("*.txt"):
-    with open(label_file, "r") as f:
-        lines = f.readlines()
-        # Keep only files that contain the target class
-        if any(line.strip().startswith(CLASS_ID + " ") for line in lines):
-            base = label_file.stem
-            if (IMAGES_DIR / f"{base}.jpg").exists():
-                all_bases.append(base)
+with open_index(LABELS_DIR) as index:
+    # Keep only files that contain the target class
+    for base in index.files_with_class(CLASS_ID):
+        if (IMAGES_DIR / f"{base}.jpg").exists():
+            all_bases.append(base)
 
 original_count = len(all_bases)
 to_generate = max(0, TARGET_COUNT - original_count)
@@ -121,53 +151,100 @@ print(f"\n🔢 Class {CLASS_ID}: Found {original_count} | "
       f"Need {to_generate} more samples")
 
 
-# --- AUGMENTATION LOOP ---
+# --- RESUME AN INTERRUPTED RUN ---
+progress = ProgressLog(AUG_DIR / f"progress_class_{CLASS_ID}.jsonl")
+run_config = {"class": CLASS_ID, "target": TARGET_COUNT, "mode": MODE,
+              "bases": hashlib.blake2b(",".join(all_bases).encode(), digest_size=16).hexdigest()}
 generated = 0
 attempts = 0
-while generated < to_generate:
+removed = []
+state = progress.resume_state("rescue") if progress.start(run_config) else None
+if state is not None:
+    generated, attempts = state["generated"], state["attempts"]
+    for base in state["removed"]:
+        all_bases.remove(base)
+    removed = state["removed"]
+    augmenter.set_state(state["rng"])
+    print(f"⏯️ Resuming interrupted run at sample {generated}")
+
+
+# --- AUGMENTATION LOOP ---
+cache = ImageCache(IMAGES_DIR, LABELS_DIR, max_bytes=CACHE_BYTES)
+writer = SampleWriter(AUG_IMAGES_DIR, AUG_LABELS_DIR, profiler=profiler)
+written = []
+started = time.perf_counter()
+resumed_at = checkpointed = generated
+while generated < to_generate and all_bases:
+    if attempts > 100:
+        print(f"⚠️ Too many unusable picks. Skipping class {CLASS_ID}.")
+        break
     base = random.choice(all_bases)
-    img_path = IMAGES_DIR / f"{base}.jpg"
-    label_path = LABELS_DIR / f"{base}.txt"
 
-    image = cv2.imread(str(img_path))
+    # Decoded once, then served from the cache
+    with profiler.stage("imread"):
+        image, labels = cache.get(base)
     if image is None:
+        all_bases.remove(base)
+        removed.append(base)
+        attempts += 1
         continue
     h, w = image.shape[:2]
+    class_ids, boxes = labels
 
-    # Extract only the target class bboxes
-    with open(label_path, "r") as f:
-        class_lines = [line.strip() for line in f
-                       if line.startswith(CLASS_ID + " ")]
-    if not class_lines:
+    # Images without the target class cannot rescue it
+    target_mask = class_ids == int(CLASS_ID)
+    if not target_mask.any():
+        all_bases.remove(base)
+        removed.append(base)
+        attempts += 1
         continue
-
-    bboxes = []
-    for line in class_lines:
-        _, x, y, bw, bh = line.split()
-        bboxes.append(yolo_to_bbox(CLASS_ID, x, y, bw, bh, w, h))
-
-    try:
-        # Apply augmentations
-        aug = transform(image=image, bboxes=bboxes,
-                        class_labels=[CLASS_ID]*len(bboxes))
+    bboxes = clip_voc(yolo_to_voc(boxes, w, h), w, h)
+
+    usable = False
+    for sample_image, sample_ids, sample_boxes in samples_of(image, class_ids, bboxes, target_mask,
+                                                              to_generate - generated):
+        # Apply augmentations (falls back to a box-safe pipeline on failure)
+        with profiler.stage("transform"):
+            aug = augmenter(sample_image, sample_boxes, sample_ids)
+        if aug is None:
+            continue
         aug_img = aug["image"]
+        aug_yolo = voc_to_yolo(aug["bboxes"], aug_img.shape[1], aug_img.shape[0])
 
-        # Save augmented image and label
+        # Hand image and label to the background writer
         out_base = f"{base}_aug_{generated:03d}"
-        cv2.imwrite(str(AUG_IMAGES_DIR / f"{out_base}.jpg"), aug_img)
-
-        with open(AUG_LABELS_DIR / f"{out_base}.txt", "w") as f:
-            for aug_box in aug["bboxes"]:
-                aug_yolo = bbox_to_yolo(aug_box, aug_img.shape[1], aug_img.shape[0])
-                f.write(f"{CLASS_ID} {' '.join(f'{x:.6f}' for x in aug_yolo)}\n")
-
+        with profiler.stage("submit"):
+            writer.submit(out_base, aug_img, format_yolo(sample_ids, aug_yolo))
+        written.append(out_base)
         generated += 1
-        attempts = 0
+        usable = True
 
-    except Exception as e:
+    if not usable:
+        # Degenerate boxes: this base can never produce a valid sample
+        all_bases.remove(base)
+        removed.append(base)
         attempts += 1
-        if attempts > 100:
-            print(f"⚠️ Too many failed attempts. Skipping class {CLASS_ID}.")
-            break
-
+        continue
+    attempts = 0
+
+    # Checkpoint between images: flushed samples + the RNG state that produces the next one
+    if generated - checkpointed >= CHECKPOINT_EVERY:
+        writer.flush()
+        progress.checkpoint("rescue", generated, removed, written, augmenter.get_state(), attempts=attempts)
+        written = []
+        checkpointed = generated
+
+writer.close()
+progress.finish()
+elapsed = time.perf_counter() - started
+print(cache.summary())
+print(format_failure_stats(augmenter.stats()))
+print(format_writer_stats(writer.stats()))
+if profiler.enabled:
+    samples = generated - resumed_at
+    run = {"script": "rescue_class", "class": CLASS_ID, "samples": samples, "wall_seconds": round(elapsed, 3),
+           "samples_per_second": round(samples / elapsed, 2) if elapsed else None,
+           "peak_rss_mb": round(peak_rss_mb(), 1)}
+    print(format_profile(profiler.stats(), samples, elapsed, peak_rss_mb()))
+    print(f"📝 Profile trace → {write_trace(AUG_DIR / PROFILE_PATH, profiler.stats(), run)}")
 print(f"\n🎉 Done. Generated {generated} new samples for class {CLASS_ID} → {AUG_IMAGES_DIR}")
@@ -0,0 +1,192 @@
+"""
+sample_writer.py
+---------------------------------
+Background writer stage for the augmentation scripts.
+
+Augmentation used to `cv2.imwrite` each sample and then open/write its label
+on the same thread, so JPEG encoding and filesystem latency serialized with
+the transform work. `SampleWriter` takes (name, image, label text) off the
+augmentation loop:
+
+    augment ──submit()──▶ bounded queue ──▶ writer threads:
+                                              encode JPEG (releases the GIL)
+                                              write temp file + rename
+                                              buffer label → write in batches
+
+- Backpressure: `submit` blocks while `max_pending` samples are queued, so a
+  slow disk throttles augmentation instead of filling memory.
+- Atomic: images and labels are written to `<name>.tmp` and renamed into
+  place; a killed run never leaves a truncated JPEG under its final name, and
+  a label only appears after its image.
+- `flush()` waits until everything submitted so far is on disk.
+
+Usage:
+    from sample_writer import SampleWriter
+    with SampleWriter(AUG_IMAGES_DIR, AUG_LABELS_DIR) as writer:
+        writer.submit(out_base, aug_img, label_text)
+    print(format_writer_stats(writer.stats()))
+"""
+
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+import cv2
+
+from profiler import Profiler
+
+MAX_PENDING = 32     # Samples queued before submit() blocks
+LABEL_BATCH = 64     # Labels buffered before they are written out
+TMP_SUFFIX = ".tmp"
+
+
+def write_atomic(path, data):
+    """
+    Write bytes to `path` via a temp file + rename (never half-written).
+    """
+    tmp = f"{path}{TMP_SUFFIX}"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def remove_temp_files(*folders):
+    """
+    Delete leftovers of a killed run. Returns how many were removed.
+    """
+    removed = 0
+    for folder in folders:
+        for tmp in Path(folder).glob(f"*{TMP_SUFFIX}"):
+            tmp.unlink()
+            removed += 1
+    return removed
+
+
+class SampleWriter:
+    """
+    Bounded queue + writer threads for augmented images and YOLO labels.
+    """
+
+    def __init__(self, images_dir, labels_dir, threads=2, max_pending=MAX_PENDING,
+                 label_batch=LABEL_BATCH, jpeg_params=(), profiler=None):
+        self.images_dir = Path(images_dir)
+        self.labels_dir = Path(labels_dir)
+        self.label_batch = label_batch
+        self.jpeg_params = list(jpeg_params)
+        self.queue = queue.Queue(max_pending)
+        self.labels = []
+        self.lock = threading.Lock()
+        self.error = None
+        self.counts = Counter()
+        self.profiler = profiler or Profiler(enabled=False)   # encode/write stages (profiler.py)
+        self.threads = [threading.Thread(target=self._run, daemon=True) for _ in range(max(1, threads))]
+        for thread in self.threads:
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- PRODUCER SIDE ---
+    def submit(self, name, image, label_text):
+        """
+        Queue one sample (`name` without extension). Blocks while the queue is full.
+        """
+        self._raise_error()
+        start = time.perf_counter()
+        self.queue.put((name, image, label_text))
+        self.counts["blocked_seconds"] += time.perf_counter() - start
+
+    def flush(self):
+        """
+        Wait until every submitted sample (image and label) is on disk.
+        """
+        self.queue.join()
+        with self.lock:
+            batch, self.labels = self.labels, []
+        self._write_labels(batch)
+        self._raise_error()
+
+    def close(self):
+        self.flush()
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+
+    def stats(self):
+        return dict(self.counts)
+
+    def pop_stats(self):
+        stats, self.counts = dict(self.counts), Counter()
+        return stats
+
+    # --- WRITER THREADS ---
+    def _raise_error(self):
+        if self.error is not None:
+            raise RuntimeError("sample writer failed") from self.error
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            try:
+                self._write_sample(*item)
+            except Exception as e:
+                self.error = self.error or e
+            finally:
+                self.queue.task_done()
+
+    def _write_sample(self, name, image, label_text):
+        start = time.perf_counter()
+        with self.profiler.stage("encode"):
+            ok, encoded = cv2.imencode(".jpg", image, self.jpeg_params)
+        if not ok:
+            raise ValueError(f"JPEG encoding failed for {name}")
+        encoded_at = time.perf_counter()
+        with self.profiler.stage("write"):
+            write_atomic(self.images_dir / f"{name}.jpg", encoded.tobytes())
+        done = time.perf_counter()
+
+        with self.lock:
+            self.counts["images"] += 1
+            self.counts["encode_seconds"] += encoded_at - start
+            self.counts["write_seconds"] += done - encoded_at
+            self.labels.append((name, label_text))
+            batch = None
+            if len(self.labels) >= self.label_batch:
+                batch, self.labels = self.labels, []
+        if batch:
+            self._write_labels(batch)
+
+    def _write_labels(self, batch):
+        with self.profiler.stage("write_labels"):
+            for name, text in batch:
+                write_atomic(self.labels_dir / f"{name}.txt", text.encode())
+        if batch:
+            with self.lock:
+                self.counts["labels"] += len(batch)
+                self.counts["label_batches"] += 1
+
+
+def merge_writer_stats(total, stats):
+    for key, value in stats.items():
+        total[key] = total.get(key, 0) + value
+    return total
+
+
+def format_writer_stats(stats):
+    images = stats.get("images", 0)
+    if not images:
+        return "💾 Writer: nothing written"
+    return (f"💾 Writer: {images} images / {stats.get('labels', 0)} labels "
+            f"({stats.get('label_batches', 0)} label batches), "
+            f"{stats.get('encode_seconds', 0):.1f}s encoding + {stats.get('write_seconds', 0):.1f}s writing "
+            f"off the augmentation thread, {stats.get('blocked_seconds', 0):.1f}s of backpressure")
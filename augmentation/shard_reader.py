@@ -0,0 +1,222 @@
+"""
+shard_reader.py
+---------------------------------
+Reader for the packed dataset shards written by pack_shards.py.
+
+A split is a folder of plain (uncompressed) tar shards plus an index:
+
+    shards/train/
+    ├── train-000000.tar    {key}.jpg + {key}.txt per sample (WebDataset layout)
+    ├── train-000001.tar
+    ├── index.npy           (shard, image offset/size, label offset/size) per sample
+    ├── keys.txt            sample keys, same order as index.npy
+    └── meta.json           shard names, sample count, class names
+
+Shards are memory-mapped, so reading sample i is a slice of an mmap — no
+per-file open, no tar parsing. Sequential streaming walks each shard front to
+back, which is what slow disks and network mounts (Drive) are good at.
+
+📌 Access patterns:
+- `reader[i]` / `reader.sample(i)`: random access (key, image, class_ids, boxes)
+- `reader.stream(seed=..., shuffle_buffer=...)`: shard-by-shard streaming,
+  shard order shuffled per seed, optional in-memory shuffle buffer; pass
+  `worker=(rank, world)` to give each data-loader worker its own shards
+- `unpack`: write the split back out as YOLO images/ + labels/ folders
+  (what Ultralytics expects) with one sequential read per shard
+
+⚙️ Requirements:
+- numpy, OpenCV (cv2)
+
+Usage:
+    from shard_reader import ShardReader
+    reader = ShardReader("crop_data/shards/train")
+    key, image, class_ids, boxes = reader[0]
+    for key, image, class_ids, boxes in reader.stream(seed=epoch, shuffle_buffer=1000):
+        ...
+
+    python shard_reader.py unpack crop_data/shards/train /content/crop_data/train
+    python shard_reader.py bench crop_data/shards/train
+"""
+
+import argparse
+import json
+import mmap
+import random
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from bbox_utils import parse_yolo
+
+INDEX_DTYPE = np.dtype([
+    ("shard", "<u4"),
+    ("image_offset", "<u8"), ("image_size", "<u4"),
+    ("label_offset", "<u8"), ("label_size", "<u4"),
+])
+
+
+class ShardReader:
+    """
+    Memory-mapped random and streaming access to one packed split.
+    """
+
+    def __init__(self, split_dir, decode=True):
+        self.split_dir = Path(split_dir)
+        with open(self.split_dir / "meta.json", "r") as f:
+            self.meta = json.load(f)
+        self.index = np.load(self.split_dir / "index.npy", mmap_mode="r")
+        with open(self.split_dir / "keys.txt", "r") as f:
+            self.keys = f.read().splitlines()
+        self.names = self.meta.get("names", {})
+        self.decode = decode
+        self._maps = [None] * len(self.meta["shards"])
+
+    def __len__(self):
+        return len(self.keys)
+
+    def close(self):
+        for i, mm in enumerate(self._maps):
+            if mm is not None:
+                mm.close()
+                self._maps[i] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _map(self, shard):
+        mm = self._maps[shard]
+        if mm is None:
+            with open(self.split_dir / self.meta["shards"][shard], "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[shard] = mm
+        return mm
+
+    def raw(self, i):
+        """
+        (key, image bytes as a memoryview into the shard, label text).
+        Release the view (or drop it) before closing the reader.
+        """
+        entry = self.index[i]
+        mm = self._map(int(entry["shard"]))
+        start, size = int(entry["image_offset"]), int(entry["image_size"])
+        image = memoryview(mm)[start:start + size]
+        start, size = int(entry["label_offset"]), int(entry["label_size"])
+        label = mm[start:start + size].decode()
+        return self.keys[i], image, label
+
+    def sample(self, i):
+        """
+        (key, BGR image or encoded bytes if decode=False, class_ids, boxes).
+        """
+        key, image, label = self.raw(i)
+        class_ids, boxes = parse_yolo(label)
+        if self.decode:
+            image = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_COLOR)
+        else:
+            image = bytes(image)
+        return key, image, class_ids, boxes
+
+    __getitem__ = sample
+
+    def shard_order(self, seed=None, worker=(0, 1)):
+        """
+        Shards for this worker, shuffled per seed when a seed is given.
+        """
+        shards = list(range(len(self.meta["shards"])))
+        if seed is not None:
+            random.Random(seed).shuffle(shards)
+        rank, world = worker
+        return shards[rank::world]
+
+    def stream(self, seed=None, shuffle_buffer=0, worker=(0, 1)):
+        """
+        Yield samples shard by shard (each shard read front to back).
+        """
+        by_shard = {}
+        for i, shard in enumerate(self.index["shard"]):
+            by_shard.setdefault(int(shard), []).append(i)
+
+        rng = random.Random(seed)
+        buffer = []
+        for shard in self.shard_order(seed, worker):
+            for i in by_shard.get(shard, []):
+                if shuffle_buffer <= 1:
+                    yield self.sample(i)
+                    continue
+                buffer.append(i)
+                if len(buffer) >= shuffle_buffer:
+                    j = rng.randrange(len(buffer))
+                    buffer[j], buffer[-1] = buffer[-1], buffer[j]
+                    yield self.sample(buffer.pop())
+            # Release pages of finished shards when streaming large splits
+            if self._maps[shard] is not None and shuffle_buffer <= 1:
+                self._maps[shard].close()
+                self._maps[shard] = None
+        rng.shuffle(buffer)
+        for i in buffer:
+            yield self.sample(i)
+
+
+def unpack(split_dir, out_dir):
+    """
+    Write a packed split as YOLO images/ + labels/ folders.
+    """
+    out_dir = Path(out_dir)
+    (out_dir / "images").mkdir(parents=True, exist_ok=True)
+    (out_dir / "labels").mkdir(parents=True, exist_ok=True)
+    with ShardReader(split_dir, decode=False) as reader:
+        for i in range(len(reader)):
+            key, image, label = reader.raw(i)
+            with open(out_dir / "images" / f"{key}.jpg", "wb") as f:
+                f.write(image)
+            image.release()   # the shard can only be unmapped without live views
+            with open(out_dir / "labels" / f"{key}.txt", "w") as f:
+                f.write(label)
+        return len(reader)
+
+
+def bench(split_dir, samples=2000, seed=0):
+    """
+    Random-access and streaming read throughput (encoded bytes + labels).
+    """
+    with ShardReader(split_dir, decode=False) as reader:
+        n = len(reader)
+        order = random.Random(seed).sample(range(n), min(samples, n))
+        t0 = time.perf_counter()
+        total = sum(len(reader.raw(i)[1]) for i in order)
+        random_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        count = sum(1 for _ in reader.stream(seed=seed))
+        stream_s = time.perf_counter() - t0
+    print(f"🎯 Random access: {len(order)} samples in {random_s:.3f}s "
+          f"({len(order) / random_s:.0f} samples/s, {total / random_s / 1e6:.1f} MB/s)")
+    print(f"🌊 Streaming:     {count} samples in {stream_s:.3f}s ({count / stream_s:.0f} samples/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read packed dataset shards")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("unpack", help="Write a split back out as YOLO folders")
+    p.add_argument("split_dir", type=Path)
+    p.add_argument("out_dir", type=Path)
+    p = sub.add_parser("bench", help="Measure read throughput")
+    p.add_argument("split_dir", type=Path)
+    p.add_argument("--samples", type=int, default=2000)
+    args = parser.parse_args()
+
+    if args.command == "unpack":
+        t0 = time.perf_counter()
+        n = unpack(args.split_dir, args.out_dir)
+        print(f"✅ Unpacked {n} samples to {args.out_dir} in {time.perf_counter() - t0:.1f}s")
+    else:
+        bench(args.split_dir, args.samples)
+
+
+if __name__ == "__main__":
+    main()
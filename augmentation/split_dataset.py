@@ -9,14 +9,35 @@ WHAT THE SCRIPT DOES:
 --------------------------------
 1. Reads all image/label pairs from `crop_data/final_datasets/`.
 2. Ensures only valid pairs are used (skips any image without a label).
-3. Randomly splits the dataset into train/valid/test subsets according to ratios.
-4. Copies images and labels into:
+3. Splits the dataset into train/valid/test subsets according to ratios
+   (see stratified_split.py):
+   - every image stays in the same split as its augmented copies
+     (`{base}_aug_NNN`), so no near-duplicate leaks into valid/test
+   - photos tied together by synthesize.py (a crop source and the field
+     photos its objects were pasted onto, `augmented/synth_groups.json`)
+     share one split as well
+   - groups are stratified on their per-class box counts, so each split
+     gets its share of every class, rare ones included
+   - deterministic for a given `--seed`
+4. Places images and labels into:
    - crop_data/splits/train/
    - crop_data/splits/valid/
    - crop_data/splits/test/
+   using `--link-mode` (hardlink by default, falling back to reflink and then
+   to a plain copy; see materialize.py). Files left over from a previous run
+   that are no longer in a split are removed, so a rerun never leaves a
+   sample in two splits.
+   With `--file-lists` nothing is placed at all: the split is written as
+   `train.txt`, `val.txt` and `test.txt` (absolute image paths, one per line)
+   and data.yaml points at those lists.
 5. Generates a `data.yaml` inside `crop_data/splits/` with:
    - Dataset paths
    - Class names loaded from `classes.txt`
+6. Prints per-split class histograms (box instances and images per class)
+   and saves them to `crop_data/splits/split_report.json`.
+7. With `--profile trace.json|.csv`, times each step (listing, label index,
+   assignment, placing files, data.yaml/report) and reports files/s and
+   peak RSS (see profiler.py).
 
 --------------------------------
 HOW TO RUN:
@@ -34,6 +55,11 @@ HOW TO RUN:
 
 3. Run in terminal:
    python split_dataset.py
+   python split_dataset.py --link-mode copy   # independent copies
+   python split_dataset.py --file-lists       # no files placed at all
+   python split_dataset.py --seed 7           # a different (reproducible) split
+   python split_dataset.py --root /data/crop_data --input final_dataset
+   python split_dataset.py --profile split_profile.json
 
 4. After running, check:
    crop_data/splits/
@@ -42,19 +68,42 @@ HOW TO RUN:
    │   └── labels/
    ├── valid/
    ├── test/
-   └── data.yaml   # config file for YOLOv8
+   ├── data.yaml   # config file for YOLOv8
+   └── split_report.json   # per-split class histograms
 """
 
+import argparse
+import json
 import os
-import shutil
-import random
+import time
 from pathlib import Path
 import yaml
 
+from label_index import open_index
+from materialize import LINK_MODES, Materializer
+from profiler import Profiler, format_profile, peak_rss_mb, write_trace
+from stratified_split import assign_splits, load_links, split_histograms
+
 # --- CONFIG ---
-ROOT = Path.home() / "Desktop"
-FINAL_DATASET_DIR = ROOT / "crop_data" / "final_datasets"   # Input dataset
-SPLITS_ROOT = ROOT / "crop_data" / "splits"                # Output splits
+ROOT = Path.home() / "Desktop" / "crop_data"
+
+parser = argparse.ArgumentParser(description="Split final_datasets/ into train/valid/test")
+parser.add_argument("--root", type=Path, default=ROOT, help="crop_data folder")
+parser.add_argument("--input", default="final_datasets",
+                    help="Dataset folder under --root to split (merge writes final_dataset)")
+parser.add_argument("--link-mode", choices=LINK_MODES, default="hardlink",
+                    help="How files are placed into the split folders")
+parser.add_argument("--file-lists", action="store_true",
+                    help="Write train.txt/val.txt/test.txt instead of placing files")
+parser.add_argument("--seed", type=int, default=42, help="Seed for a reproducible split")
+parser.add_argument("--profile", type=Path, default=None,
+                    help="Write a per-step timing trace (.json or .csv) and print a summary")
+args = parser.parse_args()
+profiler = Profiler(enabled=args.profile is not None)
+started = time.perf_counter()
+
+FINAL_DATASET_DIR = args.root / args.input    # Input dataset
+SPLITS_ROOT = args.root / "splits"            # Output splits
 
 TRAIN_DIR = SPLITS_ROOT / "train"
 VALID_DIR = SPLITS_ROOT / "valid"
@@ -66,10 +115,13 @@ TRAIN_RATIO = 0.7
 VALID_RATIO = 0.2
 TEST_RATIO = 0.1
 
+placer = Materializer(args.link_mode)
+
 # --- UTILITY ---
 def copy_files(file_list, src_dir, dest_dir):
     """
-    Copies a list of files from source directory to destination directory.
+    Places a list of files from source directory into destination directory
+    (hardlink/reflink/symlink/copy, per --link-mode).
     Creates the destination directory if it doesn't exist.
     """
     dest_dir.mkdir(parents=True, exist_ok=True)
@@ -77,53 +129,94 @@ def copy_files(file_list, src_dir, dest_dir):
         src = src_dir / file
         dest = dest_dir / file
         if src.exists():
-            shutil.copy(src, dest)
+            placer.place(src, dest)
         else:
             print(f"⚠️ Missing file: {src}")
 
+
+def drop_stale(file_list, dest_dir):
+    """
+    Removes files in dest_dir that are not in file_list, i.e. samples that
+    left this split (or final_dataset) since the last run.
+    Returns the number of files removed.
+    """
+    keep = set(file_list)
+    removed = 0
+    for file in dest_dir.iterdir():
+        if file.name not in keep:
+            file.unlink()
+            removed += 1
+    return removed
+
+
+def write_file_list(file_list, src_dir, list_path):
+    """
+    Writes absolute image paths, one per line. YOLOv8 finds each label by
+    swapping `/images/` for `/labels/` in the path.
+    """
+    with open(list_path, "w") as f:
+        for file in file_list:
+            f.write(f"{(src_dir / file).resolve()}\n")
+
 # --- PREPARE DIRECTORIES ---
-for split_dir in [TRAIN_DIR, VALID_DIR, TEST_DIR]:
-    (split_dir / "images").mkdir(parents=True, exist_ok=True)
-    (split_dir / "labels").mkdir(parents=True, exist_ok=True)
+SPLITS_ROOT.mkdir(parents=True, exist_ok=True)
+if not args.file_lists:
+    for split_dir in [TRAIN_DIR, VALID_DIR, TEST_DIR]:
+        (split_dir / "images").mkdir(parents=True, exist_ok=True)
+        (split_dir / "labels").mkdir(parents=True, exist_ok=True)
 
 # --- LOAD DATA ---
 image_dir = FINAL_DATASET_DIR / "images"
 label_dir = FINAL_DATASET_DIR / "labels"
 
-image_files = [f for f in os.listdir(image_dir) if f.endswith(".jpg")]
-label_files = [f for f in os.listdir(label_dir) if f.endswith(".txt")]
+with profiler.stage("list"):
+    image_files = {f[:-4] for f in os.listdir(image_dir) if f.endswith(".jpg")}
 
 # --- FILTER VALID IMAGE/LABEL PAIRS ---
-valid_image_files = []
-for f in image_files:
-    label = f.replace(".jpg", ".txt")
-    if (label_dir / label).exists():
-        valid_image_files.append(f)
-    else:
-        print(f"⚠️ No label for: {f}")
-
-# --- SPLIT INTO TRAIN/VALID/TEST ---
-random.shuffle(valid_image_files)
-
-train_count = int(len(valid_image_files) * TRAIN_RATIO)
-valid_count = int(len(valid_image_files) * VALID_RATIO)
-test_count = len(valid_image_files) - train_count - valid_count  # remainder
-
-train_files = valid_image_files[:train_count]
-valid_files = valid_image_files[train_count:train_count + valid_count]
-test_files = valid_image_files[train_count + valid_count:]
-
-# --- COPY FILES TO SPLITS ---
-for files, split in [
-    (train_files, TRAIN_DIR),
-    (valid_files, VALID_DIR),
-    (test_files, TEST_DIR),
-]:
-    print(f"📦 Copying {len(files)} samples to {split}")
-    # Copy images
-    copy_files(files, image_dir, split / "images")
-    # Copy corresponding labels
-    copy_files([f.replace(".jpg", ".txt") for f in files], label_dir, split / "labels")
+with profiler.stage("label_index"), open_index(label_dir) as index:
+    class_counts_of = {base: counts for base, counts in index.file_class_counts()
+                       if base in image_files}
+for base in sorted(image_files - class_counts_of.keys()):
+    print(f"⚠️ No label for: {base}.jpg")
+
+# --- SPLIT INTO TRAIN/VALID/TEST (grouped + stratified) ---
+with profiler.stage("assign"):
+    assignment = assign_splits(class_counts_of.items(),
+                               {"train": TRAIN_RATIO, "valid": VALID_RATIO, "test": TEST_RATIO},
+                               seed=args.seed, links=load_links(args.root))
+
+train_files = [f"{base}.jpg" for base in assignment["train"]]
+valid_files = [f"{base}.jpg" for base in assignment["valid"]]
+test_files = [f"{base}.jpg" for base in assignment["test"]]
+
+# --- PLACE FILES INTO SPLITS (or just list them) ---
+if args.file_lists:
+    for files, list_name in [
+        (train_files, "train.txt"),
+        (valid_files, "val.txt"),
+        (test_files, "test.txt"),
+    ]:
+        print(f"📝 Listing {len(files)} samples in {SPLITS_ROOT / list_name}")
+        with profiler.stage("write_lists"):
+            write_file_list(files, image_dir, SPLITS_ROOT / list_name)
+else:
+    for files, split in [
+        (train_files, TRAIN_DIR),
+        (valid_files, VALID_DIR),
+        (test_files, TEST_DIR),
+    ]:
+        print(f"📦 Placing {len(files)} samples in {split}")
+        with profiler.stage("place"):
+            # Place images
+            copy_files(files, image_dir, split / "images")
+            # Place corresponding labels
+            labels = [f.replace(".jpg", ".txt") for f in files]
+            copy_files(labels, label_dir, split / "labels")
+            # Drop samples that left this split since the last run
+            removed = drop_stale(files, split / "images") + drop_stale(labels, split / "labels")
+            if removed:
+                print(f"🧹 Removed {removed} stale files from {split}")
+    print(placer.summary())
 
 # --- WRITE data.yaml FOR YOLOv8 ---
 with open(CLASSES_FILE, 'r') as f:
@@ -131,9 +224,9 @@ with open(CLASSES_FILE, 'r') as f:
 
 yaml_data = {
     "path": str(SPLITS_ROOT),
-    "train": "train/images",
-    "val": "valid/images",
-    "test": "test/images",  # Optional, YOLOv8 supports test split
+    "train": "train.txt" if args.file_lists else "train/images",
+    "val": "val.txt" if args.file_lists else "valid/images",
+    "test": "test.txt" if args.file_lists else "test/images",  # Optional, YOLOv8 supports test split
     "names": {i: name for i, name in enumerate(class_list)}
 }
 
@@ -141,4 +234,27 @@ yaml_path = SPLITS_ROOT / "data.yaml"
 with open(yaml_path, 'w') as f:
     yaml.dump(yaml_data, f, default_flow_style=False)
 
+# --- PER-SPLIT CLASS HISTOGRAMS ---
+with profiler.stage("histograms"):
+    histograms = split_histograms(assignment, class_counts_of)
+print("\n📊 Box instances per class (train / valid / test):")
+for class_id, name in enumerate(class_list):
+    counts = [histograms[split]["instances"].get(class_id, 0) for split in ("train", "valid", "test")]
+    total = sum(counts) or 1
+    print(f"{class_id}: {name} → " + " / ".join(f"{n} ({n / total:.0%})" for n in counts))
+
+report_path = SPLITS_ROOT / "split_report.json"
+with open(report_path, "w") as f:
+    json.dump({"seed": args.seed, "class_names": class_list, "splits": histograms}, f, indent=2)
+
 print(f"\n✅ All done. data.yaml saved to:\n{yaml_path}")
+print(f"📄 Split histograms saved to {report_path}")
+
+if profiler.enabled:
+    elapsed = time.perf_counter() - started
+    samples = len(class_counts_of)
+    run = {"script": "split_dataset", "samples": samples, "wall_seconds": round(elapsed, 3),
+           "samples_per_second": round(samples / elapsed, 2) if elapsed else None,
+           "peak_rss_mb": round(peak_rss_mb(), 1)}
+    print(format_profile(profiler.stats(), samples, elapsed, peak_rss_mb()))
+    print(f"📝 Profile trace → {write_trace(args.profile, profiler.stats(), run)}")
@@ -0,0 +1,150 @@
+"""
+stratified_split.py
+---------------------------------
+Group-aware, multi-label stratified train/valid/test assignment for
+split_dataset.py.
+
+A plain shuffle lets `leaf_001_aug_017` land in valid while `leaf_001` sits in
+train, so evaluation runs on near-duplicates of training images. Here every
+image is grouped with its augmented copies (`{base}_aug_NNN`, also chained
+ones) and whole groups are assigned to one split. `links` ties further
+photos together: synthesize.py pastes objects onto other field photos, so
+each of its background cells (the crop sources + the photos pasted onto)
+must land in one split as a whole.
+
+Groups are stratified on their box counts per class, so every split gets its
+share of every class, including rare ones (iterative stratification):
+
+1. Each class gets a target per split: ratio × its total instances.
+2. Groups are sorted once — rarest class first, then larger groups first,
+   then a seeded random key — O(G log G).
+3. Each group goes to the split that still needs most of the group's rarest
+   class; ties go to the split furthest below its file quota.
+
+Deterministic for a given seed. Total cost O(N log N) for N files.
+
+Usage:
+    from stratified_split import assign_splits, load_links
+    assignment = assign_splits(file_counts, {"train": 0.7, "valid": 0.2, "test": 0.1}, seed=42)
+    assignment = assign_splits(file_counts, ratios, links=load_links(root))   # with synthesized samples
+"""
+
+import json
+import random
+from collections import Counter
+from pathlib import Path
+
+
+def group_of(base):
+    """`leaf_001_aug_017` (or `leaf_001_aug_017_aug_002`) → `leaf_001`."""
+    return base.split("_aug_")[0]
+
+
+def link_groups(links):
+    """
+    {group: representative} merging every list of `links` (bases of photos
+    that must share a split) with union-find; groups not in any list map to
+    themselves.
+    """
+    parent = {}
+
+    def find(g):
+        while parent.get(g, g) != g:
+            parent[g] = parent.get(parent[g], parent[g])
+            g = parent[g]
+        return g
+
+    for photos in links:
+        roots = sorted({find(group_of(base)) for base in photos})
+        for other in roots[1:]:
+            parent[other] = roots[0]
+    return {g: find(g) for g in parent}
+
+
+def load_links(root):
+    """
+    Photo lists that must share a split, from synthesize.py's
+    `augmented/synth_groups.json` ({class_id: [[base, ...], ...]}); [] if absent.
+    """
+    path = Path(root) / "augmented" / "synth_groups.json"
+    if not path.exists():
+        return []
+    with open(path) as f:
+        return [cell for cells in json.load(f).values() for cell in cells]
+
+
+def build_groups(file_counts, links=()):
+    """
+    {group: (bases, Counter class → instances)} from (base, {class_id: n}) pairs.
+    Groups joined by `links` (see `link_groups`) become one group.
+    """
+    merged = link_groups(links)
+    groups = {}
+    for base, counts in file_counts:
+        group = group_of(base)
+        bases, total = groups.setdefault(merged.get(group, group), ([], Counter()))
+        bases.append(base)
+        total.update(counts)
+    return groups
+
+
+def assign_splits(file_counts, ratios, seed=42, links=()):
+    """
+    Assign every file to a split. `ratios` maps split name → fraction
+    (summing to 1); `links` are lists of photos that must share a split.
+    Returns {split: [base, ...]} with sorted base lists.
+    """
+    groups = build_groups(file_counts, links)
+    names = list(ratios)
+
+    class_totals = Counter()
+    for _, counts in groups.values():
+        class_totals.update(counts)
+    n_files = sum(len(bases) for bases, _ in groups.values())
+
+    wanted = {s: {c: ratios[s] * n for c, n in class_totals.items()} for s in names}
+    wanted_files = {s: ratios[s] * n_files for s in names}
+
+    rng = random.Random(seed)
+    order = []
+    for group in sorted(groups):
+        bases, counts = groups[group]
+        rarest = min(counts, key=lambda c: (class_totals[c], c)) if counts else None
+        rarity = class_totals[rarest] if counts else float("inf")
+        order.append((rarity, -len(bases), rng.random(), group, rarest))
+    order.sort()
+
+    assignment = {s: [] for s in names}
+    for _, _, _, group, rarest in order:
+        bases, counts = groups[group]
+        split = max(names, key=lambda s: (wanted[s][rarest] if rarest is not None else 0,
+                                          wanted_files[s]))
+        assignment[split].extend(bases)
+        wanted_files[split] -= len(bases)
+        for class_id, n in counts.items():
+            wanted[split][class_id] -= n
+
+    for bases in assignment.values():
+        bases.sort()
+    return assignment
+
+
+def split_histograms(assignment, class_counts_of):
+    """
+    {split: {"files", "instances": {class: n}, "images": {class: n}}} for a
+    finished assignment; `class_counts_of[base]` is {class_id: instances}.
+    """
+    report = {}
+    for split, bases in assignment.items():
+        instances, images = Counter(), Counter()
+        for base in bases:
+            counts = class_counts_of[base]
+            instances.update(counts)
+            images.update(counts.keys())
+        report[split] = {
+            "files": len(bases),
+            "groups": len({group_of(base) for base in bases}),
+            "instances": dict(sorted(instances.items())),
+            "images": dict(sorted(images.items())),
+        }
+    return report
@@ -0,0 +1,401 @@
+"""
+synthesize.py
+---------------------------------
+Mosaic / copy-paste synthesis of rare-class samples from the crop bank.
+
+For classes with very few source images (a dozen photos needing hundreds of
+samples), augment_with_albumentations.py can only re-run the same photos
+through Albumentations, which yields near-duplicates. This script pastes
+the objects of such a class (cut out once by crop_bank.py) into other field
+photos instead, so every sample has a new background:
+
+1. Background: one image of the crop source's background cell (below)
+   resized to `--size` (longer side), or with probability `--mosaic` a 2×2
+   mosaic of four of them. Their own boxes are kept, so every object in the
+   sample stays labeled.
+2. Paste 1..N crops of the class (`--pastes`) at a realistic scale (the
+   crop's size relative to its source image, jittered), randomly flipped,
+   where they cover no more than `MAX_OVERLAP` of an existing box (and vice
+   versa). Edges are feathered into the background instead of leaving a
+   hard rectangle.
+3. YOLO labels = background boxes + pasted boxes.
+
+📌 Details:
+- Crops are read straight from the memory-mapped bank; backgrounds are
+  decoded once per worker (ImageCache). JPEG encoding and writes run on the
+  background writer (sample_writer.py). Thousands of samples per minute on
+  one CPU core; `--workers` scales it out.
+- Background cells: the photos are shuffled (per `--seed`) into disjoint
+  cells of `--cell-size`. All pastes of one sample come from one source
+  image, its backgrounds only from that source's cell, and the output is
+  named `{source}_aug_syn{class}_{n}`. The cells used are written to
+  `augmented/synth_groups.json`; stratified_split.py puts each cell (with
+  the augmented copies and samples of its photos) into one split, so no
+  background photo or pasted object of a train sample sits in valid/test.
+- Deterministic: each chunk of samples has a seed derived from
+  (seed, class, start), like augment_with_albumentations.py.
+- Outputs go to `augmented/` (merged by merge_augmented_with_original.py)
+  and are listed in `augmented/synth_outputs.json`; a rerun for a class
+  replaces its previous samples.
+
+⚙️ Requirements:
+- Python 3.8+
+- OpenCV (cv2), NumPy
+- A crop bank: `python crop_bank.py --classes 6,27`
+
+💡 The count per class defaults to the deficit to `--target-count` images
+(from the label index). Leave these classes out of the augmentation plan,
+or lower their count, so they are not topped up twice.
+
+Usage:
+    python synthesize.py --root ~/Desktop/crop_data --classes 6,27
+    python synthesize.py --classes 27 --count 2000 --workers 8 --mosaic 0.7 --pastes 1,4 --cell-size 32
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+from multiprocessing import Pool
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from bbox_utils import clip_voc, format_yolo, voc_to_yolo, yolo_to_voc
+from crop_bank import BANK_NAME, CropBank
+from dedup_images import load_dropped
+from image_cache import ImageCache
+from label_index import open_index
+from sample_writer import SampleWriter, format_writer_stats, merge_writer_stats, remove_temp_files
+
+# --- CONFIG ---
+ROOT = Path.home() / "Desktop" / "crop_data"
+TARGET_COUNT = 500        # Images per class, as in prepare_augmentation_list.py
+OUT_SIZE = 640            # Longer side of a sample (training.py: imgsz=640)
+MOSAIC_P = 0.5            # Share of samples on a 2×2 mosaic background
+PASTES = (1, 3)           # Crops pasted per sample (min, max)
+SCALE_JITTER = (0.7, 1.3)  # Random factor on the realistic paste size
+MAX_OVERLAP = 0.2         # Max share of an existing / pasted box that may be covered
+PLACE_TRIES = 10          # Random positions tried per paste
+MIN_PASTE = 12            # Smallest pasted box side (px)
+CELL_SIZE = 16            # Photos per background cell (kept in one split)
+CHUNK_SIZE = 200          # Samples per worker job (part of the seed → keep fixed)
+SEED = 42
+CACHE_BYTES = 512 << 20   # Decoded backgrounds per worker
+MANIFEST = "synth_outputs.json"   # {class_id: [output base, ...]} under augmented/
+GROUPS = "synth_groups.json"      # {class_id: [[photo base, ...] per cell]}, read by stratified_split.py
+
+
+# --- GEOMETRY ---
+def intersection(box, boxes):
+    """Intersection area of one VOC box with each of (N, 4) VOC boxes."""
+    w = np.clip(np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0]), 0, None)
+    h = np.clip(np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1]), 0, None)
+    return w * h
+
+
+def overlap_ok(region, box, boxes, max_overlap=MAX_OVERLAP):
+    """
+    True if `region` (the pasted rectangle) covers at most `max_overlap` of
+    every existing box and no existing box covers more than that of `box`.
+    """
+    if not len(boxes):
+        return True
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    own = (box[2] - box[0]) * (box[3] - box[1])
+    return bool((intersection(region, boxes) <= max_overlap * area).all()
+                and (intersection(box, boxes) <= max_overlap * own).all())
+
+
+def feather_mask(height, width, box):
+    """
+    Float mask: 1 over the object box, fading linearly to 0 at the crop edge.
+    """
+    x1, y1, x2, y2 = box
+    xs, ys = np.arange(width) + 0.5, np.arange(height) + 0.5
+    ramp_x = np.minimum(xs / max(x1, 1), (width - xs) / max(width - x2, 1))
+    ramp_y = np.minimum(ys / max(y1, 1), (height - ys) / max(height - y2, 1))
+    mask = np.outer(np.clip(ramp_y, 0, 1), np.clip(ramp_x, 0, 1)).astype(np.float32)
+    return mask[:, :, None]
+
+
+# --- WORKER ---
+_bank = None
+_sources = []       # Bank source id → base name
+_cells = {}         # Source base → photos of its background cell
+_cache = None
+_writer = None
+_by_source = {}
+
+
+def init_worker(root, cells, writer_threads=2):
+    """
+    Per-process bank mapping, background cache and writer; OpenCV single-threaded.
+    """
+    global _bank, _sources, _cells, _cache, _writer
+    cv2.setNumThreads(1)
+    root = Path(root)
+    _bank = CropBank(root / BANK_NAME)
+    _sources = (_bank.bank_dir / "sources.txt").read_text().splitlines()
+    _cells = {base: cell for cell in cells for base in cell}
+    _cache = ImageCache(root / "images", root / "labels", CACHE_BYTES)
+    _writer = SampleWriter(root / "augmented" / "images", root / "augmented" / "labels", threads=writer_threads)
+
+
+def crops_by_source(class_id):
+    """{source id: crop ids} of one class (per worker, computed once)."""
+    if class_id not in _by_source:
+        rows = _bank.rows(class_id)
+        sources = _bank.index["source"][rows]
+        _by_source[class_id] = {int(s): rows[sources == s] for s in np.unique(sources)}
+    return _by_source[class_id]
+
+
+def load_background(base, size=None, square=None):
+    """
+    (image, class_ids, VOC boxes) resized to longer side `size` (aspect kept)
+    or to `square` × `square`; None if unreadable.
+    """
+    image, labels = _cache.get(base)
+    if image is None:
+        return None
+    h, w = image.shape[:2]
+    if square is not None:
+        width = height = square
+    else:
+        scale = size / max(h, w)
+        width, height = max(int(round(w * scale)), 1), max(int(round(h * scale)), 1)
+    class_ids, boxes = labels
+    voc = clip_voc(yolo_to_voc(boxes, w, h), w, h) * [width / w, height / h, width / w, height / h]
+    interpolation = cv2.INTER_AREA if width < w else cv2.INTER_LINEAR
+    return cv2.resize(image, (width, height), interpolation=interpolation), class_ids, voc
+
+
+def compose_background(rng, backgrounds, size, mosaic_p):
+    """
+    Single image of `backgrounds` (longer side = size) or a 2×2 mosaic of
+    size × size. Returns (canvas, class_ids, VOC boxes, paste scale) or None.
+    """
+    if rng.random() >= mosaic_p:
+        loaded = load_background(backgrounds[rng.integers(len(backgrounds))], size=size)
+        return None if loaded is None else (*loaded, 1.0)
+
+    half = size // 2
+    canvas = np.zeros((2 * half, 2 * half, 3), dtype=np.uint8)
+    all_ids, all_boxes = [], []
+    for k, base in enumerate(backgrounds[i] for i in rng.integers(len(backgrounds), size=4)):
+        loaded = load_background(base, square=half)
+        if loaded is None:
+            return None
+        image, class_ids, voc = loaded
+        x, y = (k % 2) * half, (k // 2) * half
+        canvas[y:y + half, x:x + half] = image
+        all_ids.append(class_ids)
+        all_boxes.append(voc + [x, y, x, y])
+    # Each quadrant shows its photo at half scale, so pasted objects are too
+    return canvas, np.concatenate(all_ids), np.concatenate(all_boxes), 0.5
+
+
+def paste_crop(rng, canvas, crop_id, scale, boxes):
+    """
+    Paste one bank crop onto `canvas` in place. Returns its VOC box, or None
+    if it did not fit anywhere without covering an existing box.
+    """
+    crop, box = _bank.crop(crop_id)
+    entry = _bank.index[crop_id]
+    canvas_h, canvas_w = canvas.shape[:2]
+    long_side = max(box[2] - box[0], box[3] - box[1])
+    target = float(entry["rel_size"]) * max(canvas_h, canvas_w) * scale * rng.uniform(*SCALE_JITTER)
+    factor = min(max(target, MIN_PASTE) / long_side,
+                 0.9 * canvas_w / crop.shape[1], 0.9 * canvas_h / crop.shape[0])
+    width, height = max(int(round(crop.shape[1] * factor)), 1), max(int(round(crop.shape[0] * factor)), 1)
+    if min((box[2] - box[0]) * factor, (box[3] - box[1]) * factor) < 2:
+        return None
+    resized = cv2.resize(np.asarray(crop), (width, height),
+                         interpolation=cv2.INTER_AREA if factor < 1 else cv2.INTER_LINEAR)
+    box = box * factor
+    if rng.random() < 0.5:
+        resized = resized[:, ::-1]
+        box = np.array([width - box[2], box[1], width - box[0], box[3]])
+
+    for _ in range(PLACE_TRIES):
+        x = int(rng.integers(0, canvas_w - width + 1))
+        y = int(rng.integers(0, canvas_h - height + 1))
+        placed = box + [x, y, x, y]
+        if overlap_ok((x, y, x + width, y + height), placed, boxes):
+            break
+    else:
+        return None
+
+    mask = feather_mask(height, width, box)
+    roi = canvas[y:y + height, x:x + width]
+    roi[:] = (resized * mask + roi * (1.0 - mask)).astype(np.uint8)
+    return placed
+
+
+def synthesize_chunk(job):
+    """
+    Generate samples `start..end-1` of one class. Returns (class_id, written bases, writer stats).
+    """
+    class_id, start, end, job_seed, size, mosaic_p, pastes = job
+    rng = np.random.default_rng(job_seed)
+    by_source = crops_by_source(class_id)
+    sources = sorted(by_source)
+
+    written = []
+    n = start
+    failures = 0
+    while n < end and failures < 50 * (end - start):
+        # All pastes from one source photo, backgrounds from its cell: the
+        # sample is split with that cell
+        source = sources[rng.integers(len(sources))]
+        composed = compose_background(rng, _cells[_sources[source]], size, mosaic_p)
+        if composed is None:
+            failures += 1
+            continue
+        canvas, class_ids, boxes, scale = composed
+
+        new_ids, new_boxes = [], []
+        for _ in range(int(rng.integers(pastes[0], pastes[1] + 1))):
+            crop_id = by_source[source][rng.integers(len(by_source[source]))]
+            placed = paste_crop(rng, canvas, crop_id, scale,
+                                np.concatenate([boxes.reshape(-1, 4), np.reshape(new_boxes, (-1, 4))]))
+            if placed is not None:
+                new_ids.append(class_id)
+                new_boxes.append(placed)
+        if not new_boxes:
+            failures += 1
+            continue
+
+        h, w = canvas.shape[:2]
+        all_ids = np.concatenate([class_ids, new_ids]).astype(np.int64)
+        all_boxes = clip_voc(np.concatenate([boxes.reshape(-1, 4), new_boxes]), w, h)
+        out_base = f"{_sources[source]}_aug_syn{class_id:02d}_{n:05d}"
+        _writer.submit(out_base, canvas, format_yolo(all_ids, voc_to_yolo(all_boxes, w, h)))
+        written.append(out_base)
+        n += 1
+
+    _writer.flush()
+    return class_id, written, _writer.pop_stats()
+
+
+# --- MAIN ---
+def background_cells(backgrounds, sources, cell_size=CELL_SIZE, seed=SEED):
+    """
+    Disjoint cells of `cell_size` photos (seeded shuffle of `backgrounds`).
+    Every source gets a cell; one missing from `backgrounds` is its own cell.
+    """
+    order = sorted(backgrounds)
+    random.Random(f"{seed}:cells").shuffle(order)
+    cells = [order[i:i + cell_size] for i in range(0, len(order), cell_size)]
+    cells += [[source] for source in sorted(set(sources) - set(order))]
+    return cells
+
+
+def class_deficits(root, classes, target_count):
+    """{class_id: images missing to reach target_count}."""
+    with open_index(root / "labels") as index:
+        counts = index.image_counts()
+    return {c: max(0, target_count - counts.get(c, 0)) for c in classes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy-paste / mosaic synthesis of rare classes from the crop bank")
+    parser.add_argument("--root", type=Path, default=ROOT, help="crop_data folder")
+    parser.add_argument("--classes", type=lambda s: sorted({int(c) for c in s.split(",") if c}), required=True,
+                        help="Comma-separated class IDs to synthesize")
+    parser.add_argument("--count", type=int, default=None, help="Samples per class (default: deficit to --target-count)")
+    parser.add_argument("--target-count", type=int, default=TARGET_COUNT, help="Images per class after synthesis")
+    parser.add_argument("--size", type=int, default=OUT_SIZE, help="Longer side of a sample")
+    parser.add_argument("--mosaic", type=float, default=MOSAIC_P, help="Share of 2×2 mosaic backgrounds")
+    parser.add_argument("--pastes", type=lambda s: tuple(int(v) for v in s.split(",")), default=PASTES,
+                        help="Min,max crops pasted per sample")
+    parser.add_argument("--cell-size", type=int, default=CELL_SIZE,
+                        help="Photos per background cell (each cell ends up in one split)")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes (default: 1, in-process)")
+    parser.add_argument("--seed", type=int, default=SEED, help="Base seed for all per-chunk RNGs")
+    args = parser.parse_args()
+
+    root = args.root
+    bank = CropBank(root / BANK_NAME)
+    missing = [c for c in args.classes if not len(bank.rows(c))]
+    if missing:
+        raise SystemExit(f"❌ No crops of class(es) {missing} in the bank; run crop_bank.py --classes ... first")
+
+    counts = ({c: args.count for c in args.classes} if args.count is not None
+              else class_deficits(root, args.classes, args.target_count))
+    duplicates = load_dropped(root)
+    with open_index(root / "labels") as index:
+        backgrounds = [b for b in index.bases()
+                       if "_aug_" not in b and b not in duplicates and (root / "images" / f"{b}.jpg").exists()]
+    source_names = (root / BANK_NAME / "sources.txt").read_text().splitlines()
+    cells = background_cells(backgrounds, source_names, args.cell_size, args.seed)
+    cell_of = {base: k for k, cell in enumerate(cells) for base in cell}
+
+    aug_dir = root / "augmented"
+    (aug_dir / "images").mkdir(parents=True, exist_ok=True)
+    (aug_dir / "labels").mkdir(parents=True, exist_ok=True)
+    remove_temp_files(aug_dir / "images", aug_dir / "labels")
+
+    # Replace the previous samples of these classes
+    manifest_path = aug_dir / MANIFEST
+    manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+    for class_id in args.classes:
+        for base in manifest.pop(str(class_id), []):
+            for path in (aug_dir / "images" / f"{base}.jpg", aug_dir / "labels" / f"{base}.txt"):
+                if path.exists():
+                    path.unlink()
+
+    jobs = []
+    for class_id in args.classes:
+        for start in range(0, counts[class_id], CHUNK_SIZE):
+            job_seed = random.Random(f"{args.seed}:{class_id}:{start}").getrandbits(32)
+            jobs.append((class_id, start, min(start + CHUNK_SIZE, counts[class_id]), job_seed,
+                         args.size, args.mosaic, args.pastes))
+    for class_id in args.classes:
+        print(f"🧩 Class {class_id}: {counts[class_id]} samples from {len(bank.rows(class_id))} crops "
+              f"over {len(backgrounds)} backgrounds in cells of {args.cell_size}")
+
+    start = time.perf_counter()
+    writer_stats = {}
+    if args.workers > 1:
+        with Pool(args.workers, initializer=init_worker, initargs=(str(root), cells)) as pool:
+            results = list(pool.imap_unordered(synthesize_chunk, jobs))
+    else:
+        init_worker(root, cells)
+        results = [synthesize_chunk(job) for job in jobs]
+        _writer.close()
+
+    generated = 0
+    for class_id, written, stats in results:
+        manifest.setdefault(str(class_id), []).extend(written)
+        merge_writer_stats(writer_stats, stats)
+        generated += len(written)
+    tmp = manifest_path.with_suffix(".tmp")
+    tmp.write_text(json.dumps({c: sorted(b) for c, b in sorted(manifest.items(), key=lambda i: int(i[0]))}))
+    os.replace(tmp, manifest_path)
+
+    # Cells each class drew from (source of every written sample), for stratified_split.py
+    groups_path = aug_dir / GROUPS
+    groups = json.loads(groups_path.read_text()) if groups_path.exists() else {}
+    for class_id in args.classes:
+        used = {cell_of[base.split("_aug_")[0]] for base in manifest.get(str(class_id), [])}
+        groups[str(class_id)] = [cells[k] for k in sorted(used)]
+    tmp = groups_path.with_suffix(".tmp")
+    tmp.write_text(json.dumps({c: g for c, g in sorted(groups.items(), key=lambda i: int(i[0])) if g}))
+    os.replace(tmp, groups_path)
+
+    elapsed = time.perf_counter() - start
+    short = {c: counts[c] - len(manifest.get(str(c), [])) for c in args.classes}
+    for class_id, n in short.items():
+        if n > 0:
+            print(f"⚠️ Class {class_id}: {n} samples could not be placed (crops too large for the backgrounds?)")
+    print(format_writer_stats(writer_stats))
+    print(f"\n🎉 Done. {generated} samples in {elapsed:.1f}s "
+          f"({generated / elapsed * 60 if elapsed else 0:.0f} samples/min) → {aug_dir / 'images'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+synthetic_crop_data.py
+---------------------------------
+Generates a synthetic `crop_data/` tree for benchmarking the augmentation
+pipeline without the real (private) dataset.
+
+The tree has the same layout and the same statistics that matter for speed:
+
+- `images/field_000000.jpg ...`: textured leaf-like backgrounds (smooth colour
+  noise) with one darker "lesion" ellipse per box, JPEG-encoded at `--size`
+- `labels/field_000000.txt ...`: YOLO boxes (1–3 per image), classes drawn
+  from a Zipf-like distribution so a few classes dominate and the tail needs
+  augmentation — the same imbalance the planner and augmenter see in practice
+- a few near-duplicates (`--duplicate-rate`, re-encoded and slightly shifted
+  copies of an earlier image) so dedup_images.py has something to find
+- `classes.txt` with `--classes` names
+- `synthetic.json`: the generator settings, so an identical tree is reused
+  instead of regenerated
+
+Everything is derived from `--seed` and the image index: the same settings
+give byte-identical trees on any machine. Runs offline on CPU only.
+
+⚙️ Requirements:
+- Python 3.8+
+- OpenCV (cv2), NumPy
+
+Usage:
+    python synthetic_crop_data.py --root /tmp/crop_bench/1000 --images 1000
+    python synthetic_crop_data.py --root /tmp/crop_bench/100000 --images 100000 --size 320x240 --workers 8
+"""
+
+import argparse
+import json
+import os
+import shutil
+import time
+from multiprocessing import Pool
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+# --- CONFIG ---
+NUM_CLASSES = 28          # Same as the production classes.txt
+IMAGE_SIZE = (640, 480)   # (width, height)
+ZIPF_EXPONENT = 1.1       # Larger = more skewed class frequencies
+DUPLICATE_RATE = 0.01     # Share of images that are near-duplicates of an earlier one
+JPEG_QUALITY = 90
+MARKER_NAME = "synthetic.json"
+GENERATOR_VERSION = 1     # Bump when the output of the generator changes
+
+
+def parse_size(text):
+    width, height = (int(v) for v in text.lower().split("x"))
+    return width, height
+
+
+def class_probabilities(num_classes, exponent=ZIPF_EXPONENT):
+    weights = 1.0 / np.arange(1, num_classes + 1) ** exponent
+    return weights / weights.sum()
+
+
+# --- ONE IMAGE ---
+def source_rng(index, config):
+    """
+    (generator, original index) of image `index`. A near-duplicate re-renders
+    an earlier original, following chains back to a non-duplicate.
+    """
+    rng = np.random.default_rng([config["seed"], index])
+    if rng.random() < config["duplicate_rate"] and index > 0:
+        return source_rng(int(rng.integers(0, index)), config)
+    return rng, index
+
+
+def render(index, config):
+    """
+    (jpeg bytes, label text) of image `index`; a pure function of the settings.
+    """
+    width, height = config["size"]
+    rng, source = source_rng(index, config)
+    duplicate = source != index
+
+    # Background: low-resolution colour noise, upscaled into smooth leaf texture
+    base = np.array([60, 140, 70], dtype=np.float32) + rng.normal(0, 25, 3).astype(np.float32)
+    noise = rng.normal(0, 30, (max(height // 32, 2), max(width // 32, 2), 3)).astype(np.float32)
+    image = cv2.resize(noise, (width, height), interpolation=cv2.INTER_CUBIC) + base
+    image = np.clip(image, 0, 255).astype(np.uint8)
+
+    probabilities = np.asarray(config["probabilities"])
+    num_boxes = int(rng.choice([1, 1, 1, 2, 2, 3]))
+    first = int(rng.choice(len(probabilities), p=probabilities))
+    lines = []
+    for box in range(num_boxes):
+        # Extra boxes usually repeat the class; sometimes the image is multi-class
+        class_id = first if box == 0 or rng.random() < 0.7 else int(rng.choice(len(probabilities), p=probabilities))
+        w, h = rng.uniform(0.08, 0.4, 2)
+        x = rng.uniform(w / 2, 1 - w / 2)
+        y = rng.uniform(h / 2, 1 - h / 2)
+        colour = tuple(int(v) for v in rng.integers(20, 120, 3))
+        cv2.ellipse(image, (int(x * width), int(y * height)), (int(w * width / 2), int(h * height / 2)),
+                    float(rng.uniform(0, 180)), 0, 360, colour, -1, cv2.LINE_AA)
+        lines.append(f"{class_id} {x:.6f} {y:.6f} {w:.6f} {h:.6f}")
+
+    quality = config["quality"]
+    if duplicate:
+        image = cv2.convertScaleAbs(image, alpha=1.0, beta=4)
+        quality = max(quality - 15, 50)
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError(f"Could not encode synthetic image {index}")
+    return encoded.tobytes(), "\n".join(lines) + "\n"
+
+
+def write_range(job):
+    start, end, root, config = job
+    root = Path(root)
+    for index in range(start, end):
+        data, labels = render(index, config)
+        base = f"field_{index:06d}"
+        (root / "images" / f"{base}.jpg").write_bytes(data)
+        (root / "labels" / f"{base}.txt").write_text(labels)
+    return end - start
+
+
+# --- TREE ---
+def generate(root, num_images, num_classes=NUM_CLASSES, size=IMAGE_SIZE, seed=0,
+             duplicate_rate=DUPLICATE_RATE, workers=None, force=False):
+    """
+    Write (or reuse) a synthetic crop_data tree at `root`. Returns True if it was generated.
+    """
+    root = Path(root)
+    config = {
+        "version": GENERATOR_VERSION,
+        "images": int(num_images),
+        "classes": int(num_classes),
+        "size": list(size),
+        "seed": int(seed),
+        "duplicate_rate": float(duplicate_rate),
+        "quality": JPEG_QUALITY,
+    }
+    marker = root / MARKER_NAME
+    if not force and marker.exists() and json.loads(marker.read_text()) == dict(config, complete=True):
+        return False
+
+    if root.exists():
+        if any(root.iterdir()) and not marker.exists():
+            raise RuntimeError(f"{root} is not empty and not a synthetic tree; refusing to overwrite it")
+        shutil.rmtree(root)
+    (root / "images").mkdir(parents=True)
+    (root / "labels").mkdir(parents=True)
+    marker.write_text(json.dumps(dict(config, complete=False), indent=2))
+    (root / "classes.txt").write_text("".join(f"synthetic_class_{c:02d}\n" for c in range(num_classes)))
+
+    job_config = dict(config, size=tuple(size), probabilities=class_probabilities(num_classes).tolist())
+    step = max(1, min(1000, num_images // ((workers or os.cpu_count() or 1) * 4) or 1))
+    jobs = [(start, min(start + step, num_images), str(root), job_config) for start in range(0, num_images, step)]
+    start = time.perf_counter()
+    done = 0
+    with Pool(workers) as pool:
+        for n in pool.imap_unordered(write_range, jobs):
+            done += n
+            if done % 10000 < n:
+                print(f"   {done}/{num_images} images")
+    # Marked complete last: an interrupted run is regenerated next time
+    marker.write_text(json.dumps(dict(config, complete=True), indent=2))
+    print(f"🧪 Generated {num_images} synthetic images in {time.perf_counter() - start:.1f}s → {root}")
+    return True
+
+
+def clean_outputs(root):
+    """
+    Remove everything the pipeline wrote into a synthetic tree (plan, index,
+    augmented/, final_dataset/, splits/, ...), keeping the generated inputs.
+    """
+    root = Path(root)
+    if not (root / MARKER_NAME).exists():
+        raise RuntimeError(f"{root} is not a synthetic tree; refusing to clean it")
+    keep = {"images", "labels", "classes.txt", MARKER_NAME}
+    for path in root.iterdir():
+        if path.name in keep:
+            continue
+        if path.is_dir() and not path.is_symlink():
+            shutil.rmtree(path)
+        else:
+            path.unlink()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic crop_data tree for benchmarks")
+    parser.add_argument("--root", type=Path, required=True, help="Output crop_data folder")
+    parser.add_argument("--images", type=int, default=1000, help="Number of images")
+    parser.add_argument("--classes", type=int, default=NUM_CLASSES, help="Number of classes")
+    parser.add_argument("--size", type=parse_size, default=IMAGE_SIZE, help="Image size WIDTHxHEIGHT")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated tree")
+    parser.add_argument("--duplicate-rate", type=float, default=DUPLICATE_RATE,
+                        help="Share of near-duplicate images")
+    parser.add_argument("--workers", type=int, default=None, help="Generator processes (default: all CPUs)")
+    parser.add_argument("--force", action="store_true", help="Regenerate even if the tree is up to date")
+    args = parser.parse_args()
+
+    if not generate(args.root, args.images, args.classes, args.size, args.seed, args.duplicate_rate,
+                    args.workers, args.force):
+        print(f"✅ {args.root} is up to date ({args.images} images)")
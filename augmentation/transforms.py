@@ -0,0 +1,271 @@
+"""
+transforms.py
+---------------------------------
+Shared Albumentations pipeline for the augmentation scripts.
+
+The pipeline is built by a factory instead of living at module level so that
+every worker process (or thread) can own an independent `A.Compose` instance
+with its own random state.
+
+`Augmenter` wraps the main pipeline with a pre-flight feasibility check and a
+cheap fallback pipeline, so a sample is never retried blindly:
+- Boxes with no area after clipping can never survive a transform → the
+  sample is rejected up front (the base image is broken, not unlucky).
+- Images smaller than the `RandomCrop` size would make the crop raise → they
+  go straight to the fallback pipeline.
+- If the main pipeline raises or drops a box, the same decoded image is run
+  once through the fallback pipeline (pixel-level transforms + flip only),
+  which keeps every box by construction.
+Failures are attributed to the transform that raised, or to the geometric
+transforms applied when a box was dropped, and reported as per-transform
+failure rates.
+
+Usage:
+    from transforms import Augmenter, format_failure_stats
+    augmenter = Augmenter()
+    augmenter.seed(42)
+    aug = augmenter(image, voc_boxes, class_labels)   # None → infeasible sample
+    state = augmenter.get_state()                      # checkpoint / resume
+    print(format_failure_stats(augmenter.stats()))
+"""
+
+import inspect
+import random
+from collections import Counter
+
+import numpy as np
+import albumentations as A
+
+from bbox_utils import valid_voc
+
+CROP_SIZE = 256   # RandomCrop height/width in the main pipeline
+
+
+def _compose(transforms):
+    """
+    Compose with Pascal VOC boxes; records the applied transforms when the
+    installed Albumentations supports it (used for failure attribution).
+    """
+    kwargs = {}
+    if "save_applied_params" in inspect.signature(A.Compose).parameters:
+        kwargs["save_applied_params"] = True
+    return A.Compose(transforms,
+                     bbox_params=A.BboxParams(format='pascal_voc', label_fields=['class_labels']),
+                     **kwargs)
+
+
+def build_transform():
+    """
+    Build a fresh instance of the field-realism augmentation pipeline
+    (Pascal VOC boxes, labels passed as `class_labels`).
+    """
+    return _compose([
+        # Basic transformations
+        A.HorizontalFlip(p=0.5),
+        A.RandomBrightnessContrast(p=0.3),
+        A.Rotate(limit=10, p=0.3),
+        A.RandomCrop(height=CROP_SIZE, width=CROP_SIZE, p=0.2),
+        A.GaussNoise(p=0.2),
+        A.HueSaturationValue(p=0.3),
+        A.MotionBlur(p=0.15),
+        A.Affine(scale=(0.95, 1.05), translate_percent=0.05, rotate=(-10, 10), p=0.3),
+
+        # Field realism (simulate lighting & weather)
+        A.RandomShadow(p=0.2),
+        A.RandomFog(p=0.15),
+        A.RandomSunFlare(src_radius=30, flare_roi=(0.1, 0.1, 0.9, 0.3), p=0.1),
+
+        # Background degradation
+        A.ISONoise(p=0.2),
+        A.Downscale(p=0.2),
+        A.CLAHE(p=0.2),
+    ])
+
+
+def build_fallback_transform():
+    """
+    Cheaper pipeline that cannot lose a box: a flip plus the pixel-level
+    transforms of the main pipeline (no rotate, crop or affine).
+    """
+    return _compose([
+        A.HorizontalFlip(p=0.5),
+        A.RandomBrightnessContrast(p=0.3),
+        A.GaussNoise(p=0.2),
+        A.HueSaturationValue(p=0.3),
+        A.MotionBlur(p=0.15),
+        A.RandomShadow(p=0.2),
+        A.RandomFog(p=0.15),
+        A.ISONoise(p=0.2),
+        A.CLAHE(p=0.2),
+    ])
+
+
+def seed_transform(transform, seed):
+    """
+    Seed every RNG an Albumentations pipeline may draw from. Older releases use
+    the global `random`/`numpy.random` state, newer ones keep a per-Compose
+    generator exposed through `set_random_seed`.
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    if hasattr(transform, "set_random_seed"):
+        transform.set_random_seed(seed)
+
+
+def _rng_owners(transform):
+    """
+    The Compose and every nested transform, in a fixed order. Albumentations
+    2.x gives each of them its own generator pair.
+    """
+    owners = [transform]
+    for child in getattr(transform, "transforms", []):
+        owners.extend(_rng_owners(child))
+    return owners
+
+
+def get_rng_state(transform):
+    """
+    Snapshot of every RNG a pipeline draws from (picklable).
+    """
+    return [(o.random_generator.bit_generator.state, o.py_random.getstate())
+            if hasattr(o, "random_generator") else None
+            for o in _rng_owners(transform)]
+
+
+def set_rng_state(transform, state):
+    """
+    Restore a snapshot taken by `get_rng_state` on an identically built pipeline.
+    """
+    for owner, owner_state in zip(_rng_owners(transform), state):
+        if owner_state is not None:
+            owner.random_generator.bit_generator.state = owner_state[0]
+            owner.py_random.setstate(owner_state[1])
+
+
+def failing_transform(exc):
+    """
+    Name of the innermost Albumentations transform on the traceback of `exc`.
+    """
+    name = None
+    tb = exc.__traceback__
+    while tb is not None:
+        obj = tb.tb_frame.f_locals.get("self")
+        if isinstance(obj, A.BasicTransform):
+            name = type(obj).__name__
+        tb = tb.tb_next
+    return name or type(exc).__name__
+
+
+class Augmenter:
+    """
+    Main pipeline + pre-flight checks + fallback pipeline, with failure stats.
+    """
+
+    def __init__(self):
+        self.transform = build_transform()
+        self.fallback = build_fallback_transform()
+        # Transforms that can move a box out of frame (flips never do)
+        self.geometric = {type(t).__name__ for t in self.transform.transforms
+                          if isinstance(t, A.DualTransform)
+                          and not isinstance(t, (A.HorizontalFlip, A.VerticalFlip))}
+        self.counts = Counter()    # samples, main_ok, fallback_ok, preflight_fallback, infeasible
+        self.applied = Counter()   # transform name → times applied by the main pipeline
+        self.failed = Counter()    # transform name → failures attributed to it
+
+    def seed(self, seed):
+        seed_transform(self.transform, seed)
+        if hasattr(self.fallback, "set_random_seed"):
+            self.fallback.set_random_seed(seed + 1)
+
+    def get_state(self):
+        """
+        RNG state of both pipelines and of the global RNGs (for checkpoints).
+        """
+        return {"random": random.getstate(), "numpy": np.random.get_state(),
+                "transform": get_rng_state(self.transform), "fallback": get_rng_state(self.fallback)}
+
+    def set_state(self, state):
+        random.setstate(state["random"])
+        np.random.set_state(state["numpy"])
+        set_rng_state(self.transform, state["transform"])
+        set_rng_state(self.fallback, state["fallback"])
+
+    def __call__(self, image, bboxes, class_labels):
+        """
+        Augment one sample. Returns the Albumentations result dict (every input
+        box kept) or None when the sample cannot succeed.
+        """
+        self.counts["samples"] += 1
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        if not len(bboxes) or not valid_voc(bboxes).all():
+            self.counts["infeasible"] += 1
+            return None
+
+        h, w = image.shape[:2]
+        if h >= CROP_SIZE and w >= CROP_SIZE:
+            try:
+                aug = self.transform(image=image, bboxes=bboxes, class_labels=class_labels)
+            except Exception as e:
+                name = failing_transform(e)
+                self.applied[name] += 1
+                self.failed[name] += 1
+            else:
+                names = [name for name, _ in aug.get("applied_transforms", [])]
+                self.applied.update(names)
+                if len(aug["bboxes"]) == len(bboxes):
+                    self.counts["main_ok"] += 1
+                    return aug
+                culprits = [name for name in names if name in self.geometric] or ["unknown"]
+                self.failed.update(culprits)
+        else:
+            self.counts["preflight_fallback"] += 1
+
+        aug = self.fallback(image=image, bboxes=bboxes, class_labels=class_labels)
+        if len(aug["bboxes"]) != len(bboxes):
+            self.counts["infeasible"] += 1
+            return None
+        self.counts["fallback_ok"] += 1
+        return aug
+
+    def stats(self):
+        """
+        Counters as a plain dict (picklable, so workers can report them).
+        """
+        return {"counts": dict(self.counts), "applied": dict(self.applied), "failed": dict(self.failed)}
+
+    def pop_stats(self):
+        """
+        `stats()`, then reset the counters (per-job reporting from workers).
+        """
+        stats = self.stats()
+        self.counts.clear()
+        self.applied.clear()
+        self.failed.clear()
+        return stats
+
+
+def merge_failure_stats(total, stats):
+    """
+    Add one `Augmenter.stats()` dict into an accumulator of the same shape.
+    """
+    for key in ("counts", "applied", "failed"):
+        bucket = total.setdefault(key, {})
+        for name, value in stats.get(key, {}).items():
+            bucket[name] = bucket.get(name, 0) + value
+    return total
+
+
+def format_failure_stats(stats):
+    """
+    Summary of fallbacks and per-transform failure rates.
+    """
+    counts, applied, failed = stats.get("counts", {}), stats.get("applied", {}), stats.get("failed", {})
+    lines = [f"🧪 Augmenter: {counts.get('samples', 0)} samples → "
+             f"{counts.get('main_ok', 0)} main, {counts.get('fallback_ok', 0)} fallback "
+             f"({counts.get('preflight_fallback', 0)} sent there by pre-flight), "
+             f"{counts.get('infeasible', 0)} infeasible"]
+    for name in sorted(failed, key=failed.get, reverse=True):
+        runs = applied.get(name, 0)
+        rate = f"{failed[name] / runs:.1%} of {runs} runs" if runs else "raised"
+        lines.append(f"   {name}: {failed[name]} failures ({rate})")
+    return "\n".join(lines)
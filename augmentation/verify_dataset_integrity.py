@@ -1,69 +1,325 @@
 """
-verify.py
+verify_dataset_integrity.py
 
-This script merges original and augmented crop dataset files into a single
-`final_dataset/` directory. It ensures that both images and corresponding YOLO
-label files are combined into one clean dataset for training.
+This script checks a YOLO-format crop dataset for problems **before**
+augmentation and training. It streams over every image/label pair with a
+thread pool and writes a machine-readable report.
 
 --------------------------------
-WHAT THE SCRIPT DOES:
+CHECKS PERFORMED:
 --------------------------------
-1. Creates a `final_dataset/images` and `final_dataset/labels` directory.
-2. Copies all original images (`*.jpg`) and YOLO labels (`*.txt`) into it.
-3. Copies all augmented images and labels into the same folder.
-4. Prints a success message when merging is complete.
+1. Images with no label / labels with no image (orphans).
+2. JPEG headers: SOI marker, a frame header (SOF) with non-zero size and an
+   EOI marker near the end of the file (truncated uploads; trailing camera
+   data after the EOI is allowed). Headers are parsed
+   directly; the image is never fully decoded.
+3. Label lines: exactly `<class_id> <x> <y> <w> <h>`, class IDs in range of
+   `classes.txt`, and boxes with positive size inside the [0, 1] frame.
+4. Empty label files (warning: YOLO treats them as background images).
+5. Near-duplicate images: 64-bit dHash from a 1/8-scale decode, matched with
+   a multi-index hash table (see image_hash.py). Augmented copies
+   (`{base}_aug_NNN`) are not reported against their own original.
+6. Per-class frequency: box instances and images per class.
+
+Memory stays bounded on large datasets: file names come from one `os.scandir`
+per folder (no per-file stat calls) and at most `--workers * 4` files are in
+flight at once; per-file issues are streamed to a JSONL file.
 
 --------------------------------
 HOW TO RUN:
 --------------------------------
-1. Place this script in the same environment where your dataset folders exist.
-   The expected folder structure is:
-
-   crop_data/
-   ├── images/        # original images
-   ├── labels/        # original YOLO labels
-   ├── augmented/
-   │   ├── images/    # augmented images
-   │   └── labels/    # augmented YOLO labels
-   └── final_dataset/ # (this will be created automatically)
-
-2. Open a terminal and run:
-   python verify.py
-
-3. After running, check the folder:
-   crop_data/final_dataset/
-   ├── images/  # contains both original + augmented images
-   └── labels/  # contains both original + augmented labels
+   python verify_dataset_integrity.py
+   python verify_dataset_integrity.py --root ~/Desktop/crop_data/final_dataset --workers 16
+   python verify_dataset_integrity.py --no-duplicates     # skip hashing
+
+--------------------------------
+OUTPUT:
+--------------------------------
+   crop_data/integrity_report.json   # summary: counts, examples, class stats, duplicate groups
+   crop_data/integrity_issues.jsonl  # one {"file", "issue", "detail"} object per problem
+
+Exits with status 1 if any error-level issue was found.
 """
 
-import shutil
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 
+from image_hash import MultiIndexHash, dhash, group_duplicates
+
 # === PATHS ===
 ROOT = Path.home() / "Desktop" / "crop_data"
-ORIG_IMG = ROOT / "images"
-ORIG_LBL = ROOT / "labels"
-AUG_IMG = ROOT / "augmented" / "images"
-AUG_LBL = ROOT / "augmented" / "labels"
-FINAL_IMG = ROOT / "final_dataset" / "images"
-FINAL_LBL = ROOT / "final_dataset" / "labels"
 
-# === MAKE FINAL FOLDERS ===
-FINAL_IMG.mkdir(parents=True, exist_ok=True)
-FINAL_LBL.mkdir(parents=True, exist_ok=True)
+MAX_EXAMPLES = 20        # Example files kept per issue type in the report
+BBOX_TOLERANCE = 1e-3    # Slack for boxes touching the image border
+EOI_SEARCH = 1 << 20     # Bytes searched back from the end for the EOI marker (camera trailers)
+DUP_DISTANCE = 3         # Max dHash Hamming distance for near-duplicates
+
+ERRORS = ("image_without_label", "label_without_image", "not_jpeg", "bad_jpeg_header",
+          "truncated_jpeg", "malformed_line", "class_out_of_range", "bbox_out_of_range")
+WARNINGS = ("empty_label", "near_duplicate")
+
+# JPEG start-of-frame markers (baseline, progressive, lossless, ...)
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+# === CHECKS ===
+def has_eoi(f, size, floor=2, limit=EOI_SEARCH):
+    """
+    True if an EOI marker (FF D9) is in the last `limit` bytes, after byte
+    `floor`. Usually it is in the last few bytes; files with trailers after
+    it (camera/maker data) are searched backwards in growing blocks.
+    """
+    block, end, carry = 32, size, b""
+    while end > floor and size - end < limit:
+        start = max(floor, end - block)
+        f.seek(start)
+        data = f.read(end - start) + carry
+        if b"\xff\xd9" in data:
+            return True
+        carry = data[:1]      # A marker may straddle two blocks
+        end = start
+        block = min(block * 8, 64 << 10)
+    return False
+
+
+def check_jpeg(path):
+    """
+    Walk JPEG segment headers up to the frame header, then look for the EOI
+    marker after it (an EXIF thumbnail before the frame has its own EOI).
+    Returns (width, height, issue) — issue is None for a healthy file.
+    """
+    with open(path, "rb") as f:
+        if f.read(2) != b"\xff\xd8":
+            return None, None, "not_jpeg"
+
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+
+        pos = 2
+        while pos + 4 <= size:
+            f.seek(pos)
+            segment = f.read(9)
+            if segment[0] != 0xFF:
+                return None, None, "bad_jpeg_header"
+            marker = segment[1]
+            if marker == 0xFF:                      # fill byte
+                pos += 1
+                continue
+            if marker == 0x01 or 0xD0 <= marker <= 0xD8:   # standalone markers
+                pos += 2
+                continue
+            if marker in (0xD9, 0xDA):              # EOI / start of scan before any frame
+                break
+            if marker in SOF_MARKERS:
+                if len(segment) < 9:
+                    break
+                height = int.from_bytes(segment[5:7], "big")
+                width = int.from_bytes(segment[7:9], "big")
+                if width == 0 or height == 0:
+                    break
+                if not has_eoi(f, size, floor=pos):
+                    return None, None, "truncated_jpeg"
+                return width, height, None
+            pos += 2 + int.from_bytes(segment[2:4], "big")
+    return None, None, "bad_jpeg_header"
+
+
+def check_label(path, num_classes):
+    """
+    Validate YOLO lines. Returns (class_ids, [(issue, detail), ...]).
+    """
+    class_ids = []
+    issues = []
+    with open(path, "r") as f:
+        lines = [line for line in f.read().splitlines() if line.strip()]
+    if not lines:
+        return class_ids, [("empty_label", "")]
+
+    for line_no, line in enumerate(lines, 1):
+        parts = line.split()
+        try:
+            if len(parts) != 5:
+                raise ValueError
+            class_id = int(parts[0])
+            x, y, w, h = map(float, parts[1:])
+        except ValueError:
+            issues.append(("malformed_line", f"line {line_no}: {line.strip()}"))
+            continue
+
+        if not 0 <= class_id < num_classes:
+            issues.append(("class_out_of_range", f"line {line_no}: class {class_id}"))
+        else:
+            class_ids.append(class_id)
+
+        t = BBOX_TOLERANCE
+        if (w <= 0 or h <= 0 or x - w / 2 < -t or y - h / 2 < -t
+                or x + w / 2 > 1 + t or y + h / 2 > 1 + t):
+            issues.append(("bbox_out_of_range", f"line {line_no}: {x} {y} {w} {h}"))
+    return class_ids, issues
+
+
+def check_sample(base, images_dir, labels_dir, image_names, label_names, num_classes, hash_images):
+    """
+    All per-file checks for one base name (runs on a pool thread).
+    """
+    record = {"base": base, "issues": [], "class_ids": [], "hash": None}
+    has_image = base in image_names
+    has_label = base in label_names
+
+    if has_image:
+        image_path = images_dir / f"{base}.jpg"
+        _, _, issue = check_jpeg(image_path)
+        if issue:
+            record["issues"].append((issue, image_path.name))
+        elif hash_images:
+            record["hash"] = dhash(image_path)
+        if not has_label:
+            record["issues"].append(("image_without_label", image_path.name))
+
+    if has_label:
+        class_ids, issues = check_label(labels_dir / f"{base}.txt", num_classes)
+        record["class_ids"] = class_ids
+        record["issues"].extend(issues)
+        if not has_image:
+            record["issues"].append(("label_without_image", f"{base}.txt"))
+    return record
+
+
+# === STREAMING ===
+def list_bases(folder, suffix):
+    """
+    Base names of `*{suffix}` files from a single directory read.
+    """
+    with os.scandir(folder) as entries:
+        return {entry.name[:-len(suffix)] for entry in entries if entry.name.endswith(suffix)}
+
+
+def bounded_map(executor, fn, items, max_pending):
+    """
+    Like executor.map, but never holds more than `max_pending` futures.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def original_of(base):
+    """`leaf_001_aug_017` → `leaf_001`."""
+    return base.split("_aug_")[0]
+
+
+# === MAIN ===
+def main():
+    parser = argparse.ArgumentParser(description="Verify a YOLO crop dataset")
+    parser.add_argument("--root", type=Path, default=ROOT, help="Folder with images/ and labels/")
+    parser.add_argument("--classes", type=Path, default=None, help="classes.txt (default: <root>/classes.txt)")
+    parser.add_argument("--workers", type=int, default=min(32, (os.cpu_count() or 1) * 2))
+    parser.add_argument("--report", type=Path, default=None, help="Report JSON (default: <root>/integrity_report.json)")
+    parser.add_argument("--no-duplicates", action="store_true", help="Skip near-duplicate hashing")
+    parser.add_argument("--dup-distance", type=int, default=DUP_DISTANCE)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    images_dir = args.root / "images"
+    labels_dir = args.root / "labels"
+    classes_file = args.classes or args.root / "classes.txt"
+    report_path = args.report or args.root / "integrity_report.json"
+    issues_path = report_path.with_name("integrity_issues.jsonl")
+
+    with open(classes_file, "r") as f:
+        class_names = [line.strip() for line in f if line.strip()]
+
+    image_names = list_bases(images_dir, ".jpg")
+    label_names = list_bases(labels_dir, ".txt")
+    bases = sorted(image_names | label_names)
+    print(f"🔎 Checking {len(image_names)} images and {len(label_names)} labels "
+          f"with {args.workers} threads")
+
+    issue_counts = Counter()
+    examples = {}
+    instances = Counter()
+    images_per_class = Counter()
+    hashes = MultiIndexHash(args.dup_distance)
+    dup_pairs = []
+
+    check = partial(check_sample, images_dir=images_dir, labels_dir=labels_dir,
+                    image_names=image_names, label_names=label_names,
+                    num_classes=len(class_names), hash_images=not args.no_duplicates)
+
+    with ThreadPoolExecutor(args.workers) as executor, open(issues_path, "w") as issues_file:
+        for record in bounded_map(executor, check, bases, args.workers * 4):
+            base = record["base"]
+            for issue, detail in record["issues"]:
+                issue_counts[issue] += 1
+                if len(examples.setdefault(issue, [])) < MAX_EXAMPLES:
+                    examples[issue].append(detail or base)
+                issues_file.write(json.dumps({"file": base, "issue": issue, "detail": detail}) + "\n")
+
+            instances.update(record["class_ids"])
+            images_per_class.update(set(record["class_ids"]))
+
+            h = record["hash"]
+            if h is not None:
+                for other, distance in hashes.query(h):
+                    if original_of(other) != original_of(base):
+                        dup_pairs.append((other, base))
+                        issue_counts["near_duplicate"] += 1
+                        if len(examples.setdefault("near_duplicate", [])) < MAX_EXAMPLES:
+                            examples["near_duplicate"].append(f"{other} ~ {base}")
+                        issues_file.write(json.dumps({"file": base, "issue": "near_duplicate",
+                                                      "detail": f"{other} (distance {distance})"}) + "\n")
+                hashes.add(base, h)
+
+    duplicate_groups = group_duplicates(dup_pairs)
+    errors = sum(issue_counts[k] for k in ERRORS)
+
+    report = {
+        "root": str(args.root),
+        "images": len(image_names),
+        "labels": len(label_names),
+        "pairs": len(image_names & label_names),
+        "num_classes": len(class_names),
+        "errors": errors,
+        "warnings": sum(issue_counts[k] for k in WARNINGS),
+        "issue_counts": dict(issue_counts),
+        "examples": examples,
+        "classes": {
+            class_id: {"name": name, "instances": instances[class_id], "images": images_per_class[class_id]}
+            for class_id, name in enumerate(class_names)
+        },
+        "duplicate_groups": duplicate_groups,
+        "elapsed_seconds": round(time.perf_counter() - start, 2),
+    }
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
 
-# === COPY ORIGINAL ===
-for file in ORIG_IMG.glob("*.jpg"):
-    shutil.copy(file, FINAL_IMG / file.name)
+    # --- PRINT SUMMARY ---
+    for issue in ERRORS + WARNINGS:
+        if issue_counts[issue]:
+            icon = "❌" if issue in ERRORS else "⚠️"
+            print(f"{icon} {issue}: {issue_counts[issue]} (e.g. {', '.join(examples.get(issue, [])[:3])})")
+    if duplicate_groups:
+        print(f"⚠️ {len(duplicate_groups)} near-duplicate groups (see report)")
 
-for file in ORIG_LBL.glob("*.txt"):
-    shutil.copy(file, FINAL_LBL / file.name)
+    print("\nPer-class label distribution:")
+    for class_id, name in enumerate(class_names):
+        print(f"{class_id}: {name} → {instances[class_id]} boxes in {images_per_class[class_id]} images")
 
-# === COPY AUGMENTED ===
-for file in AUG_IMG.glob("*.jpg"):
-    shutil.copy(file, FINAL_IMG / file.name)
+    status = "✅ No errors found" if errors == 0 else f"❌ {errors} errors found"
+    print(f"\n{status} in {report['elapsed_seconds']}s. Report: {report_path}")
+    return 1 if errors else 0
 
-for file in AUG_LBL.glob("*.txt"):
-    shutil.copy(file, FINAL_LBL / file.name)
 
-print("\n✅ DONE: All original + augmented data merged to /final_dataset/")
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+detection_metrics.py
+---------------------------------
+mAP50 / mAP50-95 for YOLO detections, computed the way YOLOv8 validation
+does it (10 IoU thresholds 0.50:0.95, greedy one-to-one matching, 101-point
+interpolated precision envelope integrated with the trapezoid rule as in
+ultralytics `compute_ap`, averaged over classes present in the labels), so the
+numbers can be compared with metrics/results.md.
+
+Used by quantize.py to score FP32 and INT8 variants of the model with the
+same preprocessing and NMS as the CPU inference path.
+
+Usage:
+    from detection_metrics import DetectionStats
+    stats = DetectionStats()
+    stats.add(pred_boxes, pred_scores, pred_classes, gt_boxes, gt_classes)
+    map50, map50_95 = stats.compute()
+"""
+
+import numpy as np
+
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+trapezoid = np.trapezoid if hasattr(np, "trapezoid") else np.trapz   # np.trapz before NumPy 2.0
+
+
+def box_iou(a, b):
+    """
+    Pairwise IoU between (N, 4) and (M, 4) xyxy boxes → (N, M).
+    """
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(rb - lt, 0, None).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def match_predictions(pred_classes, gt_classes, iou):
+    """
+    (N_pred, 10) bool: prediction i is a true positive at IoU threshold t.
+    Each label is matched at most once, highest IoU first.
+    """
+    correct = np.zeros((len(pred_classes), len(IOU_THRESHOLDS)), dtype=bool)
+    iou = iou * (gt_classes[:, None] == pred_classes[None, :])   # (N_gt, N_pred)
+    for t, threshold in enumerate(IOU_THRESHOLDS):
+        gt_idx, pred_idx = np.nonzero(iou >= threshold)
+        if not len(gt_idx):
+            continue
+        order = iou[gt_idx, pred_idx].argsort()[::-1]
+        gt_idx, pred_idx = gt_idx[order], pred_idx[order]
+        _, first = np.unique(pred_idx, return_index=True)
+        gt_idx, pred_idx = gt_idx[first], pred_idx[first]
+        _, first = np.unique(gt_idx, return_index=True)
+        correct[pred_idx[first], t] = True
+    return correct
+
+
+def average_precision(recall, precision):
+    """
+    AP from a recall/precision curve: the precision envelope sampled at 101
+    recall points and integrated with the trapezoid rule (ultralytics
+    `compute_ap`; a perfect curve scores 0.995 there too).
+    """
+    mrec = np.concatenate(([0.0], recall, [1.0]))
+    mpre = np.concatenate(([1.0], precision, [0.0]))
+    mpre = np.flip(np.maximum.accumulate(np.flip(mpre)))
+    points = np.linspace(0, 1, 101)
+    return float(trapezoid(np.interp(points, mrec, mpre), points))
+
+
+class DetectionStats:
+    """
+    Accumulates per-image matches, then computes mAP over the whole set.
+    """
+
+    def __init__(self):
+        self.correct, self.scores, self.pred_classes, self.gt_classes = [], [], [], []
+
+    def add(self, pred_boxes, pred_scores, pred_classes, gt_boxes, gt_classes):
+        pred_classes = np.asarray(pred_classes, dtype=np.int64)
+        gt_classes = np.asarray(gt_classes, dtype=np.int64)
+        self.gt_classes.append(gt_classes)
+        if len(pred_classes) == 0:
+            return
+        if len(gt_classes) == 0:
+            correct = np.zeros((len(pred_classes), len(IOU_THRESHOLDS)), dtype=bool)
+        else:
+            iou = box_iou(np.asarray(gt_boxes, np.float64), np.asarray(pred_boxes, np.float64))
+            correct = match_predictions(pred_classes, gt_classes, iou)
+        self.correct.append(correct)
+        self.scores.append(np.asarray(pred_scores, dtype=np.float64))
+        self.pred_classes.append(pred_classes)
+
+    def compute(self):
+        """
+        Returns (mAP50, mAP50-95).
+        """
+        gt_classes = np.concatenate(self.gt_classes) if self.gt_classes else np.zeros(0, np.int64)
+        if not len(gt_classes):
+            return 0.0, 0.0
+        if not self.correct:
+            return 0.0, 0.0
+        correct = np.concatenate(self.correct)
+        scores = np.concatenate(self.scores)
+        pred_classes = np.concatenate(self.pred_classes)
+
+        order = scores.argsort()[::-1]
+        correct, pred_classes = correct[order], pred_classes[order]
+
+        classes, n_gt = np.unique(gt_classes, return_counts=True)
+        ap = np.zeros((len(classes), len(IOU_THRESHOLDS)))
+        for i, (c, n) in enumerate(zip(classes, n_gt)):
+            hits = correct[pred_classes == c]
+            if not len(hits):
+                continue
+            tp = hits.cumsum(axis=0)
+            fp = (~hits).cumsum(axis=0)
+            recall = tp / n
+            precision = tp / (tp + fp)
+            for t in range(len(IOU_THRESHOLDS)):
+                ap[i, t] = average_precision(recall[:, t], precision[:, t])
+        return float(ap[:, 0].mean()), float(ap.mean())
@@ -0,0 +1,183 @@
+"""
+infer_onnx.py
+---------------------------------
+Batched CPU inference for the trained YOLOv8n crop disease model.
+
+training.py leaves `runs/detect/train_crops/weights/best.pt` behind; field
+deployments have no GPU. This script exports best.pt to ONNX (once) and runs
+it with ONNX Runtime on the CPU through a pipelined loop:
+
+    decode + letterbox (thread pool) → batch → infer (ONNX Runtime) → NMS
+
+Decoding of the next images overlaps with inference of the current batch.
+
+📌 Sources:
+- a directory of images (.jpg/.jpeg/.png), or a single image
+- a video file or a camera index (frames are read in order)
+- `-`: image paths read line by line from stdin (a stream)
+
+💡 Output:
+- predictions.jsonl: {"image", "detections": [{"class_id", "name", "score", "box"}]}
+  with boxes as [x_min, y_min, x_max, y_max] in original-image pixels
+- Throughput (images/s) and p50/p99 end-to-end latency per image
+
+⚙️ Requirements:
+- onnxruntime, numpy, OpenCV (cv2)
+- ultralytics (only when --model is a .pt file that still needs exporting)
+
+Usage:
+    python infer_onnx.py --model best.pt --source ~/Desktop/crop_data/splits/test/images
+    python infer_onnx.py --model best.onnx --source field_video.mp4 --batch 4
+    ls *.jpg | python infer_onnx.py --model best.onnx --source -
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from yolo_onnx import CONF_THRES, IOU_THRES, OnnxDetector, export_onnx, letterbox, postprocess, to_tensor
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png"}
+
+
+# --- SOURCES ---
+def iter_source(source):
+    """
+    Yield (name, loader) pairs; `loader()` returns a BGR image or None.
+    """
+    if source == "-":
+        for line in sys.stdin:
+            path = line.strip()
+            if path:
+                yield path, lambda p=path: cv2.imread(p)
+        return
+
+    path = Path(source)
+    if path.is_dir():
+        for file in sorted(path.iterdir()):
+            if file.suffix.lower() in IMAGE_SUFFIXES:
+                yield file.name, lambda p=file: cv2.imread(str(p))
+        return
+    if path.suffix.lower() in IMAGE_SUFFIXES:
+        yield path.name, lambda: cv2.imread(str(path))
+        return
+
+    # Video file or camera index: frames must be read in order, so they are
+    # decoded here and only letterboxed on the pool.
+    capture = cv2.VideoCapture(int(source) if source.isdigit() else str(path))
+    frame_no = 0
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        yield f"frame_{frame_no:06d}", lambda f=frame: f
+        frame_no += 1
+    capture.release()
+
+
+def load_and_letterbox(item, imgsz):
+    """
+    Pool task: decode + letterbox one image; carries its start time along.
+    """
+    name, loader, started = item
+    image = loader()
+    if image is None:
+        return name, started, None, None
+    padded, scale, pad = letterbox(image, imgsz)
+    return name, started, image.shape, (padded, scale, pad)
+
+
+def prefetch(executor, fn, items, depth):
+    """
+    Submit up to `depth` tasks ahead and yield their results in order.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= depth:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# --- MAIN ---
+def main():
+    parser = argparse.ArgumentParser(description="Batched ONNX Runtime CPU inference for YOLOv8")
+    parser.add_argument("--model", type=Path, required=True, help="best.pt (exported once) or best.onnx")
+    parser.add_argument("--source", required=True, help="Image dir, image, video, camera index or '-' for stdin paths")
+    parser.add_argument("--batch", type=int, default=8, help="Images per inference call")
+    parser.add_argument("--workers", type=int, default=min(8, os.cpu_count() or 1), help="Decode/letterbox threads")
+    parser.add_argument("--threads", type=int, default=None, help="ONNX Runtime intra-op threads (default: all cores)")
+    parser.add_argument("--imgsz", type=int, default=None,
+                        help="Export size for .pt, or the size for an .onnx without imgsz metadata "
+                             "(default: the model's own, else 640)")
+    parser.add_argument("--conf", type=float, default=CONF_THRES)
+    parser.add_argument("--iou", type=float, default=IOU_THRES)
+    parser.add_argument("--output", type=Path, default=Path("predictions.jsonl"))
+    args = parser.parse_args()
+
+    model_path = export_onnx(args.model, args.imgsz) if args.model.suffix == ".pt" else args.model
+    detector = OnnxDetector(model_path, intra_op_threads=args.threads, imgsz=args.imgsz)
+    imgsz = detector.imgsz
+    print(f"🧠 Model: {model_path} ({imgsz}px, batch {args.batch}, {args.workers} decode threads)")
+
+    latencies = []
+    infer_seconds = 0.0
+    unreadable = 0
+    start = time.perf_counter()
+
+    items = ((name, loader, time.perf_counter()) for name, loader in iter_source(args.source))
+    with ThreadPoolExecutor(args.workers) as executor, open(args.output, "w") as out:
+        prepared = prefetch(executor, lambda item: load_and_letterbox(item, imgsz), items,
+                            depth=args.batch * 2 + args.workers)
+        for batch in batched(prepared, args.batch):
+            readable = [r for r in batch if r[3] is not None]
+            unreadable += len(batch) - len(readable)
+            if not readable:
+                continue
+
+            t0 = time.perf_counter()
+            output = detector.infer(to_tensor([r[3][0] for r in readable]))
+            infer_seconds += time.perf_counter() - t0
+
+            for (name, started, shape, (_, scale, pad)), pred in zip(readable, output):
+                boxes, scores, class_ids = postprocess(pred, scale, pad, shape, args.conf, args.iou)
+                latencies.append(time.perf_counter() - started)
+                out.write(json.dumps({"image": name,
+                                      "detections": detector.to_records(boxes, scores, class_ids)}) + "\n")
+
+    elapsed = time.perf_counter() - start
+    if unreadable:
+        print(f"⚠️ Skipped {unreadable} unreadable images")
+    if not latencies:
+        print("⚠️ No images processed")
+        return
+
+    ms = np.array(latencies) * 1000
+    print(f"📈 {len(ms)} images in {elapsed:.2f}s → {len(ms) / elapsed:.1f} images/s "
+          f"(model time {infer_seconds:.2f}s)")
+    print(f"⏱️ Latency p50 {np.percentile(ms, 50):.1f} ms | p99 {np.percentile(ms, 99):.1f} ms")
+    print(f"\n✅ Predictions saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+quantize.py
+---------------------------------
+INT8 post-training quantization of the YOLOv8n crop disease model for CPU
+edge devices, with an accuracy/latency/size comparison report.
+
+metrics/results.md only reports FP32 mAP on a T4 GPU. This script takes
+best.pt (or an exported best.onnx) and produces:
+- best.onnx            FP32 reference (exported with ultralytics if needed)
+- best_int8_dynamic.onnx   weights INT8, activations quantized at run time
+- best_int8_static.onnx    weights + activations INT8 (QDQ), calibrated on a
+                           random subset of the `valid` split from split_dataset.py
+
+Every variant is scored on the valid images that were not used for
+calibration (so the static variant is not scored on its own calibration
+data), with the same preprocessing and
+NMS as the CPU inference path (see detection_metrics.py), timed at batch 1 on
+the CPU, and the comparison is written in the style of metrics/results.md.
+
+⚙️ Requirements:
+- onnxruntime (with onnxruntime.quantization), numpy, OpenCV (cv2), PyYAML
+- ultralytics (only to export best.pt → best.onnx)
+
+Usage:
+    python quantize.py --model best.pt --data ~/Desktop/crop_data/splits/data.yaml
+    python quantize.py --model best.onnx --data data.yaml --calib-size 300 --report ../metrics/quantization_results.md
+"""
+
+import argparse
+import datetime
+import os
+import platform
+import random
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import yaml
+
+from detection_metrics import DetectionStats
+from yolo_onnx import OnnxDetector, export_onnx, letterbox, to_tensor
+
+CALIB_SIZE = 200       # Calibration images sampled from the valid split (at most half of it)
+EVAL_CONF = 0.001      # YOLOv8 validation thresholds
+EVAL_IOU = 0.7
+LATENCY_RUNS = 50
+SEED = 0
+
+
+# --- DATA ---
+def split_images(data_yaml, split="val"):
+    """
+    Image paths of a split in data.yaml (a folder or a .txt file list).
+    """
+    with open(data_yaml, "r") as f:
+        data = yaml.safe_load(f)
+    root = Path(data.get("path") or Path(data_yaml).parent)
+    entry = Path(data[split])
+    entry = entry if entry.is_absolute() else root / entry
+    if entry.suffix == ".txt":
+        with open(entry, "r") as f:
+            return [Path(line.strip()) for line in f if line.strip()]
+    return sorted(p for p in entry.iterdir() if p.suffix.lower() in {".jpg", ".jpeg", ".png"})
+
+
+def label_path_for(image_path):
+    """
+    YOLOv8 convention: .../images/x.jpg → .../labels/x.txt
+    """
+    parts = list(image_path.parts)
+    idx = len(parts) - 1 - parts[::-1].index("images")
+    parts[idx] = "labels"
+    return Path(*parts).with_suffix(".txt")
+
+
+def load_ground_truth(image_path, width, height):
+    """
+    (boxes xyxy in pixels, class_ids) from the YOLO label of an image.
+    """
+    label_path = label_path_for(image_path)
+    if not label_path.exists():
+        return np.zeros((0, 4)), np.zeros(0, np.int64)
+    rows = np.loadtxt(label_path, ndmin=2)
+    if not rows.size:
+        return np.zeros((0, 4)), np.zeros(0, np.int64)
+    xy = rows[:, 1:3] * (width, height)
+    wh = rows[:, 3:5] * (width, height)
+    return np.concatenate([xy - wh / 2, xy + wh / 2], axis=1), rows[:, 0].astype(np.int64)
+
+
+class LetterboxCalibrationReader:
+    """
+    onnxruntime CalibrationDataReader over letterboxed calibration images.
+    """
+
+    def __init__(self, image_paths, input_name, imgsz):
+        self.image_paths = list(image_paths)
+        self.input_name = input_name
+        self.imgsz = imgsz
+        self._iter = None
+
+    def get_next(self):
+        if self._iter is None:
+            self._iter = iter(self.image_paths)
+        for path in self._iter:
+            image = cv2.imread(str(path))
+            if image is not None:
+                return {self.input_name: to_tensor([letterbox(image, self.imgsz)[0]])}
+        return None
+
+    def rewind(self):
+        self._iter = None
+
+
+# --- QUANTIZATION ---
+def preprocess_for_quantization(fp32_path):
+    """
+    Shape inference + graph cleanup recommended before ORT quantization.
+    Falls back to the raw model if the helper is unavailable.
+    """
+    out = fp32_path.with_name(fp32_path.stem + "_prep.onnx")
+    try:
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+        quant_pre_process(str(fp32_path), str(out))
+        return out
+    except Exception as e:
+        print(f"⚠️ quant_pre_process skipped ({e}); quantizing the raw model")
+        return fp32_path
+
+
+def quantize_dynamic_int8(model_in, model_out):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(str(model_in), str(model_out), weight_type=QuantType.QInt8)
+    return model_out
+
+
+def quantize_static_int8(model_in, model_out, calib_paths, imgsz):
+    import onnxruntime as ort
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+
+    input_name = ort.InferenceSession(str(model_in), providers=["CPUExecutionProvider"]).get_inputs()[0].name
+    reader = LetterboxCalibrationReader(calib_paths, input_name, imgsz)
+    quantize_static(str(model_in), str(model_out), reader,
+                    quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                    per_channel=True, calibrate_method=CalibrationMethod.MinMax)
+    return model_out
+
+
+# --- EVALUATION ---
+def evaluate(model_path, val_paths, threads, imgsz, latency_runs=LATENCY_RUNS):
+    """
+    mAP50, mAP50-95 on `val_paths` at `imgsz`, p50 batch-1 CPU latency, size in MB.
+    """
+    detector = OnnxDetector(model_path, intra_op_threads=threads, imgsz=imgsz)
+    stats = DetectionStats()
+    for path in val_paths:
+        image = cv2.imread(str(path))
+        if image is None:
+            continue
+        (boxes, scores, classes), = detector.predict([image], conf_thres=EVAL_CONF, iou_thres=EVAL_IOU)
+        gt_boxes, gt_classes = load_ground_truth(path, image.shape[1], image.shape[0])
+        stats.add(boxes, scores, classes, gt_boxes, gt_classes)
+    map50, map50_95 = stats.compute()
+
+    # Latency: model only, batch 1, after warm-up
+    sample = cv2.imread(str(val_paths[0]))
+    tensor = to_tensor([letterbox(sample, detector.imgsz)[0]])
+    for _ in range(5):
+        detector.infer(tensor)
+    times = []
+    for _ in range(latency_runs):
+        t0 = time.perf_counter()
+        detector.infer(tensor)
+        times.append((time.perf_counter() - t0) * 1000)
+
+    return {
+        "map50": map50,
+        "map50_95": map50_95,
+        "size_mb": os.path.getsize(model_path) / 1e6,
+        "latency_ms": float(np.percentile(times, 50)),
+    }
+
+
+def write_report(report_path, results, calib_count, eval_count, threads, imgsz):
+    import onnxruntime as ort
+
+    fp32 = results["FP32"]
+    lines = [
+        "RESULTS: YOLOv8n INT8 Post-Training Quantization (CPU)",
+        "------------------------------------------------------",
+        "",
+        "Experiment: quantize_best",
+        f"Date: {datetime.date.today().isoformat()}",
+        "",
+        "Environment:",
+        f"- CPU: {platform.processor() or platform.machine()} ({threads} threads)",
+        f"- onnxruntime v{ort.__version__}",
+        f"- Python {platform.python_version()}",
+        "",
+        "Quantization Parameters:",
+        f"- Calibration: {calib_count} images sampled from the valid split (seed {SEED})",
+        "- Static: QDQ format, per-channel INT8 weights, UINT8 activations, MinMax calibration",
+        "- Dynamic: INT8 weights, activations quantized at run time",
+        f"- Evaluation: {eval_count} valid images not used for calibration, imgsz {imgsz}, "
+        f"conf {EVAL_CONF}, NMS IoU {EVAL_IOU}",
+        "",
+        "Final Metrics (held-out validation images, CPU, batch 1):",
+    ]
+    for name, r in results.items():
+        speedup = fp32["latency_ms"] / r["latency_ms"] if r["latency_ms"] else 0
+        lines.append(f"- {name + ':':<13} mAP50 {r['map50']:.3f} | mAP50-95 {r['map50_95']:.3f} | "
+                     f"{r['size_mb']:.1f} MB | {r['latency_ms']:.1f} ms ({speedup:.2f}x)")
+    lines += ["", "Observations:"]
+    for name, r in results.items():
+        if name == "FP32":
+            continue
+        lines.append(f"- {name}: mAP50 {r['map50'] - fp32['map50']:+.3f}, "
+                     f"mAP50-95 {r['map50_95'] - fp32['map50_95']:+.3f}, "
+                     f"{r['size_mb'] / fp32['size_mb']:.0%} of FP32 size.")
+
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(report_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+# --- MAIN ---
+def main():
+    parser = argparse.ArgumentParser(description="INT8 post-training quantization + comparison report")
+    parser.add_argument("--model", type=Path, required=True, help="best.pt or best.onnx")
+    parser.add_argument("--data", type=Path, required=True, help="data.yaml written by split_dataset.py")
+    parser.add_argument("--calib-size", type=int, default=CALIB_SIZE)
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1, help="ONNX Runtime threads for timing")
+    parser.add_argument("--imgsz", type=int, default=None,
+                        help="Size for a model without imgsz metadata (default: the model's own, else 640)")
+    parser.add_argument("--report", type=Path,
+                        default=Path(__file__).resolve().parent.parent / "metrics" / "quantization_results.md")
+    args = parser.parse_args()
+
+    fp32_path = export_onnx(args.model, args.imgsz) if args.model.suffix == ".pt" else args.model
+    # Calibrate and evaluate at the resolution the model runs at
+    imgsz = OnnxDetector(fp32_path, intra_op_threads=1, imgsz=args.imgsz).imgsz
+    val_paths = split_images(args.data, "val")
+    # Calibration images are held out of the evaluation
+    calib_paths = random.Random(SEED).sample(val_paths, min(args.calib_size, len(val_paths) // 2))
+    calib_set = set(calib_paths)
+    eval_paths = [p for p in val_paths if p not in calib_set]
+    print(f"🧮 {len(val_paths)} valid images: {len(calib_paths)} for calibration, "
+          f"{len(eval_paths)} for evaluation, imgsz {imgsz}")
+
+    prepared = preprocess_for_quantization(fp32_path)
+    variants = {
+        "FP32": fp32_path,
+        "INT8 dynamic": quantize_dynamic_int8(prepared, fp32_path.with_name(fp32_path.stem + "_int8_dynamic.onnx")),
+        "INT8 static": quantize_static_int8(prepared, fp32_path.with_name(fp32_path.stem + "_int8_static.onnx"),
+                                            calib_paths, imgsz),
+    }
+
+    results = {}
+    for name, path in variants.items():
+        print(f"📏 Evaluating {name} ({path.name})")
+        results[name] = evaluate(path, eval_paths, args.threads, imgsz)
+        r = results[name]
+        print(f"   mAP50 {r['map50']:.3f} | mAP50-95 {r['map50_95']:.3f} | "
+              f"{r['size_mb']:.1f} MB | {r['latency_ms']:.1f} ms")
+
+    write_report(args.report, results, len(calib_paths), len(eval_paths), args.threads, imgsz)
+    print(f"\n✅ Report saved to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+serve.py
+---------------------------------
+Asyncio HTTP prediction service for the crop disease detector, with dynamic
+micro-batching on the CPU.
+
+Mobile clients POST one image per request. Requests are decoded and
+letterboxed on a thread pool, then queued; a single batcher task groups
+queued images into micro-batches (up to `--max-batch` images, or whatever has
+arrived `--max-wait-ms` after the first one) and runs them through ONNX
+Runtime together. Every request holds a future that resolves with its own
+detections.
+
+Standard library HTTP on top of asyncio — no web framework and no external
+services, only a local model file.
+
+📌 Endpoints:
+- POST /predict   body: raw JPEG/PNG bytes → {"detections": [...], "latency_ms"}
+- GET  /metrics   queue depth, batch-size histogram, latency percentiles
+- GET  /health    {"status": "ok"}
+
+⚙️ Requirements:
+- onnxruntime, numpy, OpenCV (cv2)
+
+Usage:
+    python serve.py --model best.onnx --port 8000 --max-batch 8 --max-wait-ms 10
+    curl --data-binary @leaf.jpg -H "Content-Type: image/jpeg" localhost:8000/predict
+    curl localhost:8000/metrics
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from yolo_onnx import CONF_THRES, IMGSZ, IOU_THRES, OnnxDetector, export_onnx, letterbox, postprocess, to_tensor
+
+MAX_BODY_BYTES = 20 * 1024 * 1024   # Largest accepted upload
+MAX_QUEUE = 256                     # Queued images before answering 503
+LATENCY_WINDOW = 10_000             # Latencies kept for percentiles
+
+
+class MicroBatcher:
+    """
+    Groups queued images into batches bounded by size and wait time.
+    """
+
+    def __init__(self, detector, max_batch=8, max_wait_ms=10, conf=CONF_THRES, iou=IOU_THRES):
+        self.detector = detector
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.conf = conf
+        self.iou = iou
+        self.queue = asyncio.Queue(MAX_QUEUE)
+        self.model_executor = ThreadPoolExecutor(1)   # one model run at a time
+
+        self.batch_sizes = Counter()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.errors = 0
+
+    async def submit(self, prepared, shape):
+        """
+        Queue one letterboxed image; resolves to its detections.
+        Raises asyncio.QueueFull when the service is saturated.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((prepared, shape, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            self.batch_sizes[len(batch)] += 1
+            try:
+                results = await loop.run_in_executor(self.model_executor, self._predict, batch)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, _, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def _predict(self, batch):
+        """
+        Model + NMS for one micro-batch (runs on the model thread).
+        """
+        output = self.detector.infer(to_tensor([prepared[0] for prepared, _, _ in batch]))
+        results = []
+        for ((_, scale, pad), shape, _), pred in zip(batch, output):
+            boxes, scores, class_ids = postprocess(pred, scale, pad, shape, self.conf, self.iou)
+            results.append(self.detector.to_records(boxes, scores, class_ids))
+        return results
+
+    def metrics(self):
+        ms = np.array(self.latencies) * 1000
+        percentiles = ({f"p{p}": round(float(np.percentile(ms, p)), 2) for p in (50, 90, 99)}
+                       if len(ms) else {})
+        return {
+            "queue_depth": self.queue.qsize(),
+            "requests": self.requests,
+            "errors": self.errors,
+            "batches": sum(self.batch_sizes.values()),
+            "batch_size_histogram": {str(k): v for k, v in sorted(self.batch_sizes.items())},
+            "latency_ms": percentiles,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+
+class PredictionServer:
+    """
+    Minimal HTTP/1.1 server (keep-alive, Content-Length bodies).
+    """
+
+    def __init__(self, batcher, imgsz=IMGSZ, decode_threads=None):
+        self.batcher = batcher
+        self.imgsz = imgsz
+        self.decode_executor = ThreadPoolExecutor(decode_threads or min(8, os.cpu_count() or 1))
+
+    def _decode(self, body):
+        image = cv2.imdecode(np.frombuffer(body, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            return None, None
+        return letterbox(image, self.imgsz), image.shape
+
+    async def predict(self, body):
+        started = time.perf_counter()
+        self.batcher.requests += 1
+        loop = asyncio.get_running_loop()
+        prepared, shape = await loop.run_in_executor(self.decode_executor, self._decode, body)
+        if prepared is None:
+            self.batcher.errors += 1
+            return HTTPStatus.BAD_REQUEST, {"error": "body is not a decodable image"}
+        try:
+            detections = await self.batcher.submit(prepared, shape)
+        except asyncio.QueueFull:
+            self.batcher.errors += 1
+            return HTTPStatus.SERVICE_UNAVAILABLE, {"error": "queue full, retry later"}
+        latency = time.perf_counter() - started
+        self.batcher.latencies.append(latency)
+        return HTTPStatus.OK, {"detections": detections, "latency_ms": round(latency * 1000, 2)}
+
+    async def route(self, method, path, body):
+        if method == "POST" and path == "/predict":
+            return await self.predict(body)
+        if method == "GET" and path == "/metrics":
+            return HTTPStatus.OK, self.batcher.metrics()
+        if method == "GET" and path == "/health":
+            return HTTPStatus.OK, {"status": "ok"}
+        return HTTPStatus.NOT_FOUND, {"error": f"no route for {method} {path}"}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    break
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = request_line.split(" ", 2)
+                except ValueError:
+                    break
+                headers = {}
+                for line in header_lines:
+                    if ":" in line:
+                        key, value = line.split(":", 1)
+                        headers[key.strip().lower()] = value.strip()
+
+                try:
+                    length = int(headers.get("content-length", 0) or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    status, payload = HTTPStatus.BAD_REQUEST, {"error": "invalid Content-Length"}
+                    keep_alive = False
+                elif length > MAX_BODY_BYTES:
+                    status, payload = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "image too large"}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    status, payload = await self.route(method, target.split("?", 1)[0], body)
+                    keep_alive = (headers.get("connection", "").lower() != "close"
+                                  and version == "HTTP/1.1")
+
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(args):
+    model_path = export_onnx(args.model) if args.model.suffix == ".pt" else args.model
+    detector = OnnxDetector(model_path, intra_op_threads=args.threads)
+    batcher = MicroBatcher(detector, args.max_batch, args.max_wait_ms, args.conf, args.iou)
+    server = PredictionServer(batcher, detector.imgsz, args.decode_threads)
+
+    batcher_task = asyncio.create_task(batcher.run())
+    http = await asyncio.start_server(server.handle, args.host, args.port)
+    print(f"🚀 Serving {model_path} on http://{args.host}:{args.port} "
+          f"(micro-batches of ≤{args.max_batch} images / {args.max_wait_ms} ms)")
+    try:
+        async with http:
+            await http.serve_forever()
+    finally:
+        batcher_task.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-batching HTTP prediction service (CPU, ONNX Runtime)")
+    parser.add_argument("--model", type=Path, required=True, help="best.onnx (or best.pt, exported once)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch", type=int, default=8, help="Largest micro-batch")
+    parser.add_argument("--max-wait-ms", type=float, default=10, help="Wait after the first queued image")
+    parser.add_argument("--threads", type=int, default=None, help="ONNX Runtime intra-op threads")
+    parser.add_argument("--decode-threads", type=int, default=None, help="JPEG decode/letterbox threads")
+    parser.add_argument("--conf", type=float, default=CONF_THRES)
+    parser.add_argument("--iou", type=float, default=IOU_THRES)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        print("\n👋 Stopped")
+
+
+if __name__ == "__main__":
+    main()
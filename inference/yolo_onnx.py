@@ -0,0 +1,206 @@
+"""
+yolo_onnx.py
+---------------------------------
+CPU inference helpers for the YOLOv8n crop disease model exported to ONNX.
+
+Shared by infer_onnx.py (batch CLI) and the other inference scripts, so that
+preprocessing and NMS are identical everywhere.
+
+📌 Contents:
+- `export_onnx(weights)`: best.pt → best.onnx via ultralytics (dynamic batch),
+  at the resolution the model was trained at unless `imgsz` is given.
+- `letterbox(image, size)`: resize keeping aspect ratio, pad to size×size
+  with gray (114), exactly like YOLOv8 training/validation.
+- `OnnxDetector`: ONNX Runtime session (CPU) + batched predict + NMS. Its
+  `imgsz` is the model's fixed input size, else the `imgsz` Ultralytics
+  writes into the ONNX metadata, else the `imgsz` passed in (default 640).
+- `nms(boxes, scores, iou)`: vectorized greedy NMS in NumPy.
+
+⚙️ Requirements:
+- onnxruntime, numpy, OpenCV (cv2)
+- ultralytics (only to export .pt → .onnx)
+
+Usage:
+    from yolo_onnx import OnnxDetector, letterbox
+    detector = OnnxDetector("best.onnx")
+    detections = detector.predict([cv2.imread("leaf.jpg")])
+"""
+
+import ast
+import os
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+IMGSZ = 640          # Fallback when the model does not record its resolution
+PAD_VALUE = 114      # YOLOv8 letterbox fill
+CONF_THRES = 0.25
+IOU_THRES = 0.45
+MAX_DET = 300
+
+
+def export_onnx(weights, imgsz=None, dynamic=True):
+    """
+    Export YOLOv8 weights to ONNX next to the .pt file and return its path.
+    Without `imgsz`, ultralytics exports at the training resolution stored in
+    the weights. Skips the export when an up-to-date .onnx already exists.
+    """
+    weights = Path(weights)
+    onnx_path = weights.with_suffix(".onnx")
+    if onnx_path.exists() and onnx_path.stat().st_mtime >= weights.stat().st_mtime:
+        return onnx_path
+
+    from ultralytics import YOLO
+
+    size = {} if imgsz is None else {"imgsz": imgsz}
+    exported = YOLO(str(weights)).export(format="onnx", dynamic=dynamic, simplify=True, **size)
+    return Path(exported)
+
+
+def letterbox(image, size=IMGSZ):
+    """
+    Resize `image` to fit size×size keeping its aspect ratio and pad the rest.
+    Returns (padded image, scale, (pad_x, pad_y)).
+    """
+    h, w = image.shape[:2]
+    scale = min(size / h, size / w)
+    new_w, new_h = int(round(w * scale)), int(round(h * scale))
+    if (new_w, new_h) != (w, h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+
+    pad_x, pad_y = (size - new_w) / 2, (size - new_h) / 2
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT,
+                               value=(PAD_VALUE, PAD_VALUE, PAD_VALUE))
+    return image, scale, (left, top)
+
+
+def to_tensor(images):
+    """
+    List of letterboxed BGR uint8 images → float32 NCHW RGB batch in [0, 1].
+    """
+    batch = np.stack(images)[..., ::-1].transpose(0, 3, 1, 2)
+    return np.ascontiguousarray(batch, dtype=np.float32) / 255.0
+
+
+def nms(boxes, scores, iou_thres=IOU_THRES):
+    """
+    Greedy NMS over (N, 4) xyxy boxes. Returns kept indices, best first.
+    """
+    order = scores.argsort()[::-1]
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        xx1 = np.maximum(boxes[i, 0], boxes[rest, 0])
+        yy1 = np.maximum(boxes[i, 1], boxes[rest, 1])
+        xx2 = np.minimum(boxes[i, 2], boxes[rest, 2])
+        yy2 = np.minimum(boxes[i, 3], boxes[rest, 3])
+        inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_thres]
+    return np.array(keep, dtype=np.int64)
+
+
+def postprocess(output, scale, pad, orig_shape, conf_thres=CONF_THRES, iou_thres=IOU_THRES):
+    """
+    Decode one image of YOLOv8 output (4 + num_classes, anchors) into
+    (boxes xyxy in original pixels, scores, class_ids), class-aware NMS.
+    """
+    pred = output.T                                   # (anchors, 4 + nc)
+    class_scores = pred[:, 4:]
+    class_ids = class_scores.argmax(axis=1)
+    scores = class_scores[np.arange(len(pred)), class_ids]
+    mask = scores > conf_thres
+    pred, scores, class_ids = pred[mask], scores[mask], class_ids[mask]
+    if not len(pred):
+        return np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, np.int64)
+
+    xy, wh = pred[:, :2], pred[:, 2:4]
+    boxes = np.concatenate([xy - wh / 2, xy + wh / 2], axis=1)
+
+    # Offset boxes per class so a single NMS pass never suppresses across classes
+    offsets = class_ids[:, None] * 4096.0
+    keep = nms(boxes + offsets, scores, iou_thres)[:MAX_DET]
+    boxes, scores, class_ids = boxes[keep], scores[keep], class_ids[keep]
+
+    boxes[:, [0, 2]] -= pad[0]
+    boxes[:, [1, 3]] -= pad[1]
+    boxes /= scale
+    h, w = orig_shape[:2]
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, w)
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, h)
+    return boxes, scores, class_ids
+
+
+def metadata_imgsz(meta):
+    """
+    Longer side of the `imgsz` entry Ultralytics writes into the ONNX
+    metadata (e.g. "[640, 640]"); None if absent.
+    """
+    if "imgsz" not in meta:
+        return None
+    value = ast.literal_eval(meta["imgsz"])
+    return int(max(value)) if isinstance(value, (list, tuple)) else int(value)
+
+
+class OnnxDetector:
+    """
+    ONNX Runtime CPU session for a YOLOv8 detection model.
+    """
+
+    def __init__(self, model_path, intra_op_threads=None, providers=("CPUExecutionProvider",), imgsz=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = intra_op_threads or os.cpu_count() or 1
+        self.session = ort.InferenceSession(str(model_path), options, providers=list(providers))
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch, _, height, _ = model_input.shape
+        self.fixed_batch = batch if isinstance(batch, int) else None
+
+        meta = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(meta["names"]) if "names" in meta else {}
+        # Dynamic exports have a symbolic height: use the size the model was exported at
+        self.imgsz = height if isinstance(height, int) else metadata_imgsz(meta) or imgsz or IMGSZ
+
+    def infer(self, batch):
+        """
+        Run the raw model on an NCHW float32 batch. Pads to the model's fixed
+        batch size when it was exported without a dynamic batch axis.
+        """
+        n = len(batch)
+        if self.fixed_batch and n != self.fixed_batch:
+            outputs = []
+            for start in range(0, n, self.fixed_batch):
+                chunk = batch[start:start + self.fixed_batch]
+                padded = np.zeros((self.fixed_batch,) + chunk.shape[1:], dtype=chunk.dtype)
+                padded[:len(chunk)] = chunk
+                outputs.append(self.session.run(None, {self.input_name: padded})[0][:len(chunk)])
+            return np.concatenate(outputs)
+        return self.session.run(None, {self.input_name: batch})[0]
+
+    def predict(self, images, conf_thres=CONF_THRES, iou_thres=IOU_THRES):
+        """
+        Detect on a list of BGR images. Returns one (boxes, scores, class_ids)
+        tuple per image, boxes in original-image pixels.
+        """
+        prepared = [letterbox(image, self.imgsz) for image in images]
+        output = self.infer(to_tensor([p[0] for p in prepared]))
+        return [postprocess(out, scale, pad, image.shape, conf_thres, iou_thres)
+                for out, (_, scale, pad), image in zip(output, prepared, images)]
+
+    def to_records(self, boxes, scores, class_ids):
+        """
+        JSON-friendly list of detections.
+        """
+        return [{"class_id": int(c), "name": self.names.get(int(c), str(int(c))),
+                 "score": round(float(s), 4), "box": [round(float(v), 1) for v in b]}
+                for b, s, c in zip(boxes, scores, class_ids)]
@@ -10,11 +10,19 @@ from google.colab import drive
 drive.mount('/content/drive')
 
 # copy training data from Google Drive to the Colab environment
-# Saves time by avoiding scanning directly from Google Drive during training
-!mkdir -p /content/splits
-!cp -r /content/drive/MyDrive/crop_data/train /content/splits/
-!cp -r /content/drive/MyDrive/crop_data/val /content/splits/
-!cp -r /content/drive/MyDrive/crop_data/test /content/splits/
+# The splits are packed into a few large tar shards (augmentation/pack_shards.py),
+# so Drive serves a handful of sequential reads instead of one open per JPEG/.txt
+!mkdir -p /content/shards
+!cp -r /content/drive/MyDrive/crop_data/shards/* /content/shards/
+
+# Unpack the shards into the images/ + labels/ layout Ultralytics expects
+# (shard_reader.py reads each shard through its index, one sequential pass;
+# pack_shards.py copies it next to the shards)
+from pathlib import Path
+
+for split in ["train", "val", "test"]:
+    if Path(f"/content/shards/{split}/index.npy").exists():
+        !python /content/shards/shard_reader.py unpack /content/shards/{split} /content/crop_data/{split}
 
 
 # Install the ultralytics package
@@ -46,6 +54,15 @@ with open('/content/crop_data/data.yaml', 'w') as f:
     f.write(data_yaml)
 
 
+# Training resolution from the box-size statistics of count_classes.py
+# (smallest imgsz at which no class has many boxes under 16px); 640 without them
+import json
+
+stats_path = Path('/content/drive/MyDrive/crop_data/class_stats.json')
+imgsz = json.loads(stats_path.read_text())['recommendation']['imgsz'] if stats_path.exists() else 640
+print(f'imgsz: {imgsz}')
+
+
 # Run the training script using the ultralytics package
 # This will start the training process using the specified dataset and parameters.
 from ultralytics import YOLO
@@ -57,8 +74,16 @@ model = YOLO('yolov8n.pt')
 model.train(
     data='/content/crop_data/data.yaml', 
     epochs=50, 
-    imgsz=640, 
+    imgsz=imgsz, 
     batch=16,
     workers=2,
     name='train_crops'
 )
+
+
+# Export the best weights to ONNX for CPU inference in the field
+# (see inference/infer_onnx.py for batched CPU inference on the exported model).
+# The export records imgsz in the ONNX metadata; OnnxDetector, serve.py and
+# quantize.py read it from there, so the model is served at the size it was trained at
+best = YOLO('/content/runs/detect/train_crops/weights/best.pt')
+best.export(format='onnx', imgsz=imgsz, dynamic=True, simplify=True)